@@ -0,0 +1,41 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { syncPortfolioSymbols } from '@/lib/db';
+
+/**
+ * 股票池同步 API：把用户当前的持仓/自选登记到本地数据库，供数据采集服务决定采集哪些股票
+ * POST /api/portfolio/sync  { userId, items: [{ symbol, status }] }
+ */
+export async function POST(req: NextRequest) {
+  try {
+    const body = await req.json();
+    const { userId, items } = body;
+
+    if (!userId || typeof userId !== 'string' || !Array.isArray(items)) {
+      return NextResponse.json(
+        { error: 'userId and items are required' },
+        { status: 400 }
+      );
+    }
+
+    const symbols = items
+      .filter((item: any) => item && typeof item.symbol === 'string' && item.symbol)
+      .map((item: any) => ({
+        symbol: item.symbol,
+        status: item.status === 'investing' ? 'investing' : 'watching',
+      }));
+
+    if (!syncPortfolioSymbols(userId, symbols)) {
+      return NextResponse.json(
+        { error: '数据库不可用，股票池未同步' },
+        { status: 503 }
+      );
+    }
+    return NextResponse.json({ synced: symbols.length });
+  } catch (error) {
+    console.error('portfolio sync error', error);
+    return NextResponse.json(
+      { error: 'Failed to sync portfolio' },
+      { status: 500 }
+    );
+  }
+}
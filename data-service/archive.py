@@ -0,0 +1,292 @@
+"""
+日线历史列式归档
+收盘且过了修正期的交易日定期从 SQLite 导出为 Parquet，按年份与股票桶分区：
+
+    {dir}/{table}/year=2024/bucket=07.parquet
+
+分析读取（read / read_columns）以内存映射方式打开分区文件，直接返回 pandas DataFrame
+或 NumPy 列，并拼接 SQLite 中的行（同一键以 SQLite 为准）；SQLite 只保留近期仍可能变动的窗口。
+
+    python archive.py            # 导出全部表
+    python archive.py stock_daily
+
+依赖 pyarrow（可选，未安装时归档任务跳过）
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from config import CONFIG
+from database import (
+    TABLE_SPECS, date_to_int, get_market_years, get_market_rows, prune_market_rows,
+    get_archive_watermarks, set_archive_watermark,
+)
+from sharding import shard_of
+from trading_calendar import CHINA_TZ
+
+
+# 各列的 Arrow 类型，未列出的数值列为 float64
+_STRING_COLUMNS = {'symbol', 'name'}
+_INT_COLUMNS = {'volume', 'short_sell_volume', 'short_repay_volume', 'short_net_volume'}
+
+
+def available() -> bool:
+    """是否已安装 pyarrow"""
+    return pa is not None
+
+
+def _require():
+    if pa is None:
+        raise RuntimeError("列式归档需要 pyarrow: pip install pyarrow")
+
+
+def bucket_of(symbol: str) -> int:
+    """股票所属的归档桶（与分片使用同一散列）"""
+    return int(shard_of(symbol, CONFIG['archive']['buckets']))
+
+
+def partition_path(table: str, year: int, bucket: int) -> Path:
+    return Path(CONFIG['archive']['dir']) / table / f"year={year}" / f"bucket={bucket:02d}.parquet"
+
+
+def _arrow_type(column: str):
+    if column in _STRING_COLUMNS:
+        return pa.string()
+    if column == 'trade_date':
+        return pa.date32()
+    if column == 'updated_at':
+        return pa.timestamp('s', tz='Asia/Shanghai')
+    if column in _INT_COLUMNS:
+        return pa.int64()
+    return pa.float64()
+
+
+def _to_arrow(columns: List[str], rows: List[tuple]) -> 'pa.Table':
+    """SQLite 原始行 -> Arrow 表（YYYYMMDD 转为 date32，Unix 秒转为北京时间时间戳）"""
+    arrays = []
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows]
+        if column == 'trade_date':
+            values = [date(v // 10000, v // 100 % 100, v % 100) for v in values]
+        elif column == 'updated_at':
+            arrays.append(pa.array(values, type=pa.int64()).cast(_arrow_type(column)))
+            continue
+        arrays.append(pa.array(values, type=_arrow_type(column)))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def _write_partition(path: Path, table: 'pa.Table'):
+    """与已有分区合并（同一股票同一交易日以新数据为准），按 (symbol, trade_date) 排序后原子替换"""
+    if path.exists():
+        existing = pq.read_table(path, memory_map=True)
+        table = pa.concat_tables([existing, table.select(existing.column_names)])
+        frame = table.to_pandas().drop_duplicates(['symbol', 'trade_date'], keep='last')
+        table = pa.Table.from_pandas(frame, schema=existing.schema, preserve_index=False)
+    table = table.sort_by([('symbol', 'ascending'), ('trade_date', 'ascending')])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.parquet.tmp')
+    pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, path)
+
+
+def _settled_through() -> int:
+    """已过修正期的最后一个自然日（YYYYMMDD）"""
+    today = datetime.now(CHINA_TZ).date()
+    return date_to_int(today - timedelta(days=CONFIG['archive']['settle_days']))
+
+
+def export(table: str, through: Optional[int] = None) -> int:
+    """
+    把 table 中上次归档之后、through（默认修正期之前）之前的交易日追加到归档，返回导出行数
+
+    按年份逐年导出并推进归档进度，中断后从上次完成的年份继续
+    """
+    _require()
+    through = through or _settled_through()
+    after = get_archive_watermarks().get(table, 0)
+    if through <= after:
+        return 0
+
+    exported = 0
+    for year in get_market_years(table, after, through):
+        columns, rows = get_market_rows(table, max(after, year * 10000), min(through, year * 10000 + 1231))
+        symbol_index = columns.index('symbol')
+        buckets: Dict[int, List[tuple]] = {}
+        for row in rows:
+            buckets.setdefault(bucket_of(row[symbol_index]), []).append(row)
+        for bucket, bucket_rows in buckets.items():
+            _write_partition(partition_path(table, year, bucket), _to_arrow(columns, bucket_rows))
+        set_archive_watermark(table, min(through, year * 10000 + 1231), len(rows))
+        exported += len(rows)
+        print(f"[{datetime.now()}] 归档 {table} {year}: {len(rows)} 行，{len(buckets)} 个分区")
+
+    set_archive_watermark(table, through, 0)
+    return exported
+
+
+def _archived_keys(path: Path) -> set:
+    """分区文件中已有的 (symbol, trade_date) 键"""
+    if not path.exists():
+        return set()
+    keys = pq.read_table(path, columns=['symbol', 'trade_date'], memory_map=True)
+    return set(zip(keys.column('symbol').to_pylist(),
+                   (date_to_int(value) for value in keys.column('trade_date').to_pylist())))
+
+
+def prune(table: str) -> int:
+    """
+    删除 SQLite 中已归档且超出保留期的行，返回删除行数
+
+    只删除分区文件中已有的键。归档进度之前才写入的迟到行（历史回补、补缺口）
+    不在归档中，先补写入对应分区再删除
+    """
+    retention_days = CONFIG['archive']['sqlite_retention_days']
+    archived_through = get_archive_watermarks().get(table)
+    if retention_days is None or archived_through is None:
+        return 0
+    cutoff = date_to_int(datetime.now(CHINA_TZ).date() - timedelta(days=retention_days))
+    before = min(cutoff, archived_through + 1)
+
+    pruned = late = 0
+    for year in get_market_years(table, 0, before - 1):
+        columns, rows = get_market_rows(table, year * 10000, min(before - 1, year * 10000 + 1231))
+        symbol_index, date_index = columns.index('symbol'), columns.index('trade_date')
+        buckets: Dict[int, List[tuple]] = {}
+        for row in rows:
+            buckets.setdefault(bucket_of(row[symbol_index]), []).append(row)
+        keys = []
+        for bucket, bucket_rows in buckets.items():
+            path = partition_path(table, year, bucket)
+            archived = _archived_keys(path)
+            missing = [row for row in bucket_rows if (row[symbol_index], row[date_index]) not in archived]
+            if missing:
+                _write_partition(path, _to_arrow(columns, missing))
+                late += len(missing)
+            keys.extend((row[symbol_index], row[date_index]) for row in bucket_rows)
+        pruned += prune_market_rows(table, keys)
+
+    if late:
+        set_archive_watermark(table, archived_through, late)
+        print(f"[{datetime.now()}] {table}: 补归档 {late} 行迟到数据")
+    return pruned
+
+
+def archive_all(tables: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """导出并清理各表，返回 {table: 导出行数}"""
+    results = {}
+    for table in tables or CONFIG['archive']['tables']:
+        results[table] = export(table)
+        pruned = prune(table)
+        if pruned:
+            print(f"[{datetime.now()}] {table}: 清理 SQLite 中已归档的 {pruned} 行")
+    return results
+
+
+# ==================== 读取 ====================
+
+def _partitions(table: str, symbols: Optional[List[str]], start: Optional[int], end: Optional[int]) -> List[Path]:
+    """按年份与股票桶裁剪后需要读取的分区文件"""
+    root = Path(CONFIG['archive']['dir']) / table
+    buckets = {bucket_of(symbol) for symbol in symbols} if symbols else None
+    paths = []
+    for year_dir in sorted(root.glob('year=*')):
+        year = int(year_dir.name.split('=')[1])
+        if (start and year < start // 10000) or (end and year > end // 10000):
+            continue
+        for path in sorted(year_dir.glob('bucket=*.parquet')):
+            if buckets is None or int(path.stem.split('=')[1]) in buckets:
+                paths.append(path)
+    return paths
+
+
+def read_table(table: str, symbols: Optional[List[str]] = None, start=None, end=None,
+               columns: Optional[List[str]] = None, recent: bool = True) -> 'pa.Table':
+    """
+    读取日线历史为 Arrow 表
+
+    参数:
+        table: stock_daily / fund_flow / margin_trading
+        symbols: 股票代码列表，None 为全市场
+        start, end: 'YYYY-MM-DD' / 'YYYYMMDD' / date，闭区间
+        columns: 需要的列，None 为全部
+        recent: 是否拼接 SQLite 中的行（未归档的近期行与尚未并入归档的迟到行）
+    """
+    _require()
+    start, end = date_to_int(start), date_to_int(end)
+    symbols = list(symbols) if symbols else None
+
+    filters = []
+    if symbols:
+        filters.append(('symbol', 'in', symbols))
+    if start:
+        filters.append(('trade_date', '>=', date(start // 10000, start // 100 % 100, start % 100)))
+    if end:
+        filters.append(('trade_date', '<=', date(end // 10000, end // 100 % 100, end % 100)))
+
+    # SQLite 中区间内的全部行：既有未归档的近期行，也有归档进度之前才写入的迟到行（历史回补、补缺口）
+    late_keys = set()
+    recent_table = None
+    if recent:
+        archived_through = get_archive_watermarks().get(table, 0)
+        names, rows = get_market_rows(table, (start or 0) - 1, end or 99991231, symbols)
+        if rows:
+            symbol_index, date_index = names.index('symbol'), names.index('trade_date')
+            late_keys = {(row[symbol_index], row[date_index]) for row in rows if row[date_index] <= archived_through}
+            recent_table = _to_arrow(names, rows).select(columns or names)
+
+    # 分区文件以内存映射打开，只解码需要的列与行组；与 SQLite 重复的键以 SQLite 为准
+    tables = []
+    for path in _partitions(table, symbols, start, end):
+        part_columns = columns
+        if late_keys and columns:
+            part_columns = columns + [name for name in ('symbol', 'trade_date') if name not in columns]
+        part = pq.read_table(path, columns=part_columns, filters=filters or None, memory_map=True)
+        if late_keys:
+            keep = [(symbol, date_to_int(day)) not in late_keys for symbol, day in
+                    zip(part.column('symbol').to_pylist(), part.column('trade_date').to_pylist())]
+            part = part.filter(pa.array(keep, type=pa.bool_()))
+            if columns:
+                part = part.select(columns)
+        tables.append(part)
+    if recent_table is not None:
+        tables.append(recent_table)
+
+    if not tables:
+        spec = TABLE_SPECS[table]
+        names = columns or spec['columns'] + ([spec['stamp']] if spec['stamp'] else [])
+        return pa.Table.from_arrays([pa.array([], type=_arrow_type(name)) for name in names], names=names)
+    result = pa.concat_tables(tables)
+    if 'symbol' in result.column_names and 'trade_date' in result.column_names:
+        result = result.sort_by([('symbol', 'ascending'), ('trade_date', 'ascending')])
+    return result
+
+
+def read(table: str, symbols: Optional[List[str]] = None, start=None, end=None,
+         columns: Optional[List[str]] = None, recent: bool = True) -> pd.DataFrame:
+    """读取日线历史为 pandas DataFrame（参数同 read_table，trade_date 为 datetime64）"""
+    return read_table(table, symbols, start, end, columns, recent).to_pandas(date_as_object=False)
+
+
+def read_columns(table: str, symbols: Optional[List[str]] = None, start=None, end=None,
+                 columns: Optional[List[str]] = None, recent: bool = True) -> Dict:
+    """读取日线历史为 {列名: NumPy 数组}（由 Arrow 列直接转换，不经过逐行字典）"""
+    result = read_table(table, symbols, start, end, columns, recent)
+    return {name: result.column(name).to_numpy() for name in result.column_names}
+
+
+if __name__ == "__main__":
+    if not available():
+        print("未安装 pyarrow，无法归档")
+        sys.exit(1)
+    print(archive_all(sys.argv[1:] or None))
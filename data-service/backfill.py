@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+全市场历史数据回填
+把股票池切分为工作单元并发执行（受上游令牌桶限速），每个单元的进度记录在
+backfill_checkpoints 表中，崩溃或 Ctrl+C 后重新运行同一命令即从断点继续
+
+用法:
+    python backfill.py stock_daily --start 20150101
+    python backfill.py fund_flow
+    python backfill.py margin --start 20230101 --end 20231231
+"""
+import argparse
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Callable, Tuple
+
+from config import CONFIG
+from database import (
+    init_database, close_connections, bulk_upsert,
+    create_backfill_units, get_backfill_units,
+)
+from writer import start_writer, stop_writer
+from trading_calendar import trading_days_between
+from collectors.concurrency import fetch_concurrently, get_bucket
+from collectors import stock_daily, fund_flow, margin
+from collectors import upstream
+from collectors.normalize import frame_to_records
+
+
+# ==================== 工作单元 ====================
+
+def load_universe() -> List[str]:
+    """获取全部 A 股代码"""
+    df = upstream.call('stock_info_a_code_name')
+    return sorted(df['code'].astype(str).tolist())
+
+
+def _symbol_units(symbols: List[str], shard_size: int) -> List[Tuple[str, str]]:
+    """按代码顺序切分为 [(unit_id, 'code1,code2,...'), ...]"""
+    return [
+        (f"{offset // shard_size:05d}", ','.join(symbols[offset:offset + shard_size]))
+        for offset in range(0, len(symbols), shard_size)
+    ]
+
+
+def _date_units(start: datetime, end: datetime) -> List[Tuple[str, str]]:
+    """按交易日切分为 [(unit_id, 'YYYYMMDD'), ...]"""
+    return [
+        (day.strftime('%Y%m%d'), day.strftime('%Y%m%d'))
+        for day in trading_days_between(start.date(), end.date())
+    ]
+
+
+# 单元执行函数调用会抛出异常的 load_* 接口：上游失败或熔断拒绝时单元记为 failed，重新运行可重试
+
+def _run_stock_daily(payload: str, args) -> int:
+    rows = 0
+    for symbol in payload.split(','):
+        get_bucket('eastmoney').acquire()
+        data = stock_daily.load_stock_daily(symbol, args.start, args.end)
+        rows += bulk_upsert('stock_daily', data)
+    return rows
+
+
+def _run_fund_flow(payload: str, args) -> int:
+    rows = 0
+    for symbol in payload.split(','):
+        get_bucket('eastmoney').acquire()
+        rows += bulk_upsert('fund_flow', fund_flow.load_fund_flow(symbol))
+    return rows
+
+
+def _run_margin(payload: str, args) -> int:
+    date = datetime.strptime(payload, '%Y%m%d')
+    # 限速在 margin 模块的下载环节完成；历史交易日只下载一次，不进快照缓存
+    rows = 0
+    for exchange in margin.EXCHANGES:
+        frame = margin.load_exchange_frame(exchange, date, use_cache=False)
+        rows += bulk_upsert('margin_trading', frame_to_records(frame))
+    return rows
+
+
+# 数据集 -> (单元类型, 单元执行函数)
+DATASETS: Dict[str, Tuple[str, Callable[[str, Any], int]]] = {
+    'stock_daily': ('symbols', _run_stock_daily),
+    'fund_flow': ('symbols', _run_fund_flow),
+    'margin': ('dates', _run_margin),
+}
+
+
+# ==================== 执行与进度 ====================
+
+class Progress:
+    """回填进度：吞吐与预计剩余时间"""
+
+    def __init__(self, total: int, already_done: int):
+        self.total = total
+        self.done = already_done
+        self.completed_now = 0
+        self.failed = 0
+        self.rows = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, rows: int, ok: bool):
+        with self._lock:
+            self.completed_now += 1
+            if ok:
+                self.done += 1
+                self.rows += rows
+            else:
+                self.failed += 1
+
+    def report(self, unit_id: str):
+        elapsed = time.monotonic() - self.started
+        units_rate = self.completed_now / elapsed if elapsed > 0 else 0
+        remaining = self.total - self.done - self.failed
+        eta = timedelta(seconds=int(remaining / units_rate)) if units_rate > 0 else '未知'
+        print(f"[回填] 单元 {unit_id} | 进度 {self.done}/{self.total} "
+              f"(失败 {self.failed}) | {self.rows} 行, {self.rows / max(elapsed, 1e-9):.0f} 行/秒, "
+              f"{units_rate * 60:.1f} 单元/分 | 预计剩余 {eta}")
+
+
+def run_backfill(dataset: str, args):
+    """执行（或续跑）一个回填任务"""
+    unit_kind, run_unit = DATASETS[dataset]
+    job_id = args.job or f"{dataset}:{args.start}-{args.end}"
+
+    if unit_kind == 'symbols':
+        units = _symbol_units(load_universe(), args.shard_size)
+    else:
+        units = _date_units(datetime.strptime(args.start, '%Y%m%d'), datetime.strptime(args.end, '%Y%m%d'))
+    create_backfill_units(job_id, dataset, units)
+
+    pending = get_backfill_units(job_id)
+    progress = Progress(total=len(units), already_done=len(units) - len(pending))
+    print(f"[回填] 任务 {job_id}: 共 {len(units)} 个单元，待执行 {len(pending)} 个")
+
+    def execute(unit: Dict) -> Tuple[int, str]:
+        try:
+            return run_unit(unit['payload'], args), None
+        except Exception as e:
+            return 0, str(e)
+
+    for unit, outcome in fetch_concurrently(execute, pending, upstream=None, max_workers=args.workers):
+        rows, error = outcome
+        # 检查点与数据走同一写入队列，数据先于检查点落盘
+        bulk_upsert('backfill_checkpoints', [{
+            'job_id': job_id,
+            'unit_id': unit['unit_id'],
+            'dataset': dataset,
+            'payload': unit['payload'],
+            'status': 'failed' if error else 'done',
+            'rows': rows,
+            'error': error,
+        }])
+        progress.record(rows, ok=error is None)
+        progress.report(unit['unit_id'])
+
+    print(f"[回填] 任务 {job_id} 结束: 完成 {progress.done}/{progress.total}，"
+          f"本次写入 {progress.rows} 行，失败 {progress.failed} 个单元（重新运行可重试）")
+
+
+def main():
+    today = datetime.now().strftime('%Y%m%d')
+    parser = argparse.ArgumentParser(description='全市场历史数据回填（支持断点续跑）')
+    parser.add_argument('datasets', nargs='+', choices=sorted(DATASETS), help='要回填的数据集')
+    parser.add_argument('--start', default=CONFIG['kline_history_start'], help='开始日期 YYYYMMDD')
+    parser.add_argument('--end', default=today, help='结束日期 YYYYMMDD，默认今天')
+    parser.add_argument('--shard-size', type=int, default=CONFIG['backfill']['shard_size'],
+                        help='每个工作单元包含的股票数')
+    parser.add_argument('--workers', type=int, default=CONFIG['backfill']['workers'], help='并发单元数')
+    parser.add_argument('--job', help='任务名（默认按数据集和日期范围生成，同名任务会续跑）')
+    args = parser.parse_args()
+
+    # SIGTERM 与 Ctrl+C 一样走 finally 落盘
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    init_database()
+    start_writer()
+    try:
+        for dataset in args.datasets:
+            run_backfill(dataset, args)
+    except (KeyboardInterrupt, SystemExit):
+        print(f"\n[{datetime.now()}] 回填中断，已完成的单元不会重复执行")
+    finally:
+        stop_writer()
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
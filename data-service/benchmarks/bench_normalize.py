@@ -0,0 +1,92 @@
+"""
+标准化层基准测试
+对比旧的 iterrows + 逐格 _safe_float/_safe_int 写法与向量化的 normalize.to_records
+
+运行: python -m benchmarks.bench_normalize [行数]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from collectors.stock_realtime import SPOT_FIELDS
+from collectors.normalize import STR, INT, to_records
+
+
+def _safe_float(value):
+    """旧实现：安全转换为浮点数"""
+    if pd.isna(value) or value == '' or value == '-':
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _safe_int(value):
+    """旧实现：安全转换为整数"""
+    if pd.isna(value) or value == '' or value == '-':
+        return None
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return None
+
+
+def iterrows_records(df: pd.DataFrame) -> list:
+    """旧实现：逐行逐格转换"""
+    data = []
+    for _, row in df.iterrows():
+        item = {}
+        for source, (target, kind) in SPOT_FIELDS.items():
+            value = row.get(source)
+            if kind == STR:
+                item[target] = str(value)
+            elif kind == INT:
+                item[target] = _safe_int(value)
+            else:
+                item[target] = _safe_float(value)
+        data.append(item)
+    return data
+
+
+def make_spot_frame(rows: int) -> pd.DataFrame:
+    """构造与 stock_zh_a_spot_em 同形的全市场快照，约 2% 的格子为 '-'"""
+    rng = np.random.default_rng(42)
+    frame = {'代码': [f"{i:06d}" for i in range(rows)], '名称': [f"股票{i}" for i in range(rows)]}
+    for source, (_, kind) in SPOT_FIELDS.items():
+        if kind == STR:
+            continue
+        column = rng.normal(100, 30, rows).round(2).astype(object)
+        column[rng.random(rows) < 0.02] = '-'
+        frame[source] = column
+    return pd.DataFrame(frame)
+
+
+def _time(fn, df, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(rows: int = 5500):
+    df = make_spot_frame(rows)
+
+    legacy = _time(iterrows_records, df)
+    vectorized = _time(lambda frame: to_records(frame, SPOT_FIELDS), df)
+
+    print(f"行数: {rows}, 列数: {len(SPOT_FIELDS)}")
+    print(f"iterrows + _safe_*  : {legacy * 1000:8.1f} ms")
+    print(f"normalize.to_records: {vectorized * 1000:8.1f} ms")
+    print(f"加速比: {legacy / vectorized:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5500)
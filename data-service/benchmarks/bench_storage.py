@@ -0,0 +1,121 @@
+"""
+日K线存储布局基准测试
+对比旧布局（自增 id + 文本日期 + UNIQUE/二级索引）与聚簇布局（WITHOUT ROWID，
+主键 (symbol, trade_date)，YYYYMMDD 整数日期）的文件大小与查询延迟
+
+运行: python -m benchmarks.bench_storage [股票数] [交易日数]
+"""
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from database import CLUSTERED_TABLES, date_to_int
+
+
+LEGACY_DDL = [
+    """
+    CREATE TABLE stock_daily (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol VARCHAR(10) NOT NULL,
+        trade_date DATE NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume BIGINT,
+        amount REAL,
+        amplitude REAL,
+        change_pct REAL,
+        change_amount REAL,
+        turnover_rate REAL,
+        UNIQUE(symbol, trade_date)
+    )
+    """,
+    "CREATE INDEX idx_stock_daily_symbol_date ON stock_daily(symbol, trade_date)",
+]
+
+COLUMNS = ('symbol', 'trade_date', 'open', 'high', 'low', 'close', 'volume', 'amount',
+           'amplitude', 'change_pct', 'change_amount', 'turnover_rate')
+
+
+def make_rows(symbols: int, days: int) -> list:
+    """按采集顺序（逐日全市场）构造日K线，日期为 'YYYY-MM-DD'"""
+    rng = random.Random(42)
+    start = date(2015, 1, 5)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+    rows = []
+    for trade_date in dates:
+        for i in range(symbols):
+            close = round(rng.uniform(5, 200), 2)
+            rows.append((f"{i:06d}", trade_date, close, close * 1.02, close * 0.98, close,
+                         rng.randint(10 ** 4, 10 ** 7), close * 10 ** 5,
+                         round(rng.uniform(0, 10), 2), round(rng.uniform(-10, 10), 2),
+                         round(rng.uniform(-5, 5), 2), round(rng.uniform(0, 20), 2)))
+    return rows
+
+
+def build(path: Path, ddl: list, rows: list) -> int:
+    """建表并写入，返回 VACUUM 后的文件大小"""
+    conn = sqlite3.connect(path)
+    for statement in ddl:
+        conn.execute(statement)
+    placeholders = ', '.join('?' for _ in COLUMNS)
+    conn.executemany(f"INSERT INTO stock_daily ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return path.stat().st_size
+
+
+def _time(conn: sqlite3.Connection, sql: str, params_list: list, repeat: int = 3) -> float:
+    """执行全部查询的最优耗时"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for params in params_list:
+            conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(path: Path, symbols: list, range_start, range_end) -> tuple:
+    """最近 30 条（get_stock_daily）与一年区间扫描的耗时"""
+    conn = sqlite3.connect(path)
+    latest = _time(conn, "SELECT * FROM stock_daily WHERE symbol = ? ORDER BY trade_date DESC LIMIT 30",
+                   [(symbol,) for symbol in symbols])
+    scan = _time(conn, "SELECT * FROM stock_daily WHERE symbol = ? AND trade_date BETWEEN ? AND ?",
+                 [(symbol, range_start, range_end) for symbol in symbols])
+    conn.close()
+    return latest, scan
+
+
+def main(symbols: int = 500, days: int = 750):
+    rows = make_rows(symbols, days)
+    compact_rows = [(row[0], date_to_int(row[1])) + row[2:] for row in rows]
+    sample = [f"{i:06d}" for i in random.Random(7).sample(range(symbols), min(symbols, 200))]
+    first, last = rows[0][1], rows[-1][1]
+    year_start = (date.fromisoformat(last) - timedelta(days=365)).isoformat()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path, compact_path = Path(tmp) / 'legacy.db', Path(tmp) / 'compact.db'
+        legacy_size = build(legacy_path, LEGACY_DDL, rows)
+        compact_size = build(compact_path, [CLUSTERED_TABLES['stock_daily'].format(name='stock_daily')],
+                             compact_rows)
+        legacy = measure(legacy_path, sample, year_start, last)
+        compact = measure(compact_path, sample, date_to_int(year_start), date_to_int(last))
+
+    print(f"行数: {len(rows)}（{symbols} 只股票 × {days} 个交易日，{first} ~ {last}），查询股票数: {len(sample)}")
+    print(f"文件大小    : 旧布局 {legacy_size / 1024 / 1024:8.1f} MB, 聚簇布局 {compact_size / 1024 / 1024:8.1f} MB")
+    print(f"最近 30 条  : 旧布局 {legacy[0] * 1000:8.1f} ms, 聚簇布局 {compact[0] * 1000:8.1f} ms")
+    print(f"一年区间扫描: 旧布局 {legacy[1] * 1000:8.1f} ms, 聚簇布局 {compact[1] * 1000:8.1f} ms")
+    print(f"文件缩小: {1 - compact_size / legacy_size:.0%}，区间扫描加速比: {legacy[1] / compact[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,146 @@
+"""
+上游接口熔断器
+每个 AkShare 函数一个熔断器（见 upstream.call）：
+- 关闭: 正常调用，统计最近 window 秒内的失败率
+- 打开: 失败率超过阈值后熔断，退避期内直接拒绝调用（不再等待超时）；
+        退避时间按连续熔断次数指数增长并加随机抖动
+- 半开: 退避期满后只放行一次探测调用，成功则恢复，失败则以更长的退避重新熔断
+
+上游故障期间，每个退避周期只花费一次探测，而不是每只股票各等一次超时
+"""
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Tuple
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import CONFIG
+import metrics
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 指标中的状态取值
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """接口处于熔断状态，调用被拒绝"""
+
+
+class CircuitBreaker:
+    """单个上游接口的熔断状态"""
+
+    def __init__(self, name: str, window: float, min_calls: int, failure_rate: float,
+                 backoff_base: float, backoff_max: float):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.state = CLOSED
+        self._results: Deque[Tuple[float, bool]] = deque()  # (时间, 是否成功)
+        self._trips = 0            # 连续熔断次数（决定退避时长）
+        self._open_until = 0.0
+        self._probing = False      # 半开状态下探测调用是否在进行中
+        self._lock = threading.Lock()
+        metrics.CIRCUIT_STATE.set(0, function=name)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.CIRCUIT_STATE.set(_STATE_VALUES[state], function=self.name)
+
+    def _trip(self, now: float):
+        """熔断：退避 = min(上限, 基数 × 2^连续熔断次数)，取其 50%~100% 作为抖动"""
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** self._trips))
+        backoff *= random.uniform(0.5, 1.0)
+        self._trips += 1
+        self._open_until = now + backoff
+        self._probing = False
+        self._results.clear()
+        self._set_state(OPEN)
+        metrics.CIRCUIT_OPENS.inc(function=self.name)
+        print(f"[{datetime.now()}] 接口 {self.name} 熔断 {backoff:.0f} 秒（第 {self._trips} 次）")
+
+    def is_rejecting(self) -> bool:
+        """当前调用是否会被拒绝（只读检查，供调度方提前跳过，不占用探测名额）"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() < self._open_until
+            return self.state == HALF_OPEN and self._probing
+
+    def before_call(self):
+        """调用前申请许可，被拒绝时抛出 CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self._open_until:
+                    metrics.CIRCUIT_REJECTIONS.inc(function=self.name)
+                    raise CircuitOpenError(f"接口 {self.name} 熔断中，{self._open_until - now:.0f} 秒后探测")
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    metrics.CIRCUIT_REJECTIONS.inc(function=self.name)
+                    raise CircuitOpenError(f"接口 {self.name} 正在探测恢复")
+                self._probing = True
+
+    def record(self, success: bool):
+        """记录调用结果"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if success:
+                    self._trips = 0
+                    self._probing = False
+                    self._results.clear()
+                    self._set_state(CLOSED)
+                    print(f"[{datetime.now()}] 接口 {self.name} 探测成功，恢复调用")
+                else:
+                    self._trip(now)
+                return
+
+            self._results.append((now, success))
+            while self._results and self._results[0][0] < now - self.window:
+                self._results.popleft()
+            if success or len(self._results) < self.min_calls:
+                return
+            failures = sum(1 for _, ok in self._results if not ok)
+            if failures / len(self._results) >= self.failure_rate:
+                self._trip(now)
+
+
+# 函数名 -> 熔断器
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取接口对应的熔断器（首次使用时按 CONFIG['circuit_breaker'] 创建）"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            settings = CONFIG['circuit_breaker']
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=settings['window'],
+                min_calls=settings['min_calls'],
+                failure_rate=settings['failure_rate'],
+                backoff_base=settings['backoff_base'],
+                backoff_max=settings['backoff_max'],
+            )
+        return breaker
+
+
+def is_rejecting(name: str) -> bool:
+    """接口当前是否处于熔断（不创建熔断器）"""
+    breaker = _breakers.get(name)
+    return breaker is not None and breaker.is_rejecting()
@@ -0,0 +1,181 @@
+"""
+并发抓取执行器
+按上游限速（令牌桶）并发执行逐只股票的抓取，结果按完成顺序返回，
+调用方可以边抓边写，不必等待最慢的一只；
+任务可以设置截止时间，超时后放弃尚未开始的股票，避免拖到下一个调度周期
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import CONFIG
+import metrics
+import profiling
+from collectors import circuit_breaker
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class TokenBucket:
+    """令牌桶限速器：平均每秒 rate 次，允许 burst 次突发"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# 上游名 -> 令牌桶（进程内共享，跨任务生效）
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(upstream: str) -> TokenBucket:
+    """获取上游对应的令牌桶，未配置的上游使用 default 限速"""
+    with _buckets_lock:
+        bucket = _buckets.get(upstream)
+        if bucket is None:
+            limits = CONFIG['rate_limits']
+            limit = limits.get(upstream, limits['default'])
+            bucket = _buckets[upstream] = TokenBucket(limit['rate'], limit['burst'])
+        return bucket
+
+
+class DeadlineExceeded(Exception):
+    """任务已超过截止时间"""
+
+
+class Deadline:
+    """一次任务运行的时间预算，记录因超时被放弃的条目"""
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires_at = time.monotonic() + seconds if seconds else float('inf')
+        self.skipped: List[Any] = []
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Deadline]:
+    """
+    在 with 块内为当前线程设置截止时间（秒），None 表示不限时
+
+    块内的 fetch_concurrently 在超时后不再发起新的抓取，
+    被放弃的条目记录在 Deadline.skipped 中
+    """
+    budget = Deadline(seconds)
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = budget
+    try:
+        yield budget
+    finally:
+        _local.deadline = previous
+
+
+def current_deadline() -> Optional[Deadline]:
+    """当前线程生效的截止时间"""
+    return getattr(_local, 'deadline', None)
+
+
+def fetch_concurrently(
+    fetch: Callable[[T], R],
+    items: Iterable[T],
+    upstream: Optional[str],
+    max_workers: Optional[int] = None,
+    endpoint: Optional[str] = None,
+) -> Iterator[Tuple[T, Optional[R]]]:
+    """
+    并发执行 fetch(item)，按完成顺序产出 (item, 结果)
+
+    参数:
+        fetch: 单个抓取函数，如 fetch_stock_news
+        items: 待抓取的参数（通常是股票代码）
+        upstream: 上游名，用于选择令牌桶，如 'eastmoney'；
+                  为 None 时不限速（由 fetch 内部自行按请求限速）
+        max_workers: 并发数，默认取 CONFIG['fetch_workers']
+        endpoint: fetch 调用的 AkShare 函数名；该接口熔断期间直接产出 None，
+                  不占用令牌、不等待超时
+
+    抓取抛出的异常会被记录并产出 None，不会中断其余任务；
+    调用方提前结束迭代（break、异常、Ctrl+C）时取消尚未开始的任务；
+    超过当前截止时间（见 deadline()）后尚未开始的条目不再抓取，也不会产出
+    """
+    bucket = get_bucket(upstream) if upstream else None
+    budget = current_deadline()
+
+    def task(item: T) -> R:
+        if budget is not None and budget.expired():
+            raise DeadlineExceeded()
+        if endpoint and circuit_breaker.is_rejecting(endpoint):
+            metrics.CIRCUIT_REJECTIONS.inc(function=endpoint)
+            raise circuit_breaker.CircuitOpenError(endpoint)
+        if bucket is not None:
+            bucket.acquire()
+            if budget is not None and budget.expired():
+                raise DeadlineExceeded()
+        return profiling.call(fetch, item)  # 剖析开启时把抓取线程也纳入
+
+    with ThreadPoolExecutor(max_workers=max_workers or CONFIG['fetch_workers'],
+                            thread_name_prefix=f"fetch-{upstream or 'any'}") as pool:
+        # 每个任务复制调用方的上下文（如当前任务名，用于指标统计）
+        futures = {pool.submit(contextvars.copy_context().run, task, item): item for item in items}
+        skipped = []
+        rejected = 0
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    result = future.result()
+                except (DeadlineExceeded, CancelledError):
+                    skipped.append(item)
+                    continue
+                except circuit_breaker.CircuitOpenError:
+                    rejected += 1
+                    result = None
+                except Exception as e:
+                    print(f"[{datetime.now()}] 抓取 {item} 失败: {e}")
+                    result = None
+                yield item, result
+
+                if budget is not None and budget.expired():
+                    for pending in futures:
+                        pending.cancel()
+        finally:
+            for future in futures:
+                future.cancel()
+            if rejected:
+                print(f"[{datetime.now()}] 接口 {endpoint} 熔断中，跳过 {rejected} 项抓取")
+            if skipped and budget is not None:
+                budget.skipped.extend(skipped)
+                print(f"[{datetime.now()}] 超过截止时间，放弃 {len(skipped)} 项抓取")
@@ -2,9 +2,7 @@
 财报日历采集器
 使用 AkShare 获取财报披露时间
 """
-import akshare as ak
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
 from datetime import datetime
 
 import sys
@@ -12,6 +10,16 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from database import upsert_earnings_calendar
+from collectors.normalize import STR, to_records
+from collectors import upstream
+
+
+# stock_yjyg_em / stock_yjkb_em 字段映射
+EARNINGS_FIELDS = {
+    '股票代码': ('symbol', STR),
+    '股票简称': ('name', STR),
+    '公告日期': ('actual_date', STR),
+}
 
 
 def fetch_earnings_calendar(date: str = None) -> List[Dict[str, Any]]:
@@ -44,7 +52,7 @@ def fetch_earnings_calendar(date: str = None) -> List[Dict[str, Any]]:
 
         # 尝试获取业绩预告
         try:
-            df = ak.stock_yjyg_em(date=date)
+            df = upstream.call('stock_yjyg_em', date=date)
         except:
             print("业绩预告接口不可用，尝试其他接口")
             return []
@@ -54,16 +62,7 @@ def fetch_earnings_calendar(date: str = None) -> List[Dict[str, Any]]:
             return []
 
         # 字段映射
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('股票代码', '')),
-                'name': row.get('股票简称', ''),
-                'report_date': date,
-                'actual_date': str(row.get('公告日期', '')),
-                'report_type': '业绩预告',
-            }
-            data.append(item)
+        data = to_records(df, EARNINGS_FIELDS, {'report_date': date, 'report_type': '业绩预告'})
 
         print(f"获取到 {len(data)} 条业绩预告")
         return data
@@ -95,7 +94,7 @@ def fetch_earnings_express(date: str = None) -> List[Dict[str, Any]]:
         print(f"获取 {date} 报告期的业绩快报...")
 
         try:
-            df = ak.stock_yjkb_em(date=date)
+            df = upstream.call('stock_yjkb_em', date=date)
         except:
             print("业绩快报接口不可用")
             return []
@@ -103,16 +102,7 @@ def fetch_earnings_express(date: str = None) -> List[Dict[str, Any]]:
         if df.empty:
             return []
 
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('股票代码', '')),
-                'name': row.get('股票简称', ''),
-                'report_date': date,
-                'actual_date': str(row.get('公告日期', '')),
-                'report_type': '业绩快报',
-            }
-            data.append(item)
+        data = to_records(df, EARNINGS_FIELDS, {'report_date': date, 'report_type': '业绩快报'})
 
         print(f"获取到 {len(data)} 条业绩快报")
         return data
@@ -2,9 +2,7 @@
 资金流向采集器
 使用 AkShare 的 stock_individual_fund_flow 接口
 """
-import akshare as ak
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
 from datetime import datetime
 
 import sys
@@ -12,9 +10,44 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from database import upsert_fund_flow
-
-
-def fetch_fund_flow(symbol: str, market: str = None) -> List[Dict[str, Any]]:
+from collectors.concurrency import fetch_concurrently
+from collectors.stock_realtime import get_stock_names
+from collectors.normalize import STR, FLOAT, to_records
+from collectors import upstream
+
+
+# 各档资金净流入字段（个股历史与当日排名两个接口通用）
+_NET_INFLOW_FIELDS = {
+    '涨跌幅': ('change_pct', FLOAT),
+    '主力净流入-净额': ('main_net_inflow', FLOAT),
+    '主力净流入-净占比': ('main_net_inflow_pct', FLOAT),
+    '超大单净流入-净额': ('super_large_net_inflow', FLOAT),
+    '超大单净流入-净占比': ('super_large_net_inflow_pct', FLOAT),
+    '大单净流入-净额': ('large_net_inflow', FLOAT),
+    '大单净流入-净占比': ('large_net_inflow_pct', FLOAT),
+    '中单净流入-净额': ('medium_net_inflow', FLOAT),
+    '中单净流入-净占比': ('medium_net_inflow_pct', FLOAT),
+    '小单净流入-净额': ('small_net_inflow', FLOAT),
+    '小单净流入-净占比': ('small_net_inflow_pct', FLOAT),
+}
+
+# stock_individual_fund_flow 字段映射
+FUND_FLOW_FIELDS = {
+    '日期': ('trade_date', STR),
+    '收盘价': ('close_price', FLOAT),
+    **_NET_INFLOW_FIELDS,
+}
+
+# stock_individual_fund_flow_rank 字段映射
+FUND_FLOW_RANK_FIELDS = {
+    '代码': ('symbol', STR),
+    '名称': ('name', STR),
+    '最新价': ('close_price', FLOAT),
+    **_NET_INFLOW_FIELDS,
+}
+
+
+def load_fund_flow(symbol: str, market: str = None) -> List[Dict[str, Any]]:
     """
     获取个股资金流向
 
@@ -22,48 +55,36 @@ def fetch_fund_flow(symbol: str, market: str = None) -> List[Dict[str, Any]]:
         symbol: 股票代码 (如 '000001')
         market: 市场类型 ('sh' 或 'sz')，如果不提供会自动判断
 
-    返回: 资金流向数据列表
+    返回: 资金流向数据列表；上游调用失败（含熔断拒绝）时抛出异常
     """
-    try:
-        # 自动判断市场
-        if not market:
-            if symbol.startswith('6'):
-                market = 'sh'
-            else:
-                market = 'sz'
+    # 自动判断市场
+    if not market:
+        if symbol.startswith('6'):
+            market = 'sh'
+        else:
+            market = 'sz'
+
+    print(f"获取 {symbol} 的资金流向...")
+    df = upstream.call('stock_individual_fund_flow', stock=symbol, market=market)
+
+    if df.empty:
+        print(f"股票 {symbol} 资金流向数据为空")
+        return []
 
-        print(f"获取 {symbol} 的资金流向...")
-        df = ak.stock_individual_fund_flow(stock=symbol, market=market)
+    # 字段映射 - AkShare 返回的字段可能有所不同
+    data = to_records(df, FUND_FLOW_FIELDS, {
+        'symbol': symbol,
+        'name': '',  # 由 collect_and_save 从全市场快照补全
+    })
 
-        if df.empty:
-            print(f"股票 {symbol} 资金流向数据为空")
-            return []
+    print(f"获取到 {len(data)} 条资金流向数据")
+    return data
 
-        # 字段映射 - AkShare 返回的字段可能有所不同
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': symbol,
-                'name': '',  # 需要从其他接口获取
-                'trade_date': str(row.get('日期', '')),
-                'close_price': _safe_float(row.get('收盘价')),
-                'change_pct': _safe_float(row.get('涨跌幅')),
-                'main_net_inflow': _safe_float(row.get('主力净流入-净额')),
-                'main_net_inflow_pct': _safe_float(row.get('主力净流入-净占比')),
-                'super_large_net_inflow': _safe_float(row.get('超大单净流入-净额')),
-                'super_large_net_inflow_pct': _safe_float(row.get('超大单净流入-净占比')),
-                'large_net_inflow': _safe_float(row.get('大单净流入-净额')),
-                'large_net_inflow_pct': _safe_float(row.get('大单净流入-净占比')),
-                'medium_net_inflow': _safe_float(row.get('中单净流入-净额')),
-                'medium_net_inflow_pct': _safe_float(row.get('中单净流入-净占比')),
-                'small_net_inflow': _safe_float(row.get('小单净流入-净额')),
-                'small_net_inflow_pct': _safe_float(row.get('小单净流入-净占比')),
-            }
-            data.append(item)
-
-        print(f"获取到 {len(data)} 条资金流向数据")
-        return data
 
+def fetch_fund_flow(symbol: str, market: str = None) -> List[Dict[str, Any]]:
+    """获取个股资金流向（参数同 load_fund_flow），失败时返回空列表"""
+    try:
+        return load_fund_flow(symbol, market)
     except Exception as e:
         print(f"获取股票 {symbol} 资金流向失败: {e}")
         return []
@@ -75,31 +96,14 @@ def fetch_fund_flow_rank() -> List[Dict[str, Any]]:
     """
     try:
         print("获取资金流向排名...")
-        df = ak.stock_individual_fund_flow_rank(indicator="今日")
+        df = upstream.call('stock_individual_fund_flow_rank', indicator="今日")
 
         if df.empty:
             return []
 
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('代码', '')),
-                'name': row.get('名称', ''),
-                'trade_date': datetime.now().strftime('%Y-%m-%d'),
-                'close_price': _safe_float(row.get('最新价')),
-                'change_pct': _safe_float(row.get('涨跌幅')),
-                'main_net_inflow': _safe_float(row.get('主力净流入-净额')),
-                'main_net_inflow_pct': _safe_float(row.get('主力净流入-净占比')),
-                'super_large_net_inflow': _safe_float(row.get('超大单净流入-净额')),
-                'super_large_net_inflow_pct': _safe_float(row.get('超大单净流入-净占比')),
-                'large_net_inflow': _safe_float(row.get('大单净流入-净额')),
-                'large_net_inflow_pct': _safe_float(row.get('大单净流入-净占比')),
-                'medium_net_inflow': _safe_float(row.get('中单净流入-净额')),
-                'medium_net_inflow_pct': _safe_float(row.get('中单净流入-净占比')),
-                'small_net_inflow': _safe_float(row.get('小单净流入-净额')),
-                'small_net_inflow_pct': _safe_float(row.get('小单净流入-净占比')),
-            }
-            data.append(item)
+        data = to_records(df, FUND_FLOW_RANK_FIELDS, {
+            'trade_date': datetime.now().strftime('%Y-%m-%d'),
+        })
 
         print(f"获取到 {len(data)} 条资金流向排名数据")
         return data
@@ -109,17 +113,27 @@ def fetch_fund_flow_rank() -> List[Dict[str, Any]]:
         return []
 
 
-def collect_and_save(symbols: List[str] = None):
+def collect_and_save(symbols: List[str] = None) -> List[str]:
     """
     采集并保存资金流向数据
+
+    返回: 抓取失败的股票（上游出错或熔断拒绝），调用方据此安排重试
     """
     total_count = 0
+    failed = []
 
     if symbols:
+        # 名称从全市场快照补全（与实时行情任务共用同一次下载）
+        names = get_stock_names(symbols)
+
         # 获取指定股票的资金流向
-        for symbol in symbols:
-            data = fetch_fund_flow(symbol)
-            if data:
+        for symbol, data in fetch_concurrently(load_fund_flow, symbols, upstream='eastmoney',
+                                               endpoint='stock_individual_fund_flow'):
+            if data is None:
+                failed.append(symbol)
+            elif data:
+                for item in data:
+                    item['name'] = names.get(symbol, '')
                 upsert_fund_flow(data)
                 total_count += len(data)
     else:
@@ -130,16 +144,7 @@ def collect_and_save(symbols: List[str] = None):
             total_count += len(data)
 
     print(f"[{datetime.now()}] 已保存 {total_count} 条资金流向数据")
-
-
-def _safe_float(value) -> Optional[float]:
-    """安全转换为浮点数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
+    return failed
 
 
 if __name__ == "__main__":
@@ -2,7 +2,6 @@
 指数实时行情采集器
 使用 AkShare 的 stock_zh_index_spot_em 接口
 """
-import akshare as ak
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -11,8 +10,40 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from database import upsert_index_realtime
+from database import upsert_index_realtime, append_quote_ticks
 from config import CONFIG
+from collectors.normalize import STR, FLOAT, INT, normalize_frame, frame_to_records
+from collectors.snapshot_cache import snapshots
+from collectors import upstream
+
+
+# stock_zh_index_spot_em 字段映射
+INDEX_SPOT_FIELDS = {
+    '代码': ('symbol', STR),
+    '名称': ('name', STR),
+    '最新价': ('price', FLOAT),
+    '涨跌幅': ('change_pct', FLOAT),
+    '涨跌额': ('change_amount', FLOAT),
+    '成交量': ('volume', INT),
+    '成交额': ('amount', FLOAT),
+    '最高': ('high', FLOAT),
+    '最低': ('low', FLOAT),
+    '今开': ('open', FLOAT),
+    '昨收': ('prev_close', FLOAT),
+    '振幅': ('amplitude', FLOAT),
+}
+
+
+def _download_index_frame() -> pd.DataFrame:
+    """下载并标准化全部指数快照（按 symbol 索引）"""
+    print(f"[{datetime.now()}] 开始获取指数实时行情...")
+    df = upstream.call('stock_zh_index_spot_em')
+    return normalize_frame(df, INDEX_SPOT_FIELDS).set_index('symbol', drop=False)
+
+
+def load_index_frame() -> pd.DataFrame:
+    """获取全部指数快照，TTL 内复用缓存"""
+    return snapshots.get('stock_zh_index_spot_em', _download_index_frame, CONFIG['snapshot_ttl']['index_spot'])
 
 
 def fetch_all_index_realtime() -> List[Dict[str, Any]]:
@@ -20,32 +51,13 @@ def fetch_all_index_realtime() -> List[Dict[str, Any]]:
     获取所有指数实时行情
     """
     try:
-        print(f"[{datetime.now()}] 开始获取指数实时行情...")
-        df = ak.stock_zh_index_spot_em()
+        frame = load_index_frame()
 
-        if df.empty:
+        if frame.empty:
             print("获取指数数据为空")
             return []
 
-        # 字段映射
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('代码', '')),
-                'name': row.get('名称', ''),
-                'price': _safe_float(row.get('最新价')),
-                'change_pct': _safe_float(row.get('涨跌幅')),
-                'change_amount': _safe_float(row.get('涨跌额')),
-                'volume': _safe_int(row.get('成交量')),
-                'amount': _safe_float(row.get('成交额')),
-                'high': _safe_float(row.get('最高')),
-                'low': _safe_float(row.get('最低')),
-                'open': _safe_float(row.get('今开')),
-                'prev_close': _safe_float(row.get('昨收')),
-                'amplitude': _safe_float(row.get('振幅')),
-            }
-            data.append(item)
-
+        data = frame_to_records(frame)
         print(f"获取到 {len(data)} 只指数数据")
         return data
 
@@ -58,13 +70,14 @@ def fetch_index_realtime_by_symbols(symbols: List[str]) -> List[Dict[str, Any]]:
     """
     获取指定指数的实时行情
     """
-    all_data = fetch_all_index_realtime()
-    if not all_data:
+    try:
+        frame = load_index_frame()
+    except Exception as e:
+        print(f"获取指数实时行情失败: {e}")
         return []
 
-    # 过滤指定指数
-    filtered = [item for item in all_data if item['symbol'] in symbols]
-    return filtered
+    # 按索引过滤指定指数
+    return frame_to_records(frame.loc[frame.index.intersection(symbols)])
 
 
 def collect_and_save(symbols: Optional[List[str]] = None):
@@ -79,29 +92,10 @@ def collect_and_save(symbols: Optional[List[str]] = None):
 
     if data:
         upsert_index_realtime(data)
+        append_quote_ticks('index', data)  # 追加到快照历史，供分时 K 线使用
         print(f"[{datetime.now()}] 已保存 {len(data)} 条指数行情数据")
 
 
-def _safe_float(value) -> Optional[float]:
-    """安全转换为浮点数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-
-def _safe_int(value) -> Optional[int]:
-    """安全转换为整数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return int(float(value))
-    except (ValueError, TypeError):
-        return None
-
-
 if __name__ == "__main__":
     from database import init_database
     init_database()
@@ -1,8 +1,10 @@
 """
 融资融券数据采集器
 使用 AkShare 的融资融券接口
+
+沪深两市的明细接口每次返回当日全市场数据，因此每个交易所每个交易日只下载一次，
+标准化为统一字段后按代码建索引放入快照缓存，逐只股票的查询直接从缓存中取
 """
-import akshare as ak
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -12,186 +14,169 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from database import upsert_margin_trading
+from config import CONFIG
+from collectors.concurrency import get_bucket
+from collectors.snapshot_cache import snapshots
+from collectors.normalize import STR, FLOAT, INT, normalize_frame, frame_to_records
+from collectors import upstream
+
+
+# stock_margin_detail_sse 字段映射
+SSE_FIELDS = {
+    '标的证券代码': ('symbol', STR),
+    '标的证券简称': ('name', STR),
+    '融资余额': ('margin_balance', FLOAT),
+    '融资买入额': ('margin_buy', FLOAT),
+    '融资偿还额': ('margin_repay', FLOAT),
+    '融券余额': ('short_balance', FLOAT),
+    '融券卖出量': ('short_sell_volume', INT),
+    '融券偿还量': ('short_repay_volume', INT),
+    '融资融券余额': ('margin_short_balance', FLOAT),
+}
+
+# stock_margin_detail_szse 字段映射
+SZSE_FIELDS = {
+    '证券代码': ('symbol', STR),
+    '证券简称': ('name', STR),
+    '融资余额(元)': ('margin_balance', FLOAT),
+    '融资买入额(元)': ('margin_buy', FLOAT),
+    '融资偿还额(元)': ('margin_repay', FLOAT),
+    '融券余量金额(元)': ('short_balance', FLOAT),
+    '融券卖出量(股)': ('short_sell_volume', INT),
+    '融券偿还量(股)': ('short_repay_volume', INT),
+    '融资融券余额(元)': ('margin_short_balance', FLOAT),
+}
+
+# 交易所 -> 接口名、日期参数格式、字段映射
+EXCHANGES = {
+    'sse': {'api': 'stock_margin_detail_sse', 'date_format': '%Y%m%d', 'fields': SSE_FIELDS},
+    'szse': {'api': 'stock_margin_detail_szse', 'date_format': '%Y-%m-%d', 'fields': SZSE_FIELDS},
+}
+
+def exchange_of(symbol: str) -> str:
+    """根据代码判断所属交易所"""
+    return 'sse' if symbol.startswith('6') else 'szse'
+
+
+def _download_exchange_frame(exchange: str, date: datetime) -> pd.DataFrame:
+    """下载并标准化某交易所某日的全市场明细"""
+    source = EXCHANGES[exchange]
+    print(f"下载 {exchange.upper()} {date.strftime('%Y-%m-%d')} 融资融券明细...")
+    get_bucket('exchange').acquire()
+    df = upstream.call(source['api'], date=date.strftime(source['date_format']))
+
+    frame = normalize_frame(df, source['fields'], {'trade_date': date.strftime('%Y-%m-%d')})
+    # 两市均未直接提供净额字段，统一由买入/偿还推算
+    frame['margin_net_buy'] = frame['margin_buy'] - frame['margin_repay']
+    frame['short_net_volume'] = frame['short_sell_volume'] - frame['short_repay_volume']
+    return frame.set_index('symbol', drop=False)
+
+
+def load_exchange_frame(exchange: str, date: Optional[datetime] = None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    获取某交易所某日的标准化明细（按 symbol 索引）
 
-
-def fetch_margin_detail(symbol: str) -> List[Dict[str, Any]]:
+    同一交易所同一交易日在缓存有效期内只下载一次，并发请求复用同一次下载；
+    下载失败时抛出异常且不缓存，交易所尚未发布（空表）时也不缓存，下次调用重新下载。
+    use_cache=False 时直接下载（仍受限速），用于历史回填等不会复用的逐日请求
+    """
+    date = date or datetime.now()
+    if not use_cache:
+        return _download_exchange_frame(exchange, date)
+    return snapshots.get(
+        (EXCHANGES[exchange]['api'], date.strftime('%Y%m%d')),
+        lambda: _download_exchange_frame(exchange, date),
+        CONFIG['snapshot_ttl']['margin_detail'],
+        cacheable=lambda frame: not frame.empty,
+    )
+
+
+def fetch_margin_detail(symbol: str, date: Optional[datetime] = None) -> List[Dict[str, Any]]:
     """
     获取个股融资融券明细
 
     参数:
         symbol: 股票代码 (如 '000001')
+        date: 交易日，默认为今天
 
     返回: 融资融券数据列表
     """
     try:
-        print(f"获取 {symbol} 的融资融券数据...")
-
-        # 判断市场
-        if symbol.startswith('6'):
-            # 上海市场
-            df = ak.stock_margin_detail_sse(date=datetime.now().strftime('%Y%m%d'))
-            if not df.empty:
-                df = df[df['标的证券代码'] == symbol]
-        else:
-            # 深圳市场
-            df = ak.stock_margin_detail_szse(date=datetime.now().strftime('%Y-%m-%d'))
-            if not df.empty:
-                df = df[df['证券代码'] == symbol]
-
-        if df.empty:
+        frame = load_exchange_frame(exchange_of(symbol), date)
+        if symbol not in frame.index:
             print(f"股票 {symbol} 融资融券数据为空")
             return []
-
-        # 根据市场不同，字段名可能不同，需要适配
-        data = []
-        for _, row in df.iterrows():
-            # 尝试获取各种可能的字段名
-            item = {
-                'symbol': symbol,
-                'name': row.get('证券简称', row.get('标的证券简称', '')),
-                'trade_date': datetime.now().strftime('%Y-%m-%d'),
-                'margin_balance': _safe_float(row.get('融资余额', row.get('融资余额(元)', 0))),
-                'margin_buy': _safe_float(row.get('融资买入额', row.get('融资买入额(元)', 0))),
-                'margin_repay': _safe_float(row.get('融资偿还额', row.get('融资偿还额(元)', 0))),
-                'margin_net_buy': _safe_float(row.get('融资净买入', 0)),
-                'short_balance': _safe_float(row.get('融券余额', row.get('融券余额(元)', 0))),
-                'short_sell_volume': _safe_int(row.get('融券卖出量', row.get('融券卖出量(股)', 0))),
-                'short_repay_volume': _safe_int(row.get('融券偿还量', row.get('融券偿还量(股)', 0))),
-                'short_net_volume': _safe_int(row.get('融券净卖出', 0)),
-                'margin_short_balance': _safe_float(row.get('融资融券余额', 0)),
-            }
-            data.append(item)
-
-        print(f"获取到 {len(data)} 条融资融券数据")
-        return data
+        return frame_to_records(frame.loc[[symbol]])
 
     except Exception as e:
         print(f"获取股票 {symbol} 融资融券失败: {e}")
         return []
 
 
-def fetch_margin_sse() -> List[Dict[str, Any]]:
+def fetch_margin_exchange(exchange: str, date: Optional[datetime] = None) -> List[Dict[str, Any]]:
     """
-    获取上交所融资融券汇总数据
+    获取某交易所全部标的的融资融券数据
+
+    参数:
+        exchange: 'sse' 或 'szse'
+        date: 交易日，默认为今天
     """
     try:
-        print("获取上交所融资融券数据...")
-        df = ak.stock_margin_detail_sse(date=datetime.now().strftime('%Y%m%d'))
-
-        if df.empty:
-            return []
-
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('标的证券代码', '')),
-                'name': row.get('标的证券简称', ''),
-                'trade_date': datetime.now().strftime('%Y-%m-%d'),
-                'margin_balance': _safe_float(row.get('融资余额')),
-                'margin_buy': _safe_float(row.get('融资买入额')),
-                'margin_repay': _safe_float(row.get('融资偿还额')),
-                'margin_net_buy': None,
-                'short_balance': _safe_float(row.get('融券余额')),
-                'short_sell_volume': _safe_int(row.get('融券卖出量')),
-                'short_repay_volume': _safe_int(row.get('融券偿还量')),
-                'short_net_volume': None,
-                'margin_short_balance': _safe_float(row.get('融资融券余额')),
-            }
-            data.append(item)
-
-        print(f"获取到 {len(data)} 条上交所融资融券数据")
+        data = frame_to_records(load_exchange_frame(exchange, date))
+        print(f"获取到 {len(data)} 条 {exchange.upper()} 融资融券数据")
         return data
 
     except Exception as e:
-        print(f"获取上交所融资融券失败: {e}")
+        print(f"获取 {exchange.upper()} 融资融券失败: {e}")
         return []
 
 
-def fetch_margin_szse() -> List[Dict[str, Any]]:
+def fetch_margin_sse(date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """获取上交所融资融券汇总数据"""
+    return fetch_margin_exchange('sse', date)
+
+
+def fetch_margin_szse(date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """获取深交所融资融券汇总数据"""
+    return fetch_margin_exchange('szse', date)
+
+
+def fetch_margin_by_symbols(symbols: List[str], date: Optional[datetime] = None) -> List[Dict[str, Any]]:
     """
-    获取深交所融资融券汇总数据
+    获取指定股票的融资融券数据：每个交易所最多下载一次，再按索引批量取出
     """
-    try:
-        print("获取深交所融资融券数据...")
-        df = ak.stock_margin_detail_szse(date=datetime.now().strftime('%Y-%m-%d'))
-
-        if df.empty:
-            return []
+    by_exchange: Dict[str, List[str]] = {}
+    for symbol in set(symbols):
+        by_exchange.setdefault(exchange_of(symbol), []).append(symbol)
 
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('证券代码', '')),
-                'name': row.get('证券简称', ''),
-                'trade_date': datetime.now().strftime('%Y-%m-%d'),
-                'margin_balance': _safe_float(row.get('融资余额(元)')),
-                'margin_buy': _safe_float(row.get('融资买入额(元)')),
-                'margin_repay': _safe_float(row.get('融资偿还额(元)')),
-                'margin_net_buy': None,
-                'short_balance': _safe_float(row.get('融券余量金额(元)')),
-                'short_sell_volume': _safe_int(row.get('融券卖出量(股)')),
-                'short_repay_volume': _safe_int(row.get('融券偿还量(股)')),
-                'short_net_volume': None,
-                'margin_short_balance': None,
-            }
-            data.append(item)
-
-        print(f"获取到 {len(data)} 条深交所融资融券数据")
-        return data
+    data = []
+    for exchange, wanted in by_exchange.items():
+        try:
+            frame = load_exchange_frame(exchange, date)
+        except Exception as e:
+            print(f"获取 {exchange.upper()} 融资融券失败: {e}")
+            continue
+        data.extend(frame_to_records(frame.loc[frame.index.intersection(wanted)]))
 
-    except Exception as e:
-        print(f"获取深交所融资融券失败: {e}")
-        return []
+    print(f"获取到 {len(data)} 条融资融券数据")
+    return data
 
 
-def collect_and_save(symbols: List[str] = None):
+def collect_and_save(symbols: List[str] = None, date: Optional[datetime] = None):
     """
-    采集并保存融资融券数据
+    采集并保存融资融券数据（date 默认为今天）
     """
-    total_count = 0
-
     if symbols:
         # 获取指定股票的融资融券
-        for symbol in symbols:
-            data = fetch_margin_detail(symbol)
-            if data:
-                upsert_margin_trading(data)
-                total_count += len(data)
+        data = fetch_margin_by_symbols(symbols, date)
     else:
-        # 获取全市场融资融券数据
-        # 上交所
-        sse_data = fetch_margin_sse()
-        if sse_data:
-            upsert_margin_trading(sse_data)
-            total_count += len(sse_data)
-
-        # 深交所
-        szse_data = fetch_margin_szse()
-        if szse_data:
-            upsert_margin_trading(szse_data)
-            total_count += len(szse_data)
-
-    print(f"[{datetime.now()}] 已保存 {total_count} 条融资融券数据")
-
-
-def _safe_float(value) -> Optional[float]:
-    """安全转换为浮点数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
+        # 获取全市场融资融券数据（上交所 + 深交所）
+        data = fetch_margin_sse(date) + fetch_margin_szse(date)
 
+    if data:
+        upsert_margin_trading(data)
 
-def _safe_int(value) -> Optional[int]:
-    """安全转换为整数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return int(float(value))
-    except (ValueError, TypeError):
-        return None
+    print(f"[{datetime.now()}] 已保存 {len(data)} 条融资融券数据")
 
 
 if __name__ == "__main__":
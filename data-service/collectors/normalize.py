@@ -0,0 +1,85 @@
+"""
+DataFrame 标准化层
+把 AkShare 返回的中文列 DataFrame 按声明式映射批量转换为写库记录，
+替代各采集器中 iterrows + 逐格 _safe_float/_safe_int 的写法
+"""
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Tuple, Optional
+
+# 字段类型
+STR = 'str'
+FLOAT = 'float'
+INT = 'int'
+
+# 视为空值的占位符
+NULL_MARKERS = ['-', '']
+
+# 字段映射: {中文列名: (英文字段名, 类型)}
+FieldMap = Dict[str, Tuple[str, str]]
+
+
+def _coerce_numeric(col: pd.Series) -> pd.Series:
+    """批量转换为浮点数，无法解析的值（含 '-'、''）变为 NaN"""
+    return pd.to_numeric(col, errors='coerce').astype('float64')
+
+
+def _coerce_int(col: pd.Series) -> pd.Series:
+    """批量转换为可空整数（向零截断，与 int(float(x)) 一致）"""
+    return np.trunc(_coerce_numeric(col)).astype('Int64')
+
+
+def _coerce_str(col: pd.Series) -> pd.Series:
+    """批量转换为字符串，空值与占位符变为 NULL"""
+    missing = col.isna()
+    text = col.astype(str)
+    return text.astype(object).mask(missing | text.isin(NULL_MARKERS), None)
+
+
+_COERCE = {
+    STR: _coerce_str,
+    FLOAT: _coerce_numeric,
+    INT: _coerce_int,
+}
+
+
+def normalize_frame(
+    df: pd.DataFrame,
+    fields: FieldMap,
+    constants: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """
+    按映射重命名并转换列类型
+
+    参数:
+        df: AkShare 返回的原始 DataFrame
+        fields: {中文列名: (英文字段名, 类型)}，源数据缺失的列填 NULL
+        constants: 追加的常量列，如 {'symbol': '000001'}
+
+    返回: 只包含映射字段（及常量列）的新 DataFrame
+    """
+    out = pd.DataFrame(index=df.index)
+    for source, (target, kind) in fields.items():
+        if source in df.columns:
+            out[target] = _COERCE[kind](df[source])
+        else:
+            out[target] = None
+    for target, value in (constants or {}).items():
+        out[target] = value
+    return out
+
+
+def frame_to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """把标准化后的 DataFrame 转为记录字典列表（NaN/NA 转为 None，数值为 Python 原生类型）"""
+    if frame.empty:
+        return []
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def to_records(
+    df: pd.DataFrame,
+    fields: FieldMap,
+    constants: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """normalize_frame + frame_to_records 的便捷组合"""
+    return frame_to_records(normalize_frame(df, fields, constants))
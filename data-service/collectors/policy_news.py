@@ -2,8 +2,6 @@
 政策新闻采集器
 使用 AkShare 的 news_cctv 接口获取央视新闻
 """
-import akshare as ak
-import pandas as pd
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 
@@ -12,6 +10,24 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from database import insert_policy_news
+from collectors.normalize import STR, normalize_frame, frame_to_records, to_records
+from collectors import upstream
+
+
+# news_cctv 字段映射
+CCTV_FIELDS = {
+    'title': ('title', STR),
+    'content': ('content', STR),
+    'date': ('publish_time', STR),
+}
+
+# stock_news_em 字段映射（作为财经新闻）
+FINANCIAL_NEWS_FIELDS = {
+    '新闻标题': ('title', STR),
+    '新闻内容': ('content', STR),
+    '新闻来源': ('source', STR),
+    '发布时间': ('publish_time', STR),
+}
 
 
 def fetch_cctv_news(date: str = None) -> List[Dict[str, Any]]:
@@ -28,23 +44,16 @@ def fetch_cctv_news(date: str = None) -> List[Dict[str, Any]]:
             date = datetime.now().strftime('%Y%m%d')
 
         print(f"获取 {date} 的央视新闻...")
-        df = ak.news_cctv(date=date)
+        df = upstream.call('news_cctv', date=date)
 
         if df.empty:
             print(f"{date} 新闻为空")
             return []
 
         # 字段映射
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'title': row.get('title', ''),
-                'content': row.get('content', ''),
-                'source': '央视新闻',
-                'publish_time': row.get('date', date),
-                'category': '政策新闻',
-            }
-            data.append(item)
+        frame = normalize_frame(df, CCTV_FIELDS, {'source': '央视新闻', 'category': '政策新闻'})
+        frame['publish_time'] = frame['publish_time'].fillna(date)
+        data = frame_to_records(frame)
 
         print(f"获取到 {len(data)} 条央视新闻")
         return data
@@ -62,23 +71,13 @@ def fetch_financial_news() -> List[Dict[str, Any]]:
     try:
         print("获取财经新闻...")
         # 尝试获取一些热门股票的新闻作为财经新闻
-        df = ak.stock_news_em(symbol="000001")  # 使用平安银行作为代理
+        df = upstream.call('stock_news_em', symbol="000001")  # 使用平安银行作为代理
 
         if df.empty:
             return []
 
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'title': row.get('新闻标题', ''),
-                'content': row.get('新闻内容', ''),
-                'source': row.get('新闻来源', ''),
-                'publish_time': str(row.get('发布时间', '')),
-                'category': '财经新闻',
-            }
-            data.append(item)
-
-        return data[:20]  # 只取前20条
+        # 只取前20条
+        return to_records(df.head(20), FINANCIAL_NEWS_FIELDS, {'category': '财经新闻'})
 
     except Exception as e:
         print(f"获取财经新闻失败: {e}")
@@ -0,0 +1,70 @@
+"""
+全市场快照缓存
+按上游调用缓存整份快照（如 stock_zh_a_spot_em），在 TTL 内所有任务复用同一次下载；
+并发请求同一快照时只有一个线程下载（single-flight），其余线程等待结果
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SnapshotCache:
+    """带 TTL 与单飞去重的进程内缓存"""
+
+    def __init__(self):
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, threading.Lock] = {}
+
+    def get(self, key: Hashable, loader: Callable[[], Any], ttl: float,
+            cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        获取快照；缺失或过期时调用 loader() 下载
+
+        loader 抛出的异常直接向上传递，失败结果不缓存；
+        cacheable(value) 为 False 的结果（如上游尚未发布的空表）只返回给本次调用方，不缓存
+        """
+        value = self.peek(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            # 等锁期间可能已被其他线程加载
+            value = self.peek(key)
+            if value is not None:
+                return value
+            value = loader()
+            with self._lock:
+                now = time.monotonic()
+                if cacheable is None or cacheable(value):
+                    self._entries[key] = (now + ttl, value)
+                self._loading.pop(key, None)
+                self._evict_expired(now)
+            return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """仅读取未过期的缓存，不触发下载"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """清除指定快照（不传则清空）"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _evict_expired(self, now: float):
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+
+
+# 进程内共享的快照缓存
+snapshots = SnapshotCache()
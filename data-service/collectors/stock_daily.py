@@ -2,19 +2,40 @@
 个股日K线数据采集器
 使用 AkShare 的 stock_zh_a_hist 接口
 """
-import akshare as ak
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
+from functools import partial
 
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from database import upsert_stock_daily
-
-
-def fetch_stock_daily(
+from database import (
+    upsert_stock_daily, bulk_upsert, get_daily_high_water_marks, find_daily_gaps, get_backfill_units,
+)
+from config import CONFIG
+from collectors.concurrency import fetch_concurrently
+from collectors.normalize import STR, FLOAT, INT, to_records
+from collectors import upstream
+
+
+# stock_zh_a_hist 字段映射
+DAILY_FIELDS = {
+    '日期': ('trade_date', STR),
+    '开盘': ('open', FLOAT),
+    '最高': ('high', FLOAT),
+    '最低': ('low', FLOAT),
+    '收盘': ('close', FLOAT),
+    '成交量': ('volume', INT),
+    '成交额': ('amount', FLOAT),
+    '振幅': ('amplitude', FLOAT),
+    '涨跌幅': ('change_pct', FLOAT),
+    '涨跌额': ('change_amount', FLOAT),
+    '换手率': ('turnover_rate', FLOAT),
+}
+
+
+def load_stock_daily(
     symbol: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -31,51 +52,46 @@ def fetch_stock_daily(
         period: 周期 ('daily', 'weekly', 'monthly')
         adjust: 复权类型 ('qfq'-前复权, 'hfq'-后复权, ''-不复权)
 
-    返回: 日K线数据列表
+    返回: 日K线数据列表；上游调用失败（含熔断拒绝）时抛出异常
     """
-    try:
-        # 默认获取最近60天数据
-        if not start_date:
-            start_date = (datetime.now() - timedelta(days=60)).strftime('%Y%m%d')
-        if not end_date:
-            end_date = datetime.now().strftime('%Y%m%d')
-
-        print(f"获取 {symbol} 的日K线数据 ({start_date} - {end_date})...")
-
-        df = ak.stock_zh_a_hist(
-            symbol=symbol,
-            period=period,
-            start_date=start_date,
-            end_date=end_date,
-            adjust=adjust
-        )
-
-        if df.empty:
-            print(f"股票 {symbol} 数据为空")
-            return []
-
-        # 字段映射
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': symbol,
-                'trade_date': str(row.get('日期', '')),
-                'open': _safe_float(row.get('开盘')),
-                'high': _safe_float(row.get('最高')),
-                'low': _safe_float(row.get('最低')),
-                'close': _safe_float(row.get('收盘')),
-                'volume': _safe_int(row.get('成交量')),
-                'amount': _safe_float(row.get('成交额')),
-                'amplitude': _safe_float(row.get('振幅')),
-                'change_pct': _safe_float(row.get('涨跌幅')),
-                'change_amount': _safe_float(row.get('涨跌额')),
-                'turnover_rate': _safe_float(row.get('换手率')),
-            }
-            data.append(item)
-
-        print(f"获取到 {len(data)} 条日K线数据")
-        return data
+    # 默认获取最近60天数据
+    if not start_date:
+        start_date = (datetime.now() - timedelta(days=60)).strftime('%Y%m%d')
+    if not end_date:
+        end_date = datetime.now().strftime('%Y%m%d')
+
+    print(f"获取 {symbol} 的日K线数据 ({start_date} - {end_date})...")
+
+    df = upstream.call(
+        'stock_zh_a_hist',
+        symbol=symbol,
+        period=period,
+        start_date=start_date,
+        end_date=end_date,
+        adjust=adjust
+    )
+
+    if df.empty:
+        print(f"股票 {symbol} 数据为空")
+        return []
+
+    # 字段映射
+    data = to_records(df, DAILY_FIELDS, {'symbol': symbol})
 
+    print(f"获取到 {len(data)} 条日K线数据")
+    return data
+
+
+def fetch_stock_daily(
+    symbol: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    period: str = "daily",
+    adjust: str = "qfq"
+) -> List[Dict[str, Any]]:
+    """获取个股日K线数据（参数同 load_stock_daily），失败时返回空列表"""
+    try:
+        return load_stock_daily(symbol, start_date, end_date, period, adjust)
     except Exception as e:
         print(f"获取股票 {symbol} 日K线失败: {e}")
         return []
@@ -88,36 +104,110 @@ def collect_and_save(symbols: List[str], days: int = 60):
     start_date = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
     end_date = datetime.now().strftime('%Y%m%d')
 
-    for symbol in symbols:
-        data = fetch_stock_daily(symbol, start_date, end_date)
+    fetch = partial(fetch_stock_daily, start_date=start_date, end_date=end_date)
+    for symbol, data in fetch_concurrently(fetch, symbols, upstream='eastmoney', endpoint='stock_zh_a_hist'):
         if data:
             upsert_stock_daily(data)
             print(f"已保存 {symbol} 的 {len(data)} 条日K线数据")
 
 
-def _safe_float(value) -> Optional[float]:
-    """安全转换为浮点数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
+# 已补取过的缺口记在回填检查点表中；补取后仍存在的缺口（停牌等）不再重复抓取
+GAP_CHECKPOINT_JOB = 'stock_daily:gaps'
 
 
-def _safe_int(value) -> Optional[int]:
-    """安全转换为整数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return int(float(value))
-    except (ValueError, TypeError):
-        return None
+def _checked_gaps() -> Dict[str, List[Tuple[str, str]]]:
+    """已补取过的缺口区间 {symbol: [(start_date, end_date), ...]}"""
+    checked: Dict[str, List[Tuple[str, str]]] = {}
+    for unit in get_backfill_units(GAP_CHECKPOINT_JOB, pending_only=False):
+        if unit['status'] == 'done':
+            symbol, start_date, end_date = unit['payload'].split(',')
+            checked.setdefault(symbol, []).append((start_date, end_date))
+    return checked
+
+
+def plan_incremental(symbols: List[str], today: Optional[datetime] = None,
+                     recheck_gaps: bool = False) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, str, str]]]:
+    """
+    根据各股票的最新交易日生成补数计划
+
+    - 已有数据：从最新交易日（含，覆盖可能的盘中不完整K线）取到今天
+    - 新股票：从 CONFIG['kline_history_start'] 取全量历史
+    - 历史缺口（如服务停机期间）：补取缺口区间；已补取过的缺口（停牌等）跳过，recheck_gaps 为 True 时重新补取
+
+    返回: (增量区间, 缺口区间)，均为 [(symbol, start_date, end_date), ...]，日期格式 'YYYYMMDD'
+    """
+    today = (today or datetime.now()).strftime('%Y%m%d')
+    marks = get_daily_high_water_marks(symbols)
+
+    plan = []
+    for symbol in symbols:
+        last_date = marks.get(symbol)
+        if last_date is None:
+            plan.append((symbol, CONFIG['kline_history_start'], today))
+        else:
+            plan.append((symbol, _compact_date(last_date), today))
+
+    checked = {} if recheck_gaps else _checked_gaps()
+    gaps = []
+    for symbol, prev_date, next_date in find_daily_gaps(list(marks), CONFIG['kline_gap_days']):
+        start_date, end_date = _compact_date(prev_date), _compact_date(next_date)
+        if any(start <= start_date and end_date <= end for start, end in checked.get(symbol, ())):
+            continue
+        print(f"发现 {symbol} 日K线缺口: {prev_date} ~ {next_date}")
+        gaps.append((symbol, start_date, end_date))
+
+    return plan, gaps
+
+
+def sync_incremental(symbols: List[str], until: Optional[datetime] = None, recheck_gaps: bool = False):
+    """
+    增量同步日K线：只抓取缺失区间，新股票自动全量回填
+
+    until: 同步到的日期，默认今天（补跑错过的交易日时传入该日）
+    recheck_gaps: 重新补取已补取过的缺口
+    """
+    plan, gaps = plan_incremental(symbols, until, recheck_gaps)
+    seeding = sum(1 for symbol, start, _ in plan if start == CONFIG['kline_history_start'])
+    print(f"日K线增量同步: {len(plan)} 个区间（其中 {seeding} 只新股票全量回填），{len(gaps)} 个缺口")
+
+    gap_tasks = set(gaps)
+    checked = []
+    total_count = 0
+    for task, data in fetch_concurrently(_fetch_range, plan + gaps, upstream='eastmoney', endpoint='stock_zh_a_hist'):
+        if data:
+            upsert_stock_daily(data)
+            total_count += len(data)
+        if task in gap_tasks and data is not None:
+            symbol, start_date, end_date = task
+            checked.append({
+                'job_id': GAP_CHECKPOINT_JOB,
+                'unit_id': f"{symbol}:{start_date}-{end_date}",
+                'dataset': 'stock_daily',
+                'payload': f"{symbol},{start_date},{end_date}",
+                'status': 'done',
+                'rows': len(data),
+                'error': None,
+            })
+
+    # 检查点与数据走同一写入队列，数据先于检查点落盘；抓取失败的缺口不记录，下次重试
+    if checked:
+        bulk_upsert('backfill_checkpoints', checked)
+    print(f"[{datetime.now()}] 日K线增量同步完成，共 {total_count} 条")
+
+
+def _fetch_range(task: Tuple[str, str, str]) -> List[Dict[str, Any]]:
+    symbol, start_date, end_date = task
+    return load_stock_daily(symbol, start_date, end_date)  # 失败时由 fetch_concurrently 记录并产出 None
+
+
+def _compact_date(value: str) -> str:
+    """'YYYY-MM-DD'（可能带时间）转为接口需要的 'YYYYMMDD'"""
+    return value[:10].replace('-', '')
 
 
 if __name__ == "__main__":
     from database import init_database
     init_database()
 
-    # 测试获取指定股票
-    collect_and_save(['000001', '600519', '300750'])
+    # 测试增量同步指定股票
+    sync_incremental(['000001', '600519', '300750'])
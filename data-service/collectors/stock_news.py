@@ -2,9 +2,7 @@
 个股新闻采集器
 使用 AkShare 的 stock_news_em 接口
 """
-import akshare as ak
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
 from datetime import datetime
 
 import sys
@@ -12,67 +10,70 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from database import insert_stock_news
+from collectors.concurrency import fetch_concurrently
+from collectors.normalize import STR, to_records
+from collectors import upstream
 
 
-def fetch_stock_news(symbol: str) -> List[Dict[str, Any]]:
+# stock_news_em 字段映射
+NEWS_FIELDS = {
+    '新闻标题': ('title', STR),
+    '新闻内容': ('content', STR),
+    '新闻来源': ('source', STR),
+    '发布时间': ('publish_time', STR),
+    '新闻链接': ('url', STR),
+}
+
+
+def load_stock_news(symbol: str) -> List[Dict[str, Any]]:
     """
     获取个股新闻
 
     参数:
         symbol: 股票代码 (如 '000001')
 
-    返回: 新闻列表
+    返回: 新闻列表；上游调用失败（含熔断拒绝）时抛出异常
     """
-    try:
-        print(f"获取 {symbol} 的新闻...")
-        df = ak.stock_news_em(symbol=symbol)
-
-        if df.empty:
-            print(f"股票 {symbol} 新闻为空")
-            return []
-
-        # 字段映射
-        data = []
-        for _, row in df.iterrows():
-            # 处理发布时间
-            publish_time = row.get('发布时间', '')
-            if publish_time:
-                try:
-                    # 尝试解析时间格式
-                    publish_time = str(publish_time)
-                except:
-                    pass
-
-            item = {
-                'symbol': symbol,
-                'title': row.get('新闻标题', ''),
-                'content': row.get('新闻内容', ''),
-                'source': row.get('新闻来源', ''),
-                'publish_time': publish_time,
-                'url': row.get('新闻链接', ''),
-            }
-            data.append(item)
-
-        print(f"获取到 {len(data)} 条新闻")
-        return data
+    print(f"获取 {symbol} 的新闻...")
+    df = upstream.call('stock_news_em', symbol=symbol)
+
+    if df.empty:
+        print(f"股票 {symbol} 新闻为空")
+        return []
 
+    # 字段映射
+    data = to_records(df, NEWS_FIELDS, {'symbol': symbol})
+
+    print(f"获取到 {len(data)} 条新闻")
+    return data
+
+
+def fetch_stock_news(symbol: str) -> List[Dict[str, Any]]:
+    """获取个股新闻（参数同 load_stock_news），失败时返回空列表"""
+    try:
+        return load_stock_news(symbol)
     except Exception as e:
         print(f"获取股票 {symbol} 新闻失败: {e}")
         return []
 
 
-def collect_and_save(symbols: List[str]):
+def collect_and_save(symbols: List[str]) -> List[str]:
     """
     批量采集并保存个股新闻
+
+    返回: 抓取失败的股票（上游出错或熔断拒绝），调用方据此安排重试
     """
     total_count = 0
-    for symbol in symbols:
-        data = fetch_stock_news(symbol)
-        if data:
+    failed = []
+    for symbol, data in fetch_concurrently(load_stock_news, symbols, upstream='eastmoney', endpoint='stock_news_em'):
+        if data is None:
+            failed.append(symbol)
+        elif data:
             insert_stock_news(data)
             total_count += len(data)
 
     print(f"[{datetime.now()}] 已保存 {total_count} 条个股新闻")
+    return failed
 
 
 if __name__ == "__main__":
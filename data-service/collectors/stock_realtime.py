@@ -2,7 +2,6 @@
 个股实时行情采集器
 使用 AkShare 的 stock_zh_a_spot_em 接口
 """
-import akshare as ak
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -11,7 +10,48 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from database import upsert_stock_realtime
+from database import upsert_stock_realtime, append_quote_ticks
+from config import CONFIG
+from collectors.normalize import STR, FLOAT, INT, normalize_frame, frame_to_records
+from collectors.snapshot_cache import snapshots
+from collectors import upstream
+
+
+# stock_zh_a_spot_em 字段映射
+SPOT_FIELDS = {
+    '代码': ('symbol', STR),
+    '名称': ('name', STR),
+    '最新价': ('price', FLOAT),
+    '涨跌幅': ('change_pct', FLOAT),
+    '涨跌额': ('change_amount', FLOAT),
+    '成交量': ('volume', INT),
+    '成交额': ('amount', FLOAT),
+    '最高': ('high', FLOAT),
+    '最低': ('low', FLOAT),
+    '今开': ('open', FLOAT),
+    '昨收': ('prev_close', FLOAT),
+    '振幅': ('amplitude', FLOAT),
+    '量比': ('volume_ratio', FLOAT),
+    '换手率': ('turnover_rate', FLOAT),
+    '市盈率-动态': ('pe_ratio', FLOAT),
+    '市净率': ('pb_ratio', FLOAT),
+    '总市值': ('total_market_cap', FLOAT),
+    '流通市值': ('circulating_market_cap', FLOAT),
+}
+
+
+def _download_spot_frame() -> pd.DataFrame:
+    """下载并标准化全市场快照（按 symbol 索引）"""
+    print(f"[{datetime.now()}] 开始获取A股实时行情...")
+    df = upstream.call('stock_zh_a_spot_em')
+    return normalize_frame(df, SPOT_FIELDS).set_index('symbol', drop=False)
+
+
+def load_spot_frame() -> pd.DataFrame:
+    """
+    获取全市场快照，TTL 内复用缓存（实时行情、资金流向名称补全等共用）
+    """
+    return snapshots.get('stock_zh_a_spot_em', _download_spot_frame, CONFIG['snapshot_ttl']['stock_spot'])
 
 
 def fetch_all_stock_realtime() -> List[Dict[str, Any]]:
@@ -20,38 +60,13 @@ def fetch_all_stock_realtime() -> List[Dict[str, Any]]:
     返回: 股票实时行情列表
     """
     try:
-        print(f"[{datetime.now()}] 开始获取A股实时行情...")
-        df = ak.stock_zh_a_spot_em()
+        frame = load_spot_frame()
 
-        if df.empty:
+        if frame.empty:
             print("获取数据为空")
             return []
 
-        # 字段映射
-        data = []
-        for _, row in df.iterrows():
-            item = {
-                'symbol': str(row.get('代码', '')),
-                'name': row.get('名称', ''),
-                'price': _safe_float(row.get('最新价')),
-                'change_pct': _safe_float(row.get('涨跌幅')),
-                'change_amount': _safe_float(row.get('涨跌额')),
-                'volume': _safe_int(row.get('成交量')),
-                'amount': _safe_float(row.get('成交额')),
-                'high': _safe_float(row.get('最高')),
-                'low': _safe_float(row.get('最低')),
-                'open': _safe_float(row.get('今开')),
-                'prev_close': _safe_float(row.get('昨收')),
-                'amplitude': _safe_float(row.get('振幅')),
-                'volume_ratio': _safe_float(row.get('量比')),
-                'turnover_rate': _safe_float(row.get('换手率')),
-                'pe_ratio': _safe_float(row.get('市盈率-动态')),
-                'pb_ratio': _safe_float(row.get('市净率')),
-                'total_market_cap': _safe_float(row.get('总市值')),
-                'circulating_market_cap': _safe_float(row.get('流通市值')),
-            }
-            data.append(item)
-
+        data = frame_to_records(frame)
         print(f"获取到 {len(data)} 只股票数据")
         return data
 
@@ -64,13 +79,24 @@ def fetch_stock_realtime_by_symbols(symbols: List[str]) -> List[Dict[str, Any]]:
     """
     获取指定股票的实时行情
     """
-    all_data = fetch_all_stock_realtime()
-    if not all_data:
+    try:
+        frame = load_spot_frame()
+    except Exception as e:
+        print(f"获取A股实时行情失败: {e}")
         return []
 
-    # 过滤指定股票
-    filtered = [item for item in all_data if item['symbol'] in symbols]
-    return filtered
+    # 按索引过滤指定股票
+    return frame_to_records(frame.loc[frame.index.intersection(symbols)])
+
+
+def get_stock_names(symbols: List[str]) -> Dict[str, str]:
+    """从全市场快照查股票名称，快照不可用时返回空字典"""
+    try:
+        frame = load_spot_frame()
+    except Exception as e:
+        print(f"获取股票名称失败: {e}")
+        return {}
+    return frame.loc[frame.index.intersection(symbols), 'name'].dropna().to_dict()
 
 
 def collect_and_save(symbols: Optional[List[str]] = None):
@@ -84,29 +110,10 @@ def collect_and_save(symbols: Optional[List[str]] = None):
 
     if data:
         upsert_stock_realtime(data)
+        append_quote_ticks('stock', data)  # 追加到快照历史，供分时 K 线使用
         print(f"[{datetime.now()}] 已保存 {len(data)} 条实时行情数据")
 
 
-def _safe_float(value) -> Optional[float]:
-    """安全转换为浮点数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-
-def _safe_int(value) -> Optional[int]:
-    """安全转换为整数"""
-    if pd.isna(value) or value == '' or value == '-':
-        return None
-    try:
-        return int(float(value))
-    except (ValueError, TypeError):
-        return None
-
-
 if __name__ == "__main__":
     # 测试
     from database import init_database
@@ -0,0 +1,45 @@
+"""
+上游调用入口
+所有 AkShare 接口经由 call() 调用，统一记录调用耗时、返回行数与失败次数（见 metrics.py），
+并按接口熔断（见 circuit_breaker.py）
+"""
+import time
+from typing import Any
+
+import akshare as ak
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import metrics
+from collectors.circuit_breaker import get_breaker
+
+
+def call(function: str, **kwargs) -> Any:
+    """
+    调用 AkShare 函数
+
+    参数:
+        function: AkShare 函数名，如 'stock_zh_a_spot_em'
+        **kwargs: 透传给该函数的参数
+
+    异常原样抛出，由调用方按原有逻辑处理；接口熔断期间直接抛出 CircuitOpenError
+    """
+    breaker = get_breaker(function)
+    breaker.before_call()
+
+    started = time.perf_counter()
+    try:
+        result = getattr(ak, function)(**kwargs)
+    except Exception:
+        metrics.UPSTREAM_ERRORS.inc(function=function)
+        breaker.record(False)
+        raise
+    finally:
+        metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, function=function)
+    breaker.record(True)
+
+    if result is not None and hasattr(result, '__len__'):
+        metrics.ROWS_FETCHED.inc(len(result), job=metrics.current_job() or 'manual', function=function)
+    return result
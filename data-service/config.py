@@ -10,6 +10,9 @@ BASE_DIR = Path(__file__).parent.parent
 # 数据库路径
 DATABASE_PATH = BASE_DIR / "data" / "investbuddy.db"
 
+# 热库路径：实时行情与当日资金流向（高频写入），以 ATTACH 方式挂载为 hot
+HOT_DATABASE_PATH = BASE_DIR / "data" / "investbuddy_hot.db"
+
 # 确保 data 目录存在
 DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
@@ -25,6 +28,17 @@ CONFIG = {
     "daily_update_hour": 16,  # 下午4点（收盘后）
     "daily_update_minute": 30,
 
+    # 日K线增量同步：新股票从该日期起全量回填
+    "kline_history_start": "19910101",
+    # 相邻两条日K线相隔超过该自然日数视为缺口（长假最长约 10 天）
+    "kline_gap_days": 12,
+
+    # 历史回填（backfill.py）
+    "backfill": {
+        "shard_size": 20,   # 每个工作单元包含的股票数
+        "workers": 4,       # 并发执行的单元数（上游请求仍受 rate_limits 约束）
+    },
+
     # 交易时间段 (用于判断是否需要更新实时数据)
     "trading_hours": {
         "morning_start": "09:30",
@@ -42,6 +56,158 @@ CONFIG = {
         "601318",  # 中国平安
     ],
 
+    # SQLite 连接参数（每个连接建立时应用一次）
+    "sqlite": {
+        "journal_mode": "WAL",          # 与 Next.js 端 lib/db.ts 保持一致
+        "synchronous": "NORMAL",        # WAL 模式下安全且更快
+        "mmap_size": 256 * 1024 * 1024, # 256MB 内存映射读
+        "cache_size": -64 * 1024,       # 负数单位为 KB，即 64MB 页缓存
+        "hot_cache_size": -8 * 1024,    # 热库页缓存 8MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 10.0,           # 等待写锁的秒数
+        "cached_statements": 256,       # 每个连接的预编译语句缓存数
+    },
+
+    # 逐只股票抓取的并发数
+    "fetch_workers": 4,
+
+    # 各上游的令牌桶限速（rate: 每秒请求数，burst: 允许的突发请求数）
+    "rate_limits": {
+        "eastmoney": {"rate": 3.0, "burst": 3},   # 东方财富：日K、新闻、资金流向
+        "exchange": {"rate": 1.0, "burst": 2},    # 沪深交易所：融资融券
+        "default": {"rate": 2.0, "burst": 2},
+    },
+
+    # 上游接口熔断：window 秒内至少 min_calls 次调用且失败率达到 failure_rate 时熔断，
+    # 退避 backoff_base 秒起按连续熔断次数翻倍（上限 backoff_max，带随机抖动），期满后放行一次探测
+    "circuit_breaker": {
+        "window": 120,
+        "min_calls": 5,
+        "failure_rate": 0.5,
+        "backoff_base": 30,
+        "backoff_max": 30 * 60,
+    },
+
+    # 行情快照历史：压缩为 1/5 分钟 K 线的周期（秒）、压缩间隔、原始快照保留天数
+    "tick_history": {
+        "bar_periods": [60, 300],
+        "compact_minutes": 15,
+        "compact_until_hour": 16,
+        "retention_days": 30,
+    },
+
+    # 股票池变更日志（portfolio_symbol_changes）保留天数，由持有 global 租约的进程每天清理
+    "portfolio_change_retention_days": 7,
+
+    # 查询结果缓存（query_cache.py）：写入提交后按表失效；ttl 限制其他进程写入造成的陈旧时间（秒）
+    "query_cache": {
+        "enabled": True,
+        "max_entries": 2048,
+        "ttl": 60,
+    },
+
+    # 日线历史列式归档（archive.py，需要 pyarrow）：收盘 settle_days 天后的交易日导出为 Parquet，
+    # 按年份 + 股票桶分区；SQLite 只保留最近 sqlite_retention_days 天（None 为不清理）
+    "archive": {
+        "dir": str(BASE_DIR / "data" / "archive"),
+        "tables": ["stock_daily", "fund_flow", "margin_trading"],
+        "buckets": 16,
+        "settle_days": 3,
+        "sqlite_retention_days": 730,
+        "hour": 20,
+        "minute": 0,
+    },
+
+    # 全市场快照缓存有效期（秒），同一窗口内各任务复用一次下载
+    "snapshot_ttl": {
+        "stock_spot": 60,          # stock_zh_a_spot_em
+        "index_spot": 60,          # stock_zh_index_spot_em
+        "margin_detail": 6 * 3600, # 交易所融资融券明细（按交易日）
+    },
+
+    # 分层刷新：逐只抓取的任务按需求把股票分到不同刷新间隔（分钟，由热到冷），
+    # 总请求量不超过 budget_per_minute；最热层间隔即任务的触发间隔
+    # budget_per_minute 为全部采集进程合计的预算，分片模式下各进程按持有的分片比例分摊
+    "refresh_tiers": {
+        "fund_flow": {"intervals": [10, 30, 120], "budget_per_minute": 2.0},
+        "stock_news": {"intervals": [60, 180, 720], "budget_per_minute": 0.5},
+    },
+    # 需求分权重：近期读取次数、持有/自选用户数、涨跌幅绝对值
+    "demand_weights": {"reads": 3.0, "holders": 2.0, "volatility": 1.0},
+    # 近期读取热度的半衰期（分钟）：读取次数按时间指数衰减
+    "demand_half_life_minutes": 60,
+    # 分层方案重算间隔（分钟）
+    "tier_replan_minutes": 30,
+
+    # 调度策略：每个任务同时只跑一个实例，积压的触发合并为一次，
+    # 错过触发时间超过 misfire_grace_time 秒则放弃本次
+    "job_defaults": {
+        "max_instances": 1,
+        "coalesce": True,
+        "misfire_grace_time": 120,
+    },
+
+    # 各任务单次运行的时间预算（秒），超时后放弃剩余股票，留出余量不压到下一周期
+    "job_deadlines": {
+        "fund_flow": 8 * 60,
+        "stock_news": 50 * 60,
+        "daily_kline": 50 * 60,
+    },
+
+    # 间隔任务触发时间的随机抖动（秒）
+    "job_jitter": {
+        "realtime_quotes": 20,
+        "index_quotes": 20,
+        "fund_flow": 60,
+        "stock_news": 120,
+        "policy_news": 120,
+    },
+
+    # 多进程分片采集（run.py --worker）：股票分片数、租约有效期与心跳间隔（秒）
+    "sharding": {
+        "shards": 16,
+        "lease_ttl": 60,
+        "heartbeat_interval": 15,
+    },
+
+    # 指标服务（Prometheus 文本格式，GET /metrics），port 设为 0 关闭
+    "metrics": {
+        "host": "127.0.0.1",
+        "port": 9108,
+        "gauge_timeout": 10,  # 抓取时计算数据年龄的最长等待（秒），超时沿用上次的值
+    },
+
+    # 按需剖析（SIGUSR1 或 POST /profile 开启）：默认剖析的任务（空列表表示全部）、次数、输出
+    "profiling": {
+        "jobs": [],
+        "runs": 1,
+        "top_n": 30,
+        "traceback_frames": 1,
+        "output_dir": str(BASE_DIR / "data-service" / "profiles"),
+    },
+
+    # 启动采集：并发数，以及各数据集在多少秒内更新过就跳过（热启动）；
+    # 日K线不按秒数判断，已覆盖最近一个已收盘的交易日即跳过
+    "startup_workers": 4,
+    "warm_start_max_age": {
+        "realtime_quotes": 300,
+        "index_quotes": 300,
+        "fund_flow": 600,
+        "stock_news": 3600,
+        "policy_news": 2 * 3600,
+    },
+
+    # 批量写入时每次 executemany 的行数
+    "db_batch_size": 500,
+
+    # 单写线程：合并各采集器的写入为组提交
+    "writer": {
+        "max_queue": 200,        # 队列最多积压的写入批次，满时阻塞生产者（背压）
+        "batch_rows": 5000,      # 累计行数达到阈值即提交
+        "flush_interval": 1.0,   # 或距首个待写批次超过该秒数即提交
+        "put_timeout": 60.0,     # 生产者最长等待秒数，超时报错
+    },
+
     # 指数列表
     "index_list": [
         "000001",  # 上证指数
@@ -2,107 +2,372 @@
 数据库模型和连接管理
 使用 SQLite 作为本地数据存储
 """
+import hashlib
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional, List, Dict, Any
 
-from config import DATABASE_PATH
+from config import DATABASE_PATH, HOT_DATABASE_PATH, CONFIG
+import metrics
+import query_cache
+from query_cache import cached
+
+
+# 每个线程复用一个连接（APScheduler 的任务运行在线程池中）
+_local = threading.local()
+_connections: List[tuple] = []  # [(所属线程, 连接), ...]
+_connections_lock = threading.Lock()
+_generation = 0  # close_connections() 后递增，使各线程重新建连
+
+
+def _apply_pragmas(conn: sqlite3.Connection):
+    """连接建立时应用一次性能相关的 PRAGMA（冷库 main 与热库 hot 各自的日志、同步与页缓存）"""
+    settings = CONFIG['sqlite']
+    for schema, cache_size in (('main', settings['cache_size']), ('hot', settings['hot_cache_size'])):
+        conn.execute(f"PRAGMA {schema}.journal_mode = {settings['journal_mode']}")
+        conn.execute(f"PRAGMA {schema}.synchronous = {settings['synchronous']}")
+        conn.execute(f"PRAGMA {schema}.mmap_size = {int(settings['mmap_size'])}")
+        conn.execute(f"PRAGMA {schema}.cache_size = {int(cache_size)}")
+    conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+
+
+def _open_connection() -> sqlite3.Connection:
+    """新建并调优一个数据库连接（冷库为 main，热库挂载为 hot）"""
+    settings = CONFIG['sqlite']
+    conn = sqlite3.connect(
+        str(DATABASE_PATH),
+        timeout=settings['busy_timeout'],
+        cached_statements=settings['cached_statements'],  # 预编译语句缓存
+        check_same_thread=False,  # 仅由所属线程使用，关闭时可跨线程
+    )
+    conn.row_factory = sqlite3.Row  # 支持字典式访问
+    conn.execute("ATTACH DATABASE ? AS hot", (str(HOT_DATABASE_PATH),))
+    _apply_pragmas(conn)
+    _create_views(conn)
+    return conn
 
 
 def get_connection() -> sqlite3.Connection:
-    """获取数据库连接"""
-    conn = sqlite3.connect(str(DATABASE_PATH))
-    conn.row_factory = sqlite3.Row  # 支持字典式访问
+    """获取当前线程的持久数据库连接（首次调用时创建）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.generation != _generation:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.depth = 0
+        _local.changed = set()
+        _local.on_commit = []
+        _local.on_rollback = []
+        _local.generation = _generation
+        with _connections_lock:
+            _sweep_dead_connections()
+            _connections.append((threading.current_thread(), conn))
     return conn
 
 
+def _sweep_dead_connections():
+    """关闭已退出线程遗留的连接（持有 _connections_lock 时调用）"""
+    alive = []
+    for thread, conn in _connections:
+        if thread.is_alive():
+            alive.append((thread, conn))
+            continue
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _connections[:] = alive
+
+
+def close_connections():
+    """关闭所有线程的持久连接（服务退出时调用）"""
+    global _generation
+    with _connections_lock:
+        for _, conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _generation += 1
+
+
+def _mark_changed(*tables: str):
+    """登记当前事务写入的表，提交后使这些表的查询缓存失效"""
+    _local.changed.update(tables)
+
+
+def after_transaction(on_commit=None, on_rollback=None):
+    """登记当前（最外层）事务提交或回滚后执行的回调"""
+    if on_commit is not None:
+        _local.on_commit.append(on_commit)
+    if on_rollback is not None:
+        _local.on_rollback.append(on_rollback)
+
+
+def _run_callbacks(callbacks: list):
+    """执行事务回调；单个回调失败只打印，不影响其余回调"""
+    pending = list(callbacks)
+    _local.on_commit.clear()
+    _local.on_rollback.clear()
+    for callback in pending:
+        try:
+            callback()
+        except Exception as e:
+            print(f"[{datetime.now()}] 事务回调失败: {e}")
+
+
 @contextmanager
 def get_db():
-    """数据库连接上下文管理器"""
+    """
+    数据库连接上下文管理器
+
+    复用当前线程的连接；嵌套使用时只有最外层负责提交或回滚。
+    提交回调在 try 之外执行：提交成功后回调出错不会走到回滚分支
+    """
     conn = get_connection()
+    _local.depth += 1
+    committed = False
     try:
         yield conn
-        conn.commit()
+        if _local.depth == 1:
+            conn.commit()
+            committed = True
     except Exception as e:
-        conn.rollback()
+        if _local.depth == 1:
+            conn.rollback()
+            _local.changed.clear()
+            _run_callbacks(_local.on_rollback)
         raise e
     finally:
-        conn.close()
+        _local.depth -= 1
+
+    if committed:
+        if _local.changed:
+            changed = list(_local.changed)
+            _local.changed.clear()
+            query_cache.bump(*changed)
+        _run_callbacks(_local.on_commit)
+
+
+# ==================== 表结构 ====================
+
+# 当前表结构版本（PRAGMA user_version），旧库在 init_database() 中按版本迁移
+SCHEMA_VERSION = 2
+
+# 按 (symbol, trade_date) 聚簇的行情表：WITHOUT ROWID，主键即数据所在的 B 树，
+# 无代理 id、无额外唯一索引；trade_date 为 YYYYMMDD 整数，updated_at 为 Unix 秒
+CLUSTERED_TABLES = {
+    'stock_daily': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            symbol VARCHAR(10) NOT NULL,
+            trade_date INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume BIGINT,
+            amount REAL,
+            amplitude REAL,
+            change_pct REAL,
+            change_amount REAL,
+            turnover_rate REAL,
+            PRIMARY KEY (symbol, trade_date)
+        ) WITHOUT ROWID
+    """,
+    'fund_flow': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            symbol VARCHAR(10) NOT NULL,
+            name VARCHAR(50),
+            trade_date INTEGER NOT NULL,
+            close_price REAL,
+            change_pct REAL,
+            main_net_inflow REAL,
+            main_net_inflow_pct REAL,
+            super_large_net_inflow REAL,
+            super_large_net_inflow_pct REAL,
+            large_net_inflow REAL,
+            large_net_inflow_pct REAL,
+            medium_net_inflow REAL,
+            medium_net_inflow_pct REAL,
+            small_net_inflow REAL,
+            small_net_inflow_pct REAL,
+            updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            PRIMARY KEY (symbol, trade_date)
+        ) WITHOUT ROWID
+    """,
+    'margin_trading': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            symbol VARCHAR(10) NOT NULL,
+            name VARCHAR(50),
+            trade_date INTEGER NOT NULL,
+            margin_balance REAL,
+            margin_buy REAL,
+            margin_repay REAL,
+            margin_net_buy REAL,
+            short_balance REAL,
+            short_sell_volume BIGINT,
+            short_repay_volume BIGINT,
+            short_net_volume BIGINT,
+            margin_short_balance REAL,
+            updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            PRIMARY KEY (symbol, trade_date)
+        ) WITHOUT ROWID
+    """,
+}
+
+
+# 热库中的表：实时行情整表在热库，资金流向只有当日的行在热库（已收盘的交易日由
+# rollover_hot() 移入冷库）。冷库中没有同名的实时行情表，不带库名的查询直接落到热库
+HOT_TABLES = {
+    'stock_realtime': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol VARCHAR(10) NOT NULL,
+            name VARCHAR(50),
+            price REAL,
+            change_pct REAL,
+            change_amount REAL,
+            volume BIGINT,
+            amount REAL,
+            high REAL,
+            low REAL,
+            open REAL,
+            prev_close REAL,
+            amplitude REAL,
+            volume_ratio REAL,
+            turnover_rate REAL,
+            pe_ratio REAL,
+            pb_ratio REAL,
+            total_market_cap REAL,
+            circulating_market_cap REAL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(symbol)
+        )
+    """,
+    'index_realtime': """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol VARCHAR(20) NOT NULL,
+            name VARCHAR(50),
+            price REAL,
+            change_pct REAL,
+            change_amount REAL,
+            volume BIGINT,
+            amount REAL,
+            high REAL,
+            low REAL,
+            open REAL,
+            prev_close REAL,
+            amplitude REAL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(symbol)
+        )
+    """,
+    'fund_flow': CLUSTERED_TABLES['fund_flow'],
+}
+
+# 冷热两库中都有的表：{table}_all 视图合并两边（同一交易日两边都有时以冷库为准，
+# 冷库的行只会在当日收盘后写入，比热库中的盘中数据新）
+SPLIT_TABLES = ['fund_flow']
+
+
+def _create_views(conn: sqlite3.Connection):
+    """创建本连接的合并视图（TEMP 视图才能跨库引用）"""
+    for table in SPLIT_TABLES:
+        conn.execute(f"""
+            CREATE TEMP VIEW IF NOT EXISTS {table}_all AS
+            SELECT * FROM main.{table}
+            UNION ALL
+            SELECT * FROM hot.{table} AS h
+            WHERE NOT EXISTS (
+                SELECT 1 FROM main.{table} AS c
+                WHERE c.symbol = h.symbol AND c.trade_date = h.trade_date
+            )
+        """)
+
+
+def _migrate_clustered_table(conn: sqlite3.Connection, table: str):
+    """把旧版（代理 id + 文本日期）行情表重建为聚簇表，日期与时间戳转换为整数"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if row is None or 'WITHOUT ROWID' in row['sql'].upper():
+        return
+
+    columns = [col['name'] for col in conn.execute(f"PRAGMA table_info({table})") if col['name'] != 'id']
+    converted = {
+        # 'YYYY-MM-DD'（或带时间）-> YYYYMMDD
+        'trade_date': "CAST(REPLACE(substr(trade_date, 1, 10), '-', '') AS INTEGER)",
+        # 旧数据由 datetime.now() 写入本地时间 -> Unix 秒
+        'updated_at': "COALESCE(CAST(strftime('%s', updated_at, 'utc') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER))",
+    }
+    selects = ', '.join(converted.get(col, col) for col in columns)
+
+    started = time.perf_counter()
+    conn.execute(CLUSTERED_TABLES[table].format(name=f"{table}_v1"))
+    conn.execute(f"INSERT OR REPLACE INTO {table}_v1 ({', '.join(columns)}) SELECT {selects} FROM {table}")
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}_v1").fetchone()[0]
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_v1 RENAME TO {table}")
+    print(f"[迁移] {table}: {count} 行转换为聚簇表，耗时 {time.perf_counter() - started:.2f}s")
+
+
+def _migrate_to_hot(conn: sqlite3.Connection):
+    """把单库时代的实时行情表与当日资金流向移入热库"""
+    for table in ('stock_realtime', 'index_realtime'):
+        exists = conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone()
+        if exists is None:
+            continue
+        conn.execute(HOT_TABLES[table].format(name=f"hot.{table}"))
+        count = conn.execute(f"INSERT OR REPLACE INTO hot.{table} SELECT * FROM main.{table}").rowcount
+        conn.execute(f"DROP TABLE main.{table}")
+        print(f"[迁移] {table}: {count} 行移入热库")
+
+    today = date_to_int(datetime.now(_CHINA_TZ).date())
+    for table in SPLIT_TABLES:
+        exists = conn.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone()
+        if exists is None:
+            continue
+        conn.execute(HOT_TABLES[table].format(name=f"hot.{table}"))
+        conn.execute(f"INSERT OR REPLACE INTO hot.{table} SELECT * FROM main.{table} WHERE trade_date >= ?", (today,))
+        conn.execute(f"DELETE FROM main.{table} WHERE trade_date >= ?", (today,))
+
+
+def _migrate(conn: sqlite3.Connection):
+    """按 user_version 执行尚未应用的迁移"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    # 重命名表时 SQLite 会校验引用它的视图，迁移期间先移除合并视图
+    for table in SPLIT_TABLES:
+        conn.execute(f"DROP VIEW IF EXISTS temp.{table}_all")
+    if version < 1:
+        for table in CLUSTERED_TABLES:
+            _migrate_clustered_table(conn, table)
+    if version < 2:
+        _migrate_to_hot(conn)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    _create_views(conn)
 
 
 def init_database():
     """初始化数据库表结构"""
     with get_db() as conn:
         cursor = conn.cursor()
+        _migrate(conn)
 
-        # 个股实时行情
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS stock_realtime (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol VARCHAR(10) NOT NULL,
-                name VARCHAR(50),
-                price REAL,
-                change_pct REAL,
-                change_amount REAL,
-                volume BIGINT,
-                amount REAL,
-                high REAL,
-                low REAL,
-                open REAL,
-                prev_close REAL,
-                amplitude REAL,
-                volume_ratio REAL,
-                turnover_rate REAL,
-                pe_ratio REAL,
-                pb_ratio REAL,
-                total_market_cap REAL,
-                circulating_market_cap REAL,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(symbol)
-            )
-        """)
+        # 个股实时行情（热库）
+        cursor.execute(HOT_TABLES['stock_realtime'].format(name='hot.stock_realtime'))
 
         # 个股日K线
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS stock_daily (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol VARCHAR(10) NOT NULL,
-                trade_date DATE NOT NULL,
-                open REAL,
-                high REAL,
-                low REAL,
-                close REAL,
-                volume BIGINT,
-                amount REAL,
-                amplitude REAL,
-                change_pct REAL,
-                change_amount REAL,
-                turnover_rate REAL,
-                UNIQUE(symbol, trade_date)
-            )
-        """)
+        cursor.execute(CLUSTERED_TABLES['stock_daily'].format(name='stock_daily'))
 
-        # 指数实时行情
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS index_realtime (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol VARCHAR(20) NOT NULL,
-                name VARCHAR(50),
-                price REAL,
-                change_pct REAL,
-                change_amount REAL,
-                volume BIGINT,
-                amount REAL,
-                high REAL,
-                low REAL,
-                open REAL,
-                prev_close REAL,
-                amplitude REAL,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(symbol)
-            )
-        """)
+        # 指数实时行情（热库）
+        cursor.execute(HOT_TABLES['index_realtime'].format(name='hot.index_realtime'))
 
         # 个股新闻
         cursor.execute("""
@@ -147,50 +412,12 @@ def init_database():
             )
         """)
 
-        # 资金流向
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS fund_flow (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol VARCHAR(10) NOT NULL,
-                name VARCHAR(50),
-                trade_date DATE NOT NULL,
-                close_price REAL,
-                change_pct REAL,
-                main_net_inflow REAL,
-                main_net_inflow_pct REAL,
-                super_large_net_inflow REAL,
-                super_large_net_inflow_pct REAL,
-                large_net_inflow REAL,
-                large_net_inflow_pct REAL,
-                medium_net_inflow REAL,
-                medium_net_inflow_pct REAL,
-                small_net_inflow REAL,
-                small_net_inflow_pct REAL,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(symbol, trade_date)
-            )
-        """)
+        # 资金流向（已收盘的交易日在冷库，当日在热库）
+        cursor.execute(CLUSTERED_TABLES['fund_flow'].format(name='main.fund_flow'))
+        cursor.execute(HOT_TABLES['fund_flow'].format(name='hot.fund_flow'))
 
         # 融资融券
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS margin_trading (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol VARCHAR(10) NOT NULL,
-                name VARCHAR(50),
-                trade_date DATE NOT NULL,
-                margin_balance REAL,
-                margin_buy REAL,
-                margin_repay REAL,
-                margin_net_buy REAL,
-                short_balance REAL,
-                short_sell_volume BIGINT,
-                short_repay_volume BIGINT,
-                short_net_volume BIGINT,
-                margin_short_balance REAL,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(symbol, trade_date)
-            )
-        """)
+        cursor.execute(CLUSTERED_TABLES['margin_trading'].format(name='margin_trading'))
 
         # ==================== Agent 相关表 ====================
 
@@ -249,15 +476,193 @@ def init_database():
             )
         """)
 
+        # ==================== 采集服务内部表 ====================
+
+        # 行内容指纹（变更检测，跨重启保留）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS row_fingerprints (
+                table_name VARCHAR(50) NOT NULL,
+                symbol VARCHAR(20) NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                PRIMARY KEY (table_name, symbol)
+            ) WITHOUT ROWID
+        """)
+
+        # 采集心跳（数据新鲜度，每个周期一行更新）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS table_heartbeat (
+                table_name VARCHAR(50) PRIMARY KEY,
+                rows_seen INTEGER,
+                rows_written INTEGER,
+                last_seen_at DATETIME
+            )
+        """)
+
+        # 历史回填检查点（每个工作单元一行，支持断点续跑）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                job_id VARCHAR(100) NOT NULL,
+                unit_id VARCHAR(50) NOT NULL,
+                dataset VARCHAR(50) NOT NULL,
+                payload TEXT NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                rows INTEGER DEFAULT 0,
+                error TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, unit_id)
+            )
+        """)
+
+        # 交易日历（沪深交易所开市日）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS trade_calendar (
+                trade_date DATE PRIMARY KEY
+            ) WITHOUT ROWID
+        """)
+
+        # 用户持仓/自选股票（由 Next.js 的 /api/portfolio/sync 按用户整体替换，status: investing/watching）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_symbols (
+                user_id VARCHAR(50) NOT NULL,
+                symbol VARCHAR(10) NOT NULL,
+                status VARCHAR(20) DEFAULT 'watching',
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, symbol)
+            )
+        """)
+
+        # 股票池变更日志（由触发器维护，采集端按 id 增量读取）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_symbol_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol VARCHAR(10) NOT NULL,
+                delta INTEGER NOT NULL,
+                changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_portfolio_symbols_insert
+            AFTER INSERT ON portfolio_symbols
+            BEGIN
+                INSERT INTO portfolio_symbol_changes (symbol, delta) VALUES (NEW.symbol, 1);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_portfolio_symbols_delete
+            AFTER DELETE ON portfolio_symbols
+            BEGIN
+                INSERT INTO portfolio_symbol_changes (symbol, delta) VALUES (OLD.symbol, -1);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_portfolio_symbols_update
+            AFTER UPDATE OF symbol ON portfolio_symbols
+            WHEN OLD.symbol != NEW.symbol
+            BEGIN
+                INSERT INTO portfolio_symbol_changes (symbol, delta) VALUES (OLD.symbol, -1);
+                INSERT INTO portfolio_symbol_changes (symbol, delta) VALUES (NEW.symbol, 1);
+            END
+        """)
+
+        # 个股读取计数（Next.js 查询行情时累加，用于按热度分配刷新频率）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS symbol_reads (
+                symbol VARCHAR(10) PRIMARY KEY,
+                reads INTEGER NOT NULL DEFAULT 0,
+                last_read_at DATETIME
+            )
+        """)
+
+        # 分片租约（多进程采集时各进程按租约认领股票分片，'global' 为全市场任务）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS shard_leases (
+                shard VARCHAR(20) PRIMARY KEY,
+                owner VARCHAR(100),
+                expires_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+        # 采集进程心跳（用于统计存活进程数、计算每个进程应认领的分片数）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS shard_workers (
+                worker_id VARCHAR(100) PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            )
+        """)
+
+        # 证券整数编号（行情快照历史等大表用整数键代替代码字符串）
+        # kind 区分个股与指数（如 000001 既是平安银行也是上证指数）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS symbol_ids (
+                id INTEGER PRIMARY KEY,
+                kind VARCHAR(10) NOT NULL,
+                symbol VARCHAR(10) NOT NULL,
+                UNIQUE(kind, symbol)
+            )
+        """)
+
+        # 行情快照历史（只追加）：按交易日在前的主键聚簇，按日清理只删除连续的一段
+        # trade_date 为 YYYYMMDD 整数，ts 为 Unix 秒，volume/amount 为当日累计值
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS quote_ticks (
+                trade_date INTEGER NOT NULL,
+                symbol_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                price REAL,
+                volume INTEGER,
+                amount REAL,
+                PRIMARY KEY (trade_date, symbol_id, ts)
+            ) WITHOUT ROWID
+        """)
+
+        # 分钟 K 线（由快照历史压缩生成，period 为 60 / 300 秒，bar_ts 为 K 线起始 Unix 秒）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS quote_bars (
+                period INTEGER NOT NULL,
+                symbol_id INTEGER NOT NULL,
+                bar_ts INTEGER NOT NULL,
+                trade_date INTEGER NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume INTEGER,
+                amount REAL,
+                PRIMARY KEY (period, symbol_id, bar_ts)
+            ) WITHOUT ROWID
+        """)
+
+        # 定时任务运行台账（每个任务最近一次运行与最近一次成功，重启后据此补跑或跳过）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_runs (
+                job_id VARCHAR(50) PRIMARY KEY,
+                last_started_at DATETIME,
+                last_finished_at DATETIME,
+                last_success_at DATETIME,
+                last_status VARCHAR(10),
+                last_error TEXT,
+                last_duration REAL,
+                run_count INTEGER NOT NULL DEFAULT 0,
+                failure_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        # 列式归档进度（各表已导出到 Parquet 的最后一个交易日，见 archive.py）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive_state (
+                table_name VARCHAR(50) PRIMARY KEY,
+                archived_through INTEGER NOT NULL,
+                rows_archived INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME
+            )
+        """)
+
         # 创建索引以提高查询性能
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_realtime_symbol ON stock_realtime(symbol)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_daily_symbol_date ON stock_daily(symbol, trade_date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_index_realtime_symbol ON index_realtime(symbol)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS hot.idx_stock_realtime_symbol ON stock_realtime(symbol)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS hot.idx_index_realtime_symbol ON index_realtime(symbol)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_news_symbol ON stock_news(symbol)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_news_publish_time ON stock_news(publish_time)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_policy_news_publish_time ON policy_news(publish_time)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_fund_flow_symbol_date ON fund_flow(symbol, trade_date)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_margin_trading_symbol_date ON margin_trading(symbol, trade_date)")
 
         # Agent 相关索引
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON chat_sessions(user_id)")
@@ -269,325 +674,414 @@ def init_database():
         print("数据库初始化完成")
 
 
-# ==================== 数据操作函数 ====================
-
-def upsert_stock_realtime(data: List[Dict[str, Any]]):
-    """批量更新/插入个股实时行情"""
+# ==================== 批量写入引擎 ====================
+
+# 各表写入规格（表驱动）:
+#   columns  - 写入列，按参数顺序从记录字典中取值
+#   conflict - 冲突键；为 None 时使用 INSERT OR IGNORE（忽略重复）
+#   stamp    - 写入时自动填充当前时间的列
+#   compact  - 紧凑时间编码（聚簇表）：trade_date 写为 YYYYMMDD 整数，stamp 写为 Unix 秒
+#   store    - 写入的库：'hot' 写热库；'hot_current_day' 当日的行写热库、其余写冷库；缺省写冷库
+# 冲突时更新除冲突键外的全部列
+TABLE_SPECS: Dict[str, Dict[str, Any]] = {
+    'stock_realtime': {
+        'columns': [
+            'symbol', 'name', 'price', 'change_pct', 'change_amount',
+            'volume', 'amount', 'high', 'low', 'open', 'prev_close',
+            'amplitude', 'volume_ratio', 'turnover_rate',
+            'pe_ratio', 'pb_ratio', 'total_market_cap', 'circulating_market_cap',
+        ],
+        'conflict': ['symbol'],
+        'stamp': 'updated_at',
+        'store': 'hot',
+    },
+    'stock_daily': {
+        'columns': [
+            'symbol', 'trade_date', 'open', 'high', 'low', 'close',
+            'volume', 'amount', 'amplitude', 'change_pct', 'change_amount', 'turnover_rate',
+        ],
+        'conflict': ['symbol', 'trade_date'],
+        'stamp': None,
+        'compact': True,
+    },
+    'index_realtime': {
+        'columns': [
+            'symbol', 'name', 'price', 'change_pct', 'change_amount',
+            'volume', 'amount', 'high', 'low', 'open', 'prev_close', 'amplitude',
+        ],
+        'conflict': ['symbol'],
+        'stamp': 'updated_at',
+        'store': 'hot',
+    },
+    'stock_news': {
+        'columns': ['symbol', 'title', 'content', 'source', 'publish_time', 'url'],
+        'conflict': None,
+        'stamp': 'created_at',
+    },
+    'policy_news': {
+        'columns': ['title', 'content', 'source', 'publish_time', 'category'],
+        'conflict': None,
+        'stamp': 'created_at',
+    },
+    'fund_flow': {
+        'columns': [
+            'symbol', 'name', 'trade_date', 'close_price', 'change_pct',
+            'main_net_inflow', 'main_net_inflow_pct',
+            'super_large_net_inflow', 'super_large_net_inflow_pct',
+            'large_net_inflow', 'large_net_inflow_pct',
+            'medium_net_inflow', 'medium_net_inflow_pct',
+            'small_net_inflow', 'small_net_inflow_pct',
+        ],
+        'conflict': ['symbol', 'trade_date'],
+        'stamp': 'updated_at',
+        'compact': True,
+        'store': 'hot_current_day',
+    },
+    'margin_trading': {
+        'columns': [
+            'symbol', 'name', 'trade_date',
+            'margin_balance', 'margin_buy', 'margin_repay', 'margin_net_buy',
+            'short_balance', 'short_sell_volume', 'short_repay_volume', 'short_net_volume',
+            'margin_short_balance',
+        ],
+        'conflict': ['symbol', 'trade_date'],
+        'stamp': 'updated_at',
+        'compact': True,
+    },
+    'earnings_calendar': {
+        'columns': ['symbol', 'name', 'report_date', 'actual_date', 'report_type'],
+        'conflict': ['symbol', 'report_date', 'report_type'],
+        'stamp': 'updated_at',
+    },
+    'row_fingerprints': {
+        'columns': ['table_name', 'symbol', 'fingerprint'],
+        'conflict': ['table_name', 'symbol'],
+        'stamp': None,
+    },
+    'quote_ticks': {
+        'columns': ['trade_date', 'symbol_id', 'ts', 'price', 'volume', 'amount'],
+        'conflict': None,
+        'stamp': None,
+    },
+    'table_heartbeat': {
+        'columns': ['table_name', 'rows_seen', 'rows_written'],
+        'conflict': ['table_name'],
+        'stamp': 'last_seen_at',
+    },
+    'backfill_checkpoints': {
+        'columns': ['job_id', 'unit_id', 'dataset', 'payload', 'status', 'rows', 'error'],
+        'conflict': ['job_id', 'unit_id'],
+        'stamp': 'updated_at',
+    },
+    'trade_calendar': {
+        'columns': ['trade_date'],
+        'conflict': None,
+        'stamp': None,
+    },
+    'portfolio_symbols': {
+        'columns': ['user_id', 'symbol', 'status'],
+        'conflict': ['user_id', 'symbol'],
+        'stamp': 'updated_at',
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def _build_upsert_sql(table: str, target: Optional[str] = None) -> str:
+    """根据表规格生成批量写入 SQL（target 为带库名的目标表，缺省为 table）"""
+    spec = TABLE_SPECS[table]
+    columns = list(spec['columns'])
+    if spec['stamp']:
+        columns.append(spec['stamp'])
+    placeholders = ', '.join('?' for _ in columns)
+    target = target or table
+
+    if spec['conflict'] is None:
+        return f"INSERT OR IGNORE INTO {target} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    updates = ',\n                '.join(
+        f"{col} = excluded.{col}" for col in columns if col not in spec['conflict']
+    )
+    return f"""
+        INSERT INTO {target} ({', '.join(columns)}) VALUES ({placeholders})
+        ON CONFLICT({', '.join(spec['conflict'])}) DO UPDATE SET
+                {updates}
+    """
+
+
+def date_to_int(value: Any) -> Optional[int]:
+    """'YYYY-MM-DD' / 'YYYYMMDD' / date -> YYYYMMDD 整数"""
+    if value is None or value == '' or isinstance(value, int):
+        return value
+    if hasattr(value, 'strftime'):
+        return int(value.strftime('%Y%m%d'))
+    return int(str(value)[:10].replace('-', ''))
+
+
+def int_to_date(value: Optional[int]) -> Optional[str]:
+    """YYYYMMDD 整数 -> 'YYYY-MM-DD'"""
+    if value is None:
+        return None
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+
+def _decode_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """聚簇表的行 -> 与旧结构一致的字典（日期为 'YYYY-MM-DD'，更新时间为本地 ISO 时间）"""
+    record = dict(row)
+    if 'trade_date' in record:
+        record['trade_date'] = int_to_date(record['trade_date'])
+    if record.get('updated_at') is not None:
+        record['updated_at'] = datetime.fromtimestamp(record['updated_at']).isoformat(sep=' ')
+    return record
+
+
+def _build_params(table: str, data: List[Dict[str, Any]]) -> List[tuple]:
+    """按列规格把记录字典转换为参数元组"""
+    spec = TABLE_SPECS[table]
+    columns = spec['columns']
+    if spec.get('compact'):
+        date_index = columns.index('trade_date')
+        stamp = (int(time.time()),) if spec['stamp'] else ()
+        params = []
+        for item in data:
+            values = list(map(item.get, columns))
+            values[date_index] = date_to_int(values[date_index])
+            params.append(tuple(values) + stamp)
+        return params
+    if spec['stamp']:
+        stamp = (datetime.now().isoformat(),)
+        return [tuple(map(item.get, columns)) + stamp for item in data]
+    return [tuple(map(item.get, columns)) for item in data]
+
+
+def _route(table: str, data: List[Dict[str, Any]]) -> List[tuple]:
+    """按表规格的 store 把记录分配到冷热两库: [(目标表, 记录), ...]"""
+    store = TABLE_SPECS[table].get('store')
+    if store is None:
+        return [(table, data)]
+    if store == 'hot':
+        return [(f"hot.{table}", data)]
+
+    today = date_to_int(datetime.now(_CHINA_TZ).date())
+    current, closed = [], []
+    for item in data:
+        (current if (date_to_int(item.get('trade_date')) or 0) >= today else closed).append(item)
+    return [(target, rows) for target, rows in ((f"hot.{table}", current), (f"main.{table}", closed)) if rows]
+
+
+def execute_bulk(conn: sqlite3.Connection, table: str, data: List[Dict[str, Any]],
+                 chunk_size: Optional[int] = None):
+    """在给定连接上分块执行批量写入（不提交，由调用方控制事务）"""
+    chunk_size = chunk_size or CONFIG['db_batch_size']
+    cursor = conn.cursor()
+    _mark_changed(table)
+    for target, rows in _route(table, data):
+        sql = _build_upsert_sql(table, target)
+        for offset in range(0, len(rows), chunk_size):
+            cursor.executemany(sql, _build_params(table, rows[offset:offset + chunk_size]))
+
+
+# 单写线程（见 writer.py）启动后，写入请求交给它合并为组提交
+_writer = None
+
+
+def set_writer(writer):
+    """注册/注销单写线程，传 None 恢复直接写入"""
+    global _writer
+    _writer = writer
+
+
+def bulk_upsert(table: str, data: List[Dict[str, Any]], chunk_size: Optional[int] = None) -> int:
+    """
+    通用批量写入
+
+    参数:
+        table: 表名，必须在 TABLE_SPECS 中声明
+        data: 记录字典列表，缺失字段写入 NULL
+        chunk_size: 每次 executemany 的行数，默认取 CONFIG['db_batch_size']
+
+    返回: 提交（或排队）的行数
+    """
     if not data:
-        return
+        return 0
+
+    writer = _writer
+    if writer is not None and not writer.is_writer_thread():
+        writer.submit(table, data)
+        return len(data)
 
+    started = time.perf_counter()
     with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            cursor.execute("""
-                INSERT INTO stock_realtime (
-                    symbol, name, price, change_pct, change_amount,
-                    volume, amount, high, low, open, prev_close,
-                    amplitude, volume_ratio, turnover_rate,
-                    pe_ratio, pb_ratio, total_market_cap, circulating_market_cap,
-                    updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol) DO UPDATE SET
-                    name = excluded.name,
-                    price = excluded.price,
-                    change_pct = excluded.change_pct,
-                    change_amount = excluded.change_amount,
-                    volume = excluded.volume,
-                    amount = excluded.amount,
-                    high = excluded.high,
-                    low = excluded.low,
-                    open = excluded.open,
-                    prev_close = excluded.prev_close,
-                    amplitude = excluded.amplitude,
-                    volume_ratio = excluded.volume_ratio,
-                    turnover_rate = excluded.turnover_rate,
-                    pe_ratio = excluded.pe_ratio,
-                    pb_ratio = excluded.pb_ratio,
-                    total_market_cap = excluded.total_market_cap,
-                    circulating_market_cap = excluded.circulating_market_cap,
-                    updated_at = excluded.updated_at
-            """, (
-                item.get('symbol'),
-                item.get('name'),
-                item.get('price'),
-                item.get('change_pct'),
-                item.get('change_amount'),
-                item.get('volume'),
-                item.get('amount'),
-                item.get('high'),
-                item.get('low'),
-                item.get('open'),
-                item.get('prev_close'),
-                item.get('amplitude'),
-                item.get('volume_ratio'),
-                item.get('turnover_rate'),
-                item.get('pe_ratio'),
-                item.get('pb_ratio'),
-                item.get('total_market_cap'),
-                item.get('circulating_market_cap'),
-                datetime.now().isoformat()
-            ))
+        execute_bulk(conn, table, data, chunk_size)
+
+    elapsed = time.perf_counter() - started
+    metrics.DB_WRITE_LATENCY.observe(elapsed, mode='direct')
+    metrics.ROWS_WRITTEN.inc(len(data), job=metrics.current_job() or 'manual', table=table)
+    rate = len(data) / elapsed if elapsed > 0 else float('inf')
+    print(f"[bulk] {table}: 写入 {len(data)} 行, 耗时 {elapsed:.3f}s ({rate:.0f} 行/秒)")
+    return len(data)
+
+
+def bulk_upsert_group(items: List[tuple], on_commit=None, on_drop=None) -> int:
+    """
+    多表批量写入，作为一个整体提交（写入线程也不会拆开重试）
+
+    参数:
+        items: [(表名, 记录列表), ...]
+        on_commit: 提交成功后的回调
+        on_drop: 写入失败、数据被丢弃时的回调
+
+    返回: 提交（或排队）的行数
+    """
+    items = [(table, data) for table, data in items if data]
+    rows = sum(len(data) for _, data in items)
+    if not items:
+        if on_commit is not None:
+            on_commit()
+        return 0
+
+    writer = _writer
+    if writer is not None and not writer.is_writer_thread():
+        writer.submit_group(items, on_commit, on_drop)
+        return rows
+
+    started = time.perf_counter()
+    with get_db() as conn:
+        after_transaction(on_commit, on_drop)
+        for table, data in items:
+            execute_bulk(conn, table, data)
 
+    metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - started, mode='direct')
+    for table, data in items:
+        metrics.ROWS_WRITTEN.inc(len(data), job=metrics.current_job() or 'manual', table=table)
+    return rows
 
-def upsert_stock_daily(data: List[Dict[str, Any]]):
-    """批量更新/插入日K线数据"""
-    if not data:
-        return
 
-    with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            cursor.execute("""
-                INSERT INTO stock_daily (
-                    symbol, trade_date, open, high, low, close,
-                    volume, amount, amplitude, change_pct, change_amount, turnover_rate
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, trade_date) DO UPDATE SET
-                    open = excluded.open,
-                    high = excluded.high,
-                    low = excluded.low,
-                    close = excluded.close,
-                    volume = excluded.volume,
-                    amount = excluded.amount,
-                    amplitude = excluded.amplitude,
-                    change_pct = excluded.change_pct,
-                    change_amount = excluded.change_amount,
-                    turnover_rate = excluded.turnover_rate
-            """, (
-                item.get('symbol'),
-                item.get('trade_date'),
-                item.get('open'),
-                item.get('high'),
-                item.get('low'),
-                item.get('close'),
-                item.get('volume'),
-                item.get('amount'),
-                item.get('amplitude'),
-                item.get('change_pct'),
-                item.get('change_amount'),
-                item.get('turnover_rate')
-            ))
+# ==================== 变更检测 ====================
 
+# 表名 -> {symbol: 指纹}，首次使用时从 row_fingerprints 加载
+_fingerprints: Dict[str, Dict[str, int]] = {}
+_fingerprints_lock = threading.Lock()
+
+
+def _fingerprint(values: tuple) -> int:
+    """行内容指纹（稳定哈希，可跨进程持久化）"""
+    digest = hashlib.blake2b(repr(values).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
 
-def upsert_index_realtime(data: List[Dict[str, Any]]):
-    """批量更新/插入指数实时行情"""
-    if not data:
-        return
 
+def _load_fingerprints(table: str) -> Dict[str, int]:
     with get_db() as conn:
-        cursor = conn.cursor()
+        rows = conn.execute(
+            "SELECT symbol, fingerprint FROM row_fingerprints WHERE table_name = ?", (table,)
+        ).fetchall()
+    return {row['symbol']: row['fingerprint'] for row in rows}
+
+
+def upsert_changed(table: str, data: List[Dict[str, Any]]) -> int:
+    """
+    仅写入行情字段发生变化的行
+
+    以 symbol 为键比较行内容指纹（不含 updated_at），未变化的行跳过；
+    每个周期写一次 table_heartbeat 记录数据新鲜度
+
+    返回: 实际写入的行数
+    """
+    if not data:
+        return 0
+
+    columns = TABLE_SPECS[table]['columns']
+    changed, fingerprints = [], []
+    with _fingerprints_lock:
+        cache = _fingerprints.get(table)
+        if cache is None:
+            cache = _fingerprints[table] = _load_fingerprints(table)
         for item in data:
-            cursor.execute("""
-                INSERT INTO index_realtime (
-                    symbol, name, price, change_pct, change_amount,
-                    volume, amount, high, low, open, prev_close, amplitude, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol) DO UPDATE SET
-                    name = excluded.name,
-                    price = excluded.price,
-                    change_pct = excluded.change_pct,
-                    change_amount = excluded.change_amount,
-                    volume = excluded.volume,
-                    amount = excluded.amount,
-                    high = excluded.high,
-                    low = excluded.low,
-                    open = excluded.open,
-                    prev_close = excluded.prev_close,
-                    amplitude = excluded.amplitude,
-                    updated_at = excluded.updated_at
-            """, (
-                item.get('symbol'),
-                item.get('name'),
-                item.get('price'),
-                item.get('change_pct'),
-                item.get('change_amount'),
-                item.get('volume'),
-                item.get('amount'),
-                item.get('high'),
-                item.get('low'),
-                item.get('open'),
-                item.get('prev_close'),
-                item.get('amplitude'),
-                datetime.now().isoformat()
-            ))
+            symbol = item.get('symbol')
+            fingerprint = _fingerprint(tuple(map(item.get, columns)))
+            if cache.get(symbol) != fingerprint:
+                changed.append(item)
+                fingerprints.append({'table_name': table, 'symbol': symbol, 'fingerprint': fingerprint})
+
+    # 内存指纹只在行提交后更新；写入失败被丢弃时移除这些股票的指纹，下一轮重新写入
+    def on_commit():
+        with _fingerprints_lock:
+            cache.update((row['symbol'], row['fingerprint']) for row in fingerprints)
+
+    def on_drop():
+        with _fingerprints_lock:
+            for row in fingerprints:
+                cache.pop(row['symbol'], None)
+
+    # 行、指纹与心跳在同一事务内提交
+    bulk_upsert_group([
+        (table, changed),
+        ('row_fingerprints', fingerprints),
+        ('table_heartbeat', [{'table_name': table, 'rows_seen': len(data), 'rows_written': len(changed)}]),
+    ], on_commit, on_drop)
+
+    skipped = len(data) - len(changed)
+    print(f"[变更检测] {table}: {len(data)} 行中 {skipped} 行未变化已跳过 "
+          f"(跳过率 {skipped / len(data):.1%})")
+    return len(changed)
+
+
+# ==================== 数据操作函数 ====================
+
+def upsert_stock_realtime(data: List[Dict[str, Any]]):
+    """批量更新/插入个股实时行情（跳过未变化的行）"""
+    upsert_changed('stock_realtime', data)
+
+
+def upsert_stock_daily(data: List[Dict[str, Any]]):
+    """批量更新/插入日K线数据"""
+    bulk_upsert('stock_daily', data)
+
+
+def upsert_index_realtime(data: List[Dict[str, Any]]):
+    """批量更新/插入指数实时行情（跳过未变化的行）"""
+    upsert_changed('index_realtime', data)
 
 
 def insert_stock_news(data: List[Dict[str, Any]]):
     """批量插入个股新闻（忽略重复）"""
-    if not data:
-        return
-
-    with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            try:
-                cursor.execute("""
-                    INSERT OR IGNORE INTO stock_news (
-                        symbol, title, content, source, publish_time, url, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    item.get('symbol'),
-                    item.get('title'),
-                    item.get('content'),
-                    item.get('source'),
-                    item.get('publish_time'),
-                    item.get('url'),
-                    datetime.now().isoformat()
-                ))
-            except sqlite3.IntegrityError:
-                pass  # 忽略重复
+    bulk_upsert('stock_news', data)
 
 
 def insert_policy_news(data: List[Dict[str, Any]]):
     """批量插入政策新闻（忽略重复）"""
-    if not data:
-        return
-
-    with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            try:
-                cursor.execute("""
-                    INSERT OR IGNORE INTO policy_news (
-                        title, content, source, publish_time, category, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    item.get('title'),
-                    item.get('content'),
-                    item.get('source'),
-                    item.get('publish_time'),
-                    item.get('category'),
-                    datetime.now().isoformat()
-                ))
-            except sqlite3.IntegrityError:
-                pass
+    bulk_upsert('policy_news', data)
 
 
 def upsert_fund_flow(data: List[Dict[str, Any]]):
     """批量更新/插入资金流向"""
-    if not data:
-        return
-
-    with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            cursor.execute("""
-                INSERT INTO fund_flow (
-                    symbol, name, trade_date, close_price, change_pct,
-                    main_net_inflow, main_net_inflow_pct,
-                    super_large_net_inflow, super_large_net_inflow_pct,
-                    large_net_inflow, large_net_inflow_pct,
-                    medium_net_inflow, medium_net_inflow_pct,
-                    small_net_inflow, small_net_inflow_pct,
-                    updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, trade_date) DO UPDATE SET
-                    name = excluded.name,
-                    close_price = excluded.close_price,
-                    change_pct = excluded.change_pct,
-                    main_net_inflow = excluded.main_net_inflow,
-                    main_net_inflow_pct = excluded.main_net_inflow_pct,
-                    super_large_net_inflow = excluded.super_large_net_inflow,
-                    super_large_net_inflow_pct = excluded.super_large_net_inflow_pct,
-                    large_net_inflow = excluded.large_net_inflow,
-                    large_net_inflow_pct = excluded.large_net_inflow_pct,
-                    medium_net_inflow = excluded.medium_net_inflow,
-                    medium_net_inflow_pct = excluded.medium_net_inflow_pct,
-                    small_net_inflow = excluded.small_net_inflow,
-                    small_net_inflow_pct = excluded.small_net_inflow_pct,
-                    updated_at = excluded.updated_at
-            """, (
-                item.get('symbol'),
-                item.get('name'),
-                item.get('trade_date'),
-                item.get('close_price'),
-                item.get('change_pct'),
-                item.get('main_net_inflow'),
-                item.get('main_net_inflow_pct'),
-                item.get('super_large_net_inflow'),
-                item.get('super_large_net_inflow_pct'),
-                item.get('large_net_inflow'),
-                item.get('large_net_inflow_pct'),
-                item.get('medium_net_inflow'),
-                item.get('medium_net_inflow_pct'),
-                item.get('small_net_inflow'),
-                item.get('small_net_inflow_pct'),
-                datetime.now().isoformat()
-            ))
+    bulk_upsert('fund_flow', data)
 
 
 def upsert_margin_trading(data: List[Dict[str, Any]]):
     """批量更新/插入融资融券数据"""
-    if not data:
-        return
-
-    with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            cursor.execute("""
-                INSERT INTO margin_trading (
-                    symbol, name, trade_date,
-                    margin_balance, margin_buy, margin_repay, margin_net_buy,
-                    short_balance, short_sell_volume, short_repay_volume, short_net_volume,
-                    margin_short_balance, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, trade_date) DO UPDATE SET
-                    name = excluded.name,
-                    margin_balance = excluded.margin_balance,
-                    margin_buy = excluded.margin_buy,
-                    margin_repay = excluded.margin_repay,
-                    margin_net_buy = excluded.margin_net_buy,
-                    short_balance = excluded.short_balance,
-                    short_sell_volume = excluded.short_sell_volume,
-                    short_repay_volume = excluded.short_repay_volume,
-                    short_net_volume = excluded.short_net_volume,
-                    margin_short_balance = excluded.margin_short_balance,
-                    updated_at = excluded.updated_at
-            """, (
-                item.get('symbol'),
-                item.get('name'),
-                item.get('trade_date'),
-                item.get('margin_balance'),
-                item.get('margin_buy'),
-                item.get('margin_repay'),
-                item.get('margin_net_buy'),
-                item.get('short_balance'),
-                item.get('short_sell_volume'),
-                item.get('short_repay_volume'),
-                item.get('short_net_volume'),
-                item.get('margin_short_balance'),
-                datetime.now().isoformat()
-            ))
+    bulk_upsert('margin_trading', data)
 
 
 def upsert_earnings_calendar(data: List[Dict[str, Any]]):
     """批量更新/插入财报日历"""
-    if not data:
-        return
+    bulk_upsert('earnings_calendar', data)
+
+
+def upsert_portfolio_symbols(data: List[Dict[str, Any]]):
+    """批量登记用户持仓/自选股票 [{'user_id', 'symbol', 'status'}, ...]"""
+    bulk_upsert('portfolio_symbols', data)
+
 
+def delete_portfolio_symbol(user_id: str, symbol: str):
+    """移除用户的一只持仓/自选股票"""
     with get_db() as conn:
-        cursor = conn.cursor()
-        for item in data:
-            cursor.execute("""
-                INSERT INTO earnings_calendar (
-                    symbol, name, report_date, actual_date, report_type, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, report_date, report_type) DO UPDATE SET
-                    name = excluded.name,
-                    actual_date = excluded.actual_date,
-                    updated_at = excluded.updated_at
-            """, (
-                item.get('symbol'),
-                item.get('name'),
-                item.get('report_date'),
-                item.get('actual_date'),
-                item.get('report_type'),
-                datetime.now().isoformat()
-            ))
+        conn.execute("DELETE FROM portfolio_symbols WHERE user_id = ? AND symbol = ?", (user_id, symbol))
 
 
 # ==================== 查询函数 ====================
 
+@cached('stock_realtime')
 def get_stock_realtime(symbol: Optional[str] = None) -> List[Dict]:
     """查询个股实时行情"""
     with get_db() as conn:
@@ -599,6 +1093,7 @@ def get_stock_realtime(symbol: Optional[str] = None) -> List[Dict]:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@cached('stock_daily')
 def get_stock_daily(symbol: str, limit: int = 30) -> List[Dict]:
     """查询个股日K线"""
     with get_db() as conn:
@@ -609,9 +1104,537 @@ def get_stock_daily(symbol: str, limit: int = 30) -> List[Dict]:
             ORDER BY trade_date DESC
             LIMIT ?
         """, (symbol, limit))
+        return [_decode_row(row) for row in cursor.fetchall()]
+
+
+def _chunked(items: List[str], size: int = 500):
+    """按 SQLite 参数个数上限切分 IN 列表"""
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def get_daily_high_water_marks(symbols: List[str]) -> Dict[str, str]:
+    """一次查询各股票已入库的最新交易日 {symbol: 'YYYY-MM-DD'}，无数据的股票不在结果中"""
+    marks = {}
+    with get_db() as conn:
+        for chunk in _chunked(list(symbols)):
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = conn.execute(f"""
+                SELECT symbol, MAX(trade_date) AS last_date
+                FROM stock_daily
+                WHERE symbol IN ({placeholders})
+                GROUP BY symbol
+            """, chunk).fetchall()
+            marks.update((row['symbol'], int_to_date(row['last_date'])) for row in rows)
+    return marks
+
+
+def find_daily_gaps(symbols: List[str], min_gap_days: int) -> List[tuple]:
+    """
+    查找日K线中的缺口（相邻两条记录相隔超过 min_gap_days 个自然日）
+
+    返回: [(symbol, 缺口前一交易日, 缺口后一交易日), ...]
+    """
+    gaps = []
+    with get_db() as conn:
+        for chunk in _chunked(list(symbols)):
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = conn.execute(f"""
+                SELECT symbol, prev_date, trade_date FROM (
+                    SELECT symbol, trade_date,
+                           LAG(trade_date) OVER (PARTITION BY symbol ORDER BY trade_date) AS prev_date
+                    FROM stock_daily
+                    WHERE symbol IN ({placeholders})
+                )
+                WHERE prev_date IS NOT NULL
+                  AND julianday(printf('%04d-%02d-%02d', trade_date / 10000, trade_date / 100 % 100, trade_date % 100))
+                    - julianday(printf('%04d-%02d-%02d', prev_date / 10000, prev_date / 100 % 100, prev_date % 100)) > ?
+            """, (*chunk, min_gap_days)).fetchall()
+            gaps.extend((row['symbol'], int_to_date(row['prev_date']), int_to_date(row['trade_date'])) for row in rows)
+    return gaps
+
+
+def create_backfill_units(job_id: str, dataset: str, units: List[tuple]):
+    """登记回填工作单元 [(unit_id, payload), ...]；已存在的单元（含已完成）保持不变"""
+    with get_db() as conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO backfill_checkpoints (job_id, unit_id, dataset, payload, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(job_id, unit_id, dataset, payload, datetime.now().isoformat()) for unit_id, payload in units])
+
+
+def get_backfill_units(job_id: str, pending_only: bool = True) -> List[Dict]:
+    """查询回填工作单元，默认只返回未完成（pending/failed）的单元"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if pending_only:
+            cursor.execute("""
+                SELECT * FROM backfill_checkpoints
+                WHERE job_id = ? AND status != 'done'
+                ORDER BY unit_id
+            """, (job_id,))
+        else:
+            cursor.execute("SELECT * FROM backfill_checkpoints WHERE job_id = ? ORDER BY unit_id", (job_id,))
         return [dict(row) for row in cursor.fetchall()]
 
 
+def get_trade_calendar() -> List[str]:
+    """查询已缓存的全部交易日（'YYYY-MM-DD'，升序）"""
+    with get_db() as conn:
+        rows = conn.execute("SELECT trade_date FROM trade_calendar ORDER BY trade_date").fetchall()
+        return [row['trade_date'] for row in rows]
+
+
+def get_portfolio_symbol_counts() -> tuple:
+    """
+    全量读取股票池引用计数
+
+    返回: ({symbol: 持有/自选的用户数}, 变更日志当前最大 id)
+    """
+    with get_db() as conn:
+        # 单条语句读取，计数与变更日志位置来自同一快照；日志行会被清理，位置取 AUTOINCREMENT 序号
+        rows = conn.execute("""
+            SELECT seq.last_id, counts.symbol, counts.refs
+            FROM (SELECT COALESCE(MAX(seq), 0) AS last_id FROM sqlite_sequence
+                  WHERE name = 'portfolio_symbol_changes') AS seq
+            LEFT JOIN (SELECT symbol, COUNT(*) AS refs FROM portfolio_symbols GROUP BY symbol) AS counts ON 1
+        """).fetchall()
+    return {row['symbol']: row['refs'] for row in rows if row['symbol'] is not None}, rows[0]['last_id']
+
+
+def get_portfolio_symbol_changes(after_id: int) -> Optional[List[Dict]]:
+    """
+    增量读取 id 大于 after_id 的股票池变更
+
+    after_id 之后的变更已被清理（其他进程已应用并删除）时返回 None，调用方需全量重新加载
+    """
+    with get_db() as conn:
+        # AUTOINCREMENT 的 id 连续且不复用：after_id 之后应有 seq - after_id 条变更
+        seq = conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'portfolio_symbol_changes'"
+        ).fetchone()
+        last_id = seq[0] if seq else 0
+        rows = conn.execute("""
+            SELECT id, symbol, delta FROM portfolio_symbol_changes
+            WHERE id > ? AND id <= ?
+            ORDER BY id
+        """, (after_id, last_id)).fetchall()
+        if len(rows) != max(last_id - after_id, 0):
+            return None
+        return [dict(row) for row in rows]
+
+
+def prune_portfolio_symbol_changes(older_than_days: int) -> int:
+    """
+    删除 older_than_days 天之前的股票池变更，返回删除行数
+
+    按时间而不是按某个进程的读取进度清理：各采集进程都有足够时间增量应用，
+    落后超过保留期的进程读到 None 后全量重新加载（changed_at 为 UTC）
+    """
+    with get_db() as conn:
+        return conn.execute(
+            "DELETE FROM portfolio_symbol_changes WHERE changed_at < datetime('now', ?)",
+            (f"-{older_than_days} days",),
+        ).rowcount
+
+
+def get_symbol_reads() -> Dict[str, int]:
+    """查询各股票的累计读取次数"""
+    with get_db() as conn:
+        rows = conn.execute("SELECT symbol, reads FROM symbol_reads").fetchall()
+        return {row['symbol']: row['reads'] for row in rows}
+
+
+def get_symbols_read_since(minutes: float) -> List[str]:
+    """最近 minutes 分钟内被读取过的股票（last_read_at 为 UTC）"""
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT symbol FROM symbol_reads WHERE last_read_at >= datetime('now', ?)",
+            (f"-{minutes} minutes",),
+        ).fetchall()
+        return [row['symbol'] for row in rows]
+
+
+def get_realtime_change_pct(symbols: List[str]) -> Dict[str, float]:
+    """查询股票最新涨跌幅（用于按波动分配刷新频率）"""
+    result = {}
+    with get_db() as conn:
+        for chunk in _chunked(list(symbols)):
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = conn.execute(f"""
+                SELECT symbol, change_pct FROM stock_realtime
+                WHERE symbol IN ({placeholders}) AND change_pct IS NOT NULL
+            """, chunk).fetchall()
+            result.update((row['symbol'], row['change_pct']) for row in rows)
+    return result
+
+
+def get_latest_value(table: str, column: str, where: str = '', params: tuple = ()) -> Optional[str]:
+    """查询某表某列的最大值（用于判断数据新鲜度），表为空时返回 None"""
+    with get_db() as conn:
+        row = conn.execute(f"SELECT MAX({column}) FROM {table} {where}", params).fetchone()
+        return row[0] if row else None
+
+
+# ==================== 快照历史与分钟K线 ====================
+
+# 北京时间（无夏令时，固定 UTC+8），交易日与 K 线时间均按北京时间划分
+_CHINA_TZ = timezone(timedelta(hours=8))
+
+# (kind, symbol) -> id，进程内缓存，编号一经分配不再变化
+_symbol_ids: Dict[tuple, int] = {}
+_symbol_ids_lock = threading.Lock()
+
+
+def get_symbol_ids(kind: str, symbols: List[str]) -> Dict[str, int]:
+    """
+    查询（必要时分配）证券整数编号
+
+    新编号需要立即读回，直接写库，不经过写入线程
+    """
+    with _symbol_ids_lock:
+        missing = [s for s in dict.fromkeys(symbols) if (kind, s) not in _symbol_ids]
+        if missing:
+            with get_db() as conn:
+                conn.executemany("INSERT OR IGNORE INTO symbol_ids (kind, symbol) VALUES (?, ?)",
+                                 [(kind, s) for s in missing])
+                for chunk in _chunked(missing):
+                    placeholders = ', '.join('?' for _ in chunk)
+                    rows = conn.execute(f"""
+                        SELECT id, symbol FROM symbol_ids WHERE kind = ? AND symbol IN ({placeholders})
+                    """, [kind, *chunk]).fetchall()
+                    for row in rows:
+                        _symbol_ids[(kind, row['symbol'])] = row['id']
+        return {s: _symbol_ids[(kind, s)] for s in symbols if (kind, s) in _symbol_ids}
+
+
+def append_quote_ticks(kind: str, data: List[Dict[str, Any]], ts: Optional[int] = None) -> int:
+    """把一次行情快照追加到 quote_ticks（kind: stock / index）"""
+    if not data:
+        return 0
+    ts = int(ts if ts is not None else time.time())
+    trade_date = int(datetime.fromtimestamp(ts, _CHINA_TZ).strftime('%Y%m%d'))
+    ids = get_symbol_ids(kind, [item['symbol'] for item in data])
+    ticks = [
+        {
+            'trade_date': trade_date,
+            'symbol_id': ids[item['symbol']],
+            'ts': ts,
+            'price': item.get('price'),
+            'volume': item.get('volume'),
+            'amount': item.get('amount'),
+        }
+        for item in data
+        if item.get('price') is not None and item['symbol'] in ids
+    ]
+    return bulk_upsert('quote_ticks', ticks)
+
+
+# 按 K 线周期聚合某交易日的快照：开/收取周期内第一/最后一笔，量额由累计值差分得到
+_COMPACT_SQL = """
+    INSERT INTO quote_bars (period, symbol_id, bar_ts, trade_date, open, high, low, close, volume, amount)
+    SELECT :period, symbol_id, bar_ts, trade_date, open, high, low, close,
+           cum_volume - LAG(cum_volume, 1, 0) OVER w,
+           cum_amount - LAG(cum_amount, 1, 0) OVER w
+    FROM (
+        SELECT symbol_id, trade_date, bar_ts,
+               MAX(CASE WHEN first_rank = 1 THEN price END) AS open,
+               MAX(price) AS high,
+               MIN(price) AS low,
+               MAX(CASE WHEN last_rank = 1 THEN price END) AS close,
+               MAX(volume) AS cum_volume,
+               MAX(amount) AS cum_amount
+        FROM (
+            SELECT symbol_id, trade_date, ts - ts % :period AS bar_ts, price, volume, amount,
+                   ROW_NUMBER() OVER (PARTITION BY symbol_id, ts - ts % :period ORDER BY ts) AS first_rank,
+                   ROW_NUMBER() OVER (PARTITION BY symbol_id, ts - ts % :period ORDER BY ts DESC) AS last_rank
+            FROM quote_ticks
+            WHERE trade_date = :trade_date
+        )
+        GROUP BY symbol_id, trade_date, bar_ts
+    )
+    WHERE true
+    WINDOW w AS (PARTITION BY symbol_id ORDER BY bar_ts)
+    ON CONFLICT(period, symbol_id, bar_ts) DO UPDATE SET
+        open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close,
+        volume = excluded.volume, amount = excluded.amount
+"""
+
+
+def compact_quote_ticks(trade_date: int, periods: List[int]) -> int:
+    """把某交易日的快照压缩为各周期 K 线（可重复执行，结果覆盖），返回写入的 K 线数"""
+    total = 0
+    with get_db() as conn:
+        _mark_changed('quote_bars')
+        for period in periods:
+            cursor = conn.execute(_COMPACT_SQL, {'period': period, 'trade_date': trade_date})
+            total += cursor.rowcount
+    return total
+
+
+def get_tick_dates(before: Optional[int] = None) -> List[int]:
+    """快照历史中的交易日（可限定早于某日）"""
+    with get_db() as conn:
+        if before is None:
+            rows = conn.execute("SELECT DISTINCT trade_date FROM quote_ticks ORDER BY trade_date").fetchall()
+        else:
+            rows = conn.execute("SELECT DISTINCT trade_date FROM quote_ticks WHERE trade_date < ? "
+                                "ORDER BY trade_date", (before,)).fetchall()
+        return [row['trade_date'] for row in rows]
+
+
+def prune_quote_ticks(before: int) -> int:
+    """删除早于某交易日的快照，返回删除行数"""
+    with get_db() as conn:
+        return conn.execute("DELETE FROM quote_ticks WHERE trade_date < ?", (before,)).rowcount
+
+
+@cached('quote_bars')
+def get_intraday_bars(symbol: str, period: int = 60, trade_date: Optional[str] = None,
+                      kind: str = 'stock') -> List[Dict]:
+    """
+    查询分时 K 线
+
+    参数:
+        period: 60（1 分钟）或 300（5 分钟）
+        trade_date: 'YYYY-MM-DD'，默认取该股票最近一个有数据的交易日
+    返回: 按时间升序的 K 线，time 为北京时间 'YYYY-MM-DD HH:MM:SS'
+    """
+    with get_db() as conn:
+        row = conn.execute("SELECT id FROM symbol_ids WHERE kind = ? AND symbol = ?", (kind, symbol)).fetchone()
+        if row is None:
+            return []
+        symbol_id = row['id']
+        if trade_date is None:
+            latest = conn.execute("SELECT MAX(trade_date) FROM quote_bars WHERE period = ? AND symbol_id = ?",
+                                  (period, symbol_id)).fetchone()[0]
+            if latest is None:
+                return []
+            day = latest
+        else:
+            day = int(trade_date.replace('-', ''))
+        rows = conn.execute("""
+            SELECT bar_ts, open, high, low, close, volume, amount FROM quote_bars
+            WHERE period = ? AND symbol_id = ? AND trade_date = ?
+            ORDER BY bar_ts
+        """, (period, symbol_id, day)).fetchall()
+
+    bars = []
+    for row in rows:
+        bar = dict(row)
+        bar['time'] = datetime.fromtimestamp(bar.pop('bar_ts'), _CHINA_TZ).strftime('%Y-%m-%d %H:%M:%S')
+        bars.append(bar)
+    return bars
+
+
+# ==================== 任务台账 ====================
+
+def record_job_run(job_id: str, started_at: datetime, finished_at: datetime,
+                   status: str, error: Optional[str] = None):
+    """
+    记录一次任务运行（status: ok / failed / skipped）
+
+    只有 ok 更新 last_success_at；台账需要在重启前落盘，直接写库，不经过写入线程
+    """
+    with get_db() as conn:
+        conn.execute("""
+            INSERT INTO job_runs (job_id, last_started_at, last_finished_at, last_success_at,
+                                  last_status, last_error, last_duration, run_count, failure_count)
+            VALUES (?, ?, ?, CASE WHEN ? = 'ok' THEN ? END, ?, ?, ?, 1, CASE WHEN ? = 'failed' THEN 1 ELSE 0 END)
+            ON CONFLICT(job_id) DO UPDATE SET
+                last_started_at = excluded.last_started_at,
+                last_finished_at = excluded.last_finished_at,
+                last_success_at = COALESCE(excluded.last_success_at, job_runs.last_success_at),
+                last_status = excluded.last_status,
+                last_error = excluded.last_error,
+                last_duration = excluded.last_duration,
+                run_count = job_runs.run_count + 1,
+                failure_count = job_runs.failure_count + excluded.failure_count
+        """, (
+            job_id, started_at.isoformat(), finished_at.isoformat(),
+            status, finished_at.isoformat(), status, error,
+            (finished_at - started_at).total_seconds(), status,
+        ))
+
+
+def get_job_runs() -> Dict[str, Dict]:
+    """查询全部任务的运行台账"""
+    with get_db() as conn:
+        rows = conn.execute("SELECT * FROM job_runs").fetchall()
+        return {row['job_id']: dict(row) for row in rows}
+
+
+# ==================== 列式归档 ====================
+
+def _read_source(table: str) -> str:
+    """读取时使用的表名：冷热分库的表读合并视图"""
+    return f"{table}_all" if table in SPLIT_TABLES else table
+
+
+def get_market_years(table: str, after: int, through: int) -> List[int]:
+    """聚簇行情表在 (after, through] 区间内有数据的年份"""
+    with get_db() as conn:
+        rows = conn.execute(f"""
+            SELECT DISTINCT trade_date / 10000 AS year FROM {_read_source(table)}
+            WHERE trade_date > ? AND trade_date <= ?
+            ORDER BY year
+        """, (after, through)).fetchall()
+        return [row['year'] for row in rows]
+
+
+def get_market_rows(table: str, after: int, through: int,
+                    symbols: Optional[List[str]] = None) -> tuple:
+    """
+    读取聚簇行情表在 (after, through] 区间内的原始行（整数日期与时间戳不解码）
+
+    返回: (列名列表, [行元组, ...])
+    """
+    source = _read_source(table)
+    sql = f"SELECT * FROM {source} WHERE trade_date > ? AND trade_date <= ?"
+    with get_db() as conn:
+        columns = [col[0] for col in conn.execute(f"SELECT * FROM {source} LIMIT 0").description]
+        if symbols is None:
+            rows = conn.execute(sql, (after, through)).fetchall()
+        else:
+            rows = []
+            for chunk in _chunked(list(symbols)):
+                placeholders = ', '.join('?' for _ in chunk)
+                rows.extend(conn.execute(f"{sql} AND symbol IN ({placeholders})", (after, through, *chunk)))
+    return columns, [tuple(row) for row in rows]
+
+
+def prune_market_rows(table: str, keys: List[tuple]) -> int:
+    """删除冷库中指定 (symbol, trade_date) 的行，每只股票保留最新一行（增量同步的高水位），返回删除行数"""
+    with get_db() as conn:
+        _mark_changed(table)
+        return conn.executemany(f"""
+            DELETE FROM main.{table}
+            WHERE symbol = ? AND trade_date = ?
+              AND trade_date < (SELECT MAX(latest.trade_date) FROM main.{table} AS latest
+                                WHERE latest.symbol = {table}.symbol)
+        """, keys).rowcount
+
+
+def get_archive_watermarks() -> Dict[str, int]:
+    """各表已归档到的交易日 {table: YYYYMMDD}"""
+    with get_db() as conn:
+        rows = conn.execute("SELECT table_name, archived_through FROM archive_state").fetchall()
+        return {row['table_name']: row['archived_through'] for row in rows}
+
+
+def set_archive_watermark(table: str, archived_through: int, rows: int):
+    """记录归档进度（直接写库，归档文件写入后立即生效）"""
+    with get_db() as conn:
+        conn.execute("""
+            INSERT INTO archive_state (table_name, archived_through, rows_archived, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(table_name) DO UPDATE SET
+                archived_through = excluded.archived_through,
+                rows_archived = archive_state.rows_archived + excluded.rows_archived,
+                updated_at = excluded.updated_at
+        """, (table, archived_through, rows, datetime.now().isoformat()))
+
+
+# ==================== 冷热分库 ====================
+
+def rollover_hot(before: Optional[int] = None) -> Dict[str, int]:
+    """
+    把热库中已收盘交易日（早于 before，默认今天）的行移入冷库，返回 {table: 移动行数}
+
+    冷库已有同一交易日的行（收盘后的最终数据）时保留冷库的行
+    """
+    before = before or date_to_int(datetime.now(_CHINA_TZ).date())
+    moved = {}
+    with get_db() as conn:
+        _mark_changed(*SPLIT_TABLES)
+        for table in SPLIT_TABLES:
+            conn.execute(f"INSERT OR IGNORE INTO main.{table} SELECT * FROM hot.{table} WHERE trade_date < ?",
+                         (before,))
+            moved[table] = conn.execute(f"DELETE FROM hot.{table} WHERE trade_date < ?", (before,)).rowcount
+    # 热库只剩当日数据，截断其 WAL 使文件保持小巧
+    get_connection().execute("PRAGMA hot.wal_checkpoint(TRUNCATE)")
+    return moved
+
+
+# ==================== 分片租约 ====================
+# 租约与心跳需要立即生效并读回结果，直接写库，不经过写入线程
+
+def heartbeat_worker(worker_id: str, now: float, ttl: float) -> List[str]:
+    """记录进程心跳并清理失联进程，返回存活进程列表"""
+    with get_db() as conn:
+        conn.execute("""
+            INSERT INTO shard_workers (worker_id, heartbeat_at) VALUES (?, ?)
+            ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+        """, (worker_id, now))
+        conn.execute("DELETE FROM shard_workers WHERE heartbeat_at < ?", (now - ttl,))
+        rows = conn.execute("SELECT worker_id FROM shard_workers ORDER BY worker_id").fetchall()
+        return [row['worker_id'] for row in rows]
+
+
+def remove_worker(worker_id: str):
+    """进程退出：注销心跳并释放全部租约"""
+    with get_db() as conn:
+        conn.execute("DELETE FROM shard_workers WHERE worker_id = ?", (worker_id,))
+        conn.execute("UPDATE shard_leases SET owner = NULL, expires_at = 0 WHERE owner = ?", (worker_id,))
+
+
+def ensure_shards(shards: List[str]):
+    """确保租约表中存在全部分片"""
+    with get_db() as conn:
+        conn.executemany("INSERT OR IGNORE INTO shard_leases (shard) VALUES (?)", [(s,) for s in shards])
+
+
+def renew_leases(worker_id: str, expires_at: float) -> List[str]:
+    """续期本进程持有的租约，返回仍持有的分片"""
+    with get_db() as conn:
+        conn.execute("UPDATE shard_leases SET expires_at = ? WHERE owner = ?", (expires_at, worker_id))
+        rows = conn.execute("SELECT shard FROM shard_leases WHERE owner = ?", (worker_id,)).fetchall()
+        return [row['shard'] for row in rows]
+
+
+def claim_lease(shard: str, worker_id: str, now: float, expires_at: float) -> bool:
+    """认领无主或已过期的分片（单条 UPDATE，多进程并发认领时只有一个成功）"""
+    with get_db() as conn:
+        cursor = conn.execute("""
+            UPDATE shard_leases SET owner = ?, expires_at = ?
+            WHERE shard = ? AND (owner IS NULL OR owner = ? OR expires_at < ?)
+        """, (worker_id, expires_at, shard, worker_id, now))
+        return cursor.rowcount == 1
+
+
+def release_lease(shard: str, worker_id: str):
+    """释放本进程持有的分片，交给其他进程认领"""
+    with get_db() as conn:
+        conn.execute("UPDATE shard_leases SET owner = NULL, expires_at = 0 WHERE shard = ? AND owner = ?",
+                     (shard, worker_id))
+
+
+def get_shard_leases() -> List[Dict]:
+    """查询全部分片租约"""
+    with get_db() as conn:
+        rows = conn.execute("SELECT shard, owner, expires_at FROM shard_leases ORDER BY shard").fetchall()
+        return [dict(row) for row in rows]
+
+
+def get_data_age(table: str, column: str, where: str = '', params: tuple = ()) -> Optional[float]:
+    """
+    数据集最新一行距今的秒数（日期列按当天 0 点计），无数据时返回 None
+    兼容聚簇表的整数编码：不超过 99991231 的整数为 YYYYMMDD 日期，否则为 Unix 秒
+    """
+    latest = get_latest_value(table, column, where, params)
+    if not latest:
+        return None
+    if isinstance(latest, int):
+        if latest > 99991231:
+            return time.time() - latest
+        latest = int_to_date(latest)
+    try:
+        return (datetime.now() - datetime.fromisoformat(str(latest))).total_seconds()
+    except ValueError:
+        return None
+
+
+@cached('index_realtime')
 def get_index_realtime(symbol: Optional[str] = None) -> List[Dict]:
     """查询指数实时行情"""
     with get_db() as conn:
@@ -623,6 +1646,7 @@ def get_index_realtime(symbol: Optional[str] = None) -> List[Dict]:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@cached('stock_news')
 def get_stock_news(symbol: Optional[str] = None, limit: int = 20) -> List[Dict]:
     """查询个股新闻"""
     with get_db() as conn:
@@ -643,6 +1667,7 @@ def get_stock_news(symbol: Optional[str] = None, limit: int = 20) -> List[Dict]:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@cached('policy_news')
 def get_policy_news(limit: int = 20) -> List[Dict]:
     """查询政策新闻"""
     with get_db() as conn:
@@ -655,19 +1680,21 @@ def get_policy_news(limit: int = 20) -> List[Dict]:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@cached('fund_flow')
 def get_fund_flow(symbol: str, limit: int = 10) -> List[Dict]:
     """查询资金流向"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT * FROM fund_flow
+            SELECT * FROM fund_flow_all
             WHERE symbol = ?
             ORDER BY trade_date DESC
             LIMIT ?
         """, (symbol, limit))
-        return [dict(row) for row in cursor.fetchall()]
+        return [_decode_row(row) for row in cursor.fetchall()]
 
 
+@cached('margin_trading')
 def get_margin_trading(symbol: str, limit: int = 10) -> List[Dict]:
     """查询融资融券"""
     with get_db() as conn:
@@ -678,9 +1705,10 @@ def get_margin_trading(symbol: str, limit: int = 10) -> List[Dict]:
             ORDER BY trade_date DESC
             LIMIT ?
         """, (symbol, limit))
-        return [dict(row) for row in cursor.fetchall()]
+        return [_decode_row(row) for row in cursor.fetchall()]
 
 
+@cached('earnings_calendar')
 def get_earnings_calendar(symbol: Optional[str] = None) -> List[Dict]:
     """查询财报日历"""
     with get_db() as conn:
@@ -700,6 +1728,18 @@ def get_earnings_calendar(symbol: Optional[str] = None) -> List[Dict]:
         return [dict(row) for row in cursor.fetchall()]
 
 
+@cached('table_heartbeat')
+def get_table_heartbeat(table: Optional[str] = None) -> List[Dict]:
+    """查询采集心跳（各表最近一次采集时间）"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if table:
+            cursor.execute("SELECT * FROM table_heartbeat WHERE table_name = ?", (table,))
+        else:
+            cursor.execute("SELECT * FROM table_heartbeat ORDER BY table_name")
+        return [dict(row) for row in cursor.fetchall()]
+
+
 if __name__ == "__main__":
     init_database()
     print(f"数据库已创建: {DATABASE_PATH}")
@@ -0,0 +1,132 @@
+"""
+定时任务运行台账
+每次任务运行结束后在 job_runs 表记录状态（ok / failed / skipped）与最近一次成功时间。
+调度器的任务定义来自代码，重启时据台账恢复调度状态：
+- 定时（cron）任务：进程停机期间错过的最近一次触发，启动后补跑一次；
+  带 fire_date 参数的按日任务补跑时传入错过的日期，采集那一天而不是当天
+- 间隔任务：沿用上次成功的节奏，数据仍在间隔内的不立即重跑
+"""
+import contextvars
+import functools
+import inspect
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from database import record_job_run, get_job_runs
+
+
+# 当前运行的状态（任务内通过 job_failed / mark_skipped 修改）
+_run: contextvars.ContextVar = contextvars.ContextVar('job_run', default=None)
+
+
+def recorded(job_id: str):
+    """装饰定时任务：运行结束后写入台账"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            state = {'status': 'ok', 'error': None}
+            token = _run.set(state)
+            started = datetime.now()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                state.update(status='failed', error=str(e))
+                raise
+            finally:
+                _run.reset(token)
+                try:
+                    record_job_run(job_id, started, datetime.now(), state['status'], state['error'])
+                except Exception as e:
+                    print(f"[{datetime.now()}] 写入任务台账失败 ({job_id}): {e}")
+        return wrapper
+    return decorator
+
+
+def job_failed(error: Exception):
+    """任务内捕获异常后调用：本次运行记为失败"""
+    state = _run.get()
+    if state is not None:
+        state.update(status='failed', error=str(error))
+
+
+def mark_skipped():
+    """本次运行未实际采集（非交易时段、由其他进程负责等），不计为成功"""
+    state = _run.get()
+    if state is not None and state['status'] == 'ok':
+        state['status'] = 'skipped'
+
+
+def _last_success(runs: Dict[str, Dict], job_id: str, tz) -> Optional[datetime]:
+    value = (runs.get(job_id) or {}).get('last_success_at')
+    if not value:
+        return None
+    return datetime.fromisoformat(value).astimezone(tz)  # 台账为本地时间
+
+
+def _last_handled(runs: Dict[str, Dict], job_id: str, tz) -> Optional[datetime]:
+    """最近一次成功，或最近一次按规则跳过（休市等）的开始时间，取较晚者"""
+    last_success = _last_success(runs, job_id, tz)
+    run = runs.get(job_id) or {}
+    if run.get('last_status') != 'skipped' or not run.get('last_started_at'):
+        return last_success
+    skipped_at = datetime.fromisoformat(run['last_started_at']).astimezone(tz)
+    return max(skipped_at, last_success) if last_success else skipped_at
+
+
+def previous_fire_time(trigger: CronTrigger, now: datetime, lookback_days: int = 8) -> Optional[datetime]:
+    """cron 触发器在 now 之前（含）最近一次应触发的时间"""
+    fire_time = trigger.get_next_fire_time(None, now - timedelta(days=lookback_days))
+    previous = None
+    while fire_time is not None and fire_time <= now:
+        previous = fire_time
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(seconds=1))
+    return previous
+
+
+def restore_schedule(scheduler) -> Dict[str, str]:
+    """
+    按台账调整尚未启动的调度器中各任务的首次运行时间（在 scheduler.start() 之前调用）
+
+    返回: 任务 -> 调整说明
+    """
+    tz = scheduler.timezone
+    now = datetime.now(tz)
+    runs = get_job_runs()
+    actions = {}
+
+    for job in scheduler.get_jobs():
+        last_success = _last_success(runs, job.id, tz)
+
+        if isinstance(job.trigger, CronTrigger):
+            missed = previous_fire_time(job.trigger, now)
+            handled = _last_handled(runs, job.id, tz)
+            if missed is not None and (handled is None or handled < missed):
+                if 'fire_date' in inspect.signature(job.func).parameters:
+                    # 一次性任务补跑错过的日期，不改动原任务的参数
+                    scheduler.add_job(
+                        job.func, 'date', run_date=now, kwargs={'fire_date': missed.date()},
+                        id=f"{job.id}:catchup", name=f"{job.name}（补跑）", replace_existing=True,
+                    )
+                else:
+                    scheduler.modify_job(job.id, next_run_time=now)
+                actions[job.id] = f"补跑错过的 {missed:%m-%d %H:%M}"
+
+        elif isinstance(job.trigger, IntervalTrigger) and last_success is not None:
+            next_run = max(now, last_success + job.trigger.interval)
+            scheduler.modify_job(job.id, next_run_time=next_run)
+            actions[job.id] = f"沿用上次成功节奏，下次 {next_run:%H:%M:%S}"
+
+    for job_id, action in actions.items():
+        print(f"[{datetime.now()}] {job_id}: {action}")
+    return actions
+
+
+def last_success_age(job_id: str) -> Optional[float]:
+    """任务最近一次成功距今的秒数，无记录时返回 None"""
+    value = (get_job_runs().get(job_id) or {}).get('last_success_at')
+    if not value:
+        return None
+    return (datetime.now() - datetime.fromisoformat(value)).total_seconds()
@@ -0,0 +1,296 @@
+"""
+采集服务指标
+以 Prometheus 文本格式在本地 HTTP 端口（CONFIG['metrics']）暴露：
+上游（AkShare 函数）调用耗时与错误数、各任务耗时/错误数/抓取行数/各表写入行数、写库耗时、
+写入队列深度，以及各表数据年龄（当前时间减最新一行的时间），用于在采集落后时告警
+
+    curl http://127.0.0.1:9108/metrics
+
+同一端口还提供管理接口 POST /profile（按需剖析，见 profiling.py）
+"""
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from config import CONFIG
+import profiling
+
+
+# 默认耗时分桶（秒），覆盖单次请求到整轮任务
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    """带标签的指标基类，按标签值元组保存样本"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    @staticmethod
+    def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+        if not names:
+            return ''
+        pairs = ','.join(
+            f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+        )
+        return '{' + pairs + '}'
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(self.labelnames, key)} {value:g}" for key, value in items]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可任意设置的瞬时值"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """分桶统计（累计桶计数 + 总和 + 次数）"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [各桶计数..., +Inf 计数, 总和]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                labels = self._format_labels(self.labelnames + ('le',), key + (le,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = self._format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]:g}")
+            lines.append(f"{self.name}_count{labels} {series[-2]}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+
+# ==================== 指标定义 ====================
+
+UPSTREAM_LATENCY = Histogram('datasvc_upstream_latency_seconds', '上游 AkShare 函数调用耗时', ['function'])
+UPSTREAM_ERRORS = Counter('datasvc_upstream_errors_total', '上游 AkShare 函数调用失败次数', ['function'])
+ROWS_FETCHED = Counter('datasvc_rows_fetched_total', '各任务从上游抓取的行数', ['job', 'function'])
+ROWS_WRITTEN = Counter('datasvc_rows_written_total', '各任务向各表提交写入的行数', ['job', 'table'])
+DB_WRITE_LATENCY = Histogram('datasvc_db_write_seconds', '写库事务耗时（direct 直接写入 / group 写入线程组提交）', ['mode'])
+JOB_DURATION = Histogram('datasvc_job_duration_seconds', '定时任务单次运行耗时', ['job'])
+JOB_ERRORS = Counter('datasvc_job_errors_total', '定时任务失败次数', ['job'])
+CIRCUIT_STATE = Gauge('datasvc_circuit_state', '上游接口熔断状态（0 关闭 / 1 半开 / 2 打开）', ['function'])
+CIRCUIT_OPENS = Counter('datasvc_circuit_opens_total', '上游接口熔断次数', ['function'])
+CIRCUIT_REJECTIONS = Counter('datasvc_circuit_rejections_total', '因熔断被拒绝的调用次数', ['function'])
+WRITER_QUEUE_DEPTH = Gauge('datasvc_writer_queue_depth', '写入线程队列中待提交的批次数')
+QUERY_CACHE_REQUESTS = Counter('datasvc_query_cache_requests_total', '查询结果缓存请求数（hit 命中 / miss 未命中）',
+                               ['function', 'result'])
+QUERY_CACHE_HIT_RATIO = Gauge('datasvc_query_cache_hit_ratio', '查询结果缓存累计命中率', ['function'])
+QUERY_CACHE_ENTRIES = Gauge('datasvc_query_cache_entries', '查询结果缓存当前条目数')
+DATA_AGE = Gauge('datasvc_data_age_seconds', '各表最新数据距今秒数', ['table'])
+
+
+# 数据年龄来源: 表名 -> (查询表, 时间列, 过滤条件)
+# 实时行情只写入有变化的行，用 table_heartbeat 的最近采集时间代替 updated_at
+DATA_AGE_SOURCES = {
+    'stock_realtime': ('table_heartbeat', 'last_seen_at', "WHERE table_name = 'stock_realtime'"),
+    'index_realtime': ('table_heartbeat', 'last_seen_at', "WHERE table_name = 'index_realtime'"),
+    'stock_daily': ('stock_daily', 'trade_date', ''),
+    'fund_flow': ('fund_flow_all', 'updated_at', ''),
+    'margin_trading': ('margin_trading', 'trade_date', ''),
+    'stock_news': ('stock_news', 'created_at', ''),
+    'policy_news': ('policy_news', 'created_at', ''),
+}
+
+
+# ==================== 任务上下文 ====================
+
+# 当前任务名（contextvars 随 fetch_concurrently 传入抓取线程，用于按任务统计抓取行数；
+# 写入线程提交的批次在入队时记下任务名，用于按任务统计写入行数）
+_current_job: contextvars.ContextVar = contextvars.ContextVar('metrics_job', default='')
+
+
+def current_job() -> str:
+    return _current_job.get()
+
+
+def track_job(job: str):
+    """装饰定时任务：记录耗时，并把任务名设为当前上下文"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_job.set(job)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                JOB_DURATION.observe(time.perf_counter() - started, job=job)
+                _current_job.reset(token)
+        return wrapper
+    return decorator
+
+
+def record_job_error(job: Optional[str] = None):
+    """任务内捕获异常时计数（默认取当前任务）"""
+    JOB_ERRORS.inc(job=job or current_job() or 'unknown')
+
+
+# ==================== 导出 ====================
+
+# 瞬时值在同一个常驻线程上计算：抓取请求各自在新线程中处理，若直接查询会每次新建数据库连接
+_gauge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metrics-gauges')
+
+
+def _refresh_gauges():
+    """抓取时才计算的瞬时值：写入队列深度、数据年龄"""
+    from database import get_data_age
+    from writer import get_writer
+
+    writer = get_writer()
+    WRITER_QUEUE_DEPTH.set(writer.qsize() if writer is not None else 0)
+
+    for table, source in DATA_AGE_SOURCES.items():
+        try:
+            age = get_data_age(*source)
+        except Exception as e:
+            print(f"[metrics] 查询 {table} 数据年龄失败: {e}")
+            continue
+        if age is not None:
+            DATA_AGE.set(age, table=table)
+
+
+def render() -> str:
+    """全部指标的 Prometheus 文本格式"""
+    try:
+        _gauge_executor.submit(_refresh_gauges).result(timeout=CONFIG['metrics']['gauge_timeout'])
+    except TimeoutError:
+        print("[metrics] 计算数据年龄超时，沿用上次的值")
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def _reply(self, body: str, content_type: str = 'text/plain; charset=utf-8'):
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/metrics':
+            self.send_error(404)
+            return
+        self._reply(render(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    def do_POST(self):
+        """管理接口: POST /profile?jobs=fund_flow,stock_news&runs=3 开启按需剖析"""
+        url = urlsplit(self.path)
+        if url.path != '/profile':
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        jobs = [job for value in query.get('jobs', []) for job in value.split(',') if job]
+        try:
+            runs = int(query['runs'][0]) if 'runs' in query else None
+        except ValueError:
+            self.send_error(400, 'runs 必须是整数')
+            return
+        armed = profiling.arm(jobs or None, runs)
+        self._reply(f"profiling armed: {armed}\n")
+
+    def log_message(self, format, *args):
+        pass  # 抓取请求很频繁，不打印访问日志
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_server(host: Optional[str] = None, port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """在后台线程启动指标 HTTP 服务；端口配置为 0/None 时不启动"""
+    global _server
+    settings = CONFIG['metrics']
+    host = host or settings['host']
+    port = port if port is not None else settings['port']
+    if not port or _server is not None:
+        return _server
+
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"[{datetime.now()}] 指标服务启动失败（{host}:{port}）: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"[{datetime.now()}] 指标服务已启动: http://{host}:{port}/metrics")
+    return _server
+
+
+def stop_server():
+    """停止指标 HTTP 服务"""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
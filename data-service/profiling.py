@@ -0,0 +1,181 @@
+"""
+按需性能剖析
+运行中通过 SIGUSR1 信号或管理接口（POST /profile，见 metrics.py）开启，无需重启：
+对指定任务接下来的 N 次运行启用 cProfile + tracemalloc，运行结束后在 CONFIG['profiling']['output_dir']
+写入带时间戳的 .prof 文件（可用 snakeviz / pstats 查看）和文本摘要（耗时最多的函数、内存分配最多的代码行）。
+
+    kill -USR1 <pid>                                                  # 按 CONFIG 默认剖析
+    curl -X POST 'http://127.0.0.1:9108/profile?jobs=fund_flow&runs=3'
+
+抓取线程中的工作（fetch_concurrently）也会被剖析并合并进同一份结果。
+Python 3.12+ 的 cProfile 基于 sys.monitoring，同一时刻只能启用一个剖析器，
+此时只有先启用的线程被剖析，其余调用不剖析直接执行（摘要中记录未剖析的调用数）。
+未开启时每次任务运行只多一次字典判断
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from config import CONFIG
+
+
+# 全部任务
+ALL_JOBS = '*'
+
+# 任务名 -> 剩余需剖析的运行次数
+_armed: Dict[str, int] = {}
+_lock = threading.Lock()
+_tracing = 0  # 正在进行的剖析数（tracemalloc 是全局的，最后一个结束时关闭）
+
+
+class ProfileSession:
+    """一次任务运行的剖析结果（主线程 + 抓取线程）"""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.profiles: List[cProfile.Profile] = []
+        self.skipped = 0  # 因已有剖析器启用而未剖析的调用数
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            self.profiles.append(profile)
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+
+# 当前任务的剖析会话（contextvars 随 fetch_concurrently 传入抓取线程）
+_session: contextvars.ContextVar = contextvars.ContextVar('profile_session', default=None)
+
+
+def arm(jobs: Optional[Iterable[str]] = None, runs: Optional[int] = None) -> Dict[str, int]:
+    """开启剖析：jobs 为空时剖析所有任务，runs 默认取 CONFIG['profiling']['runs']"""
+    settings = CONFIG['profiling']
+    runs = runs or settings['runs']
+    jobs = list(jobs or settings['jobs'] or [ALL_JOBS])
+    with _lock:
+        for job in jobs:
+            _armed[job] = runs
+        armed = dict(_armed)
+    print(f"[{datetime.now()}] 已开启剖析: {armed}")
+    return armed
+
+
+def disarm():
+    """取消尚未执行的剖析"""
+    with _lock:
+        _armed.clear()
+
+
+def _take(job: str) -> bool:
+    """该任务本次运行是否需要剖析（并扣减剩余次数）"""
+    with _lock:
+        for key in (job, ALL_JOBS):
+            if _armed.get(key, 0) > 0:
+                _armed[key] -= 1
+                if _armed[key] == 0:
+                    del _armed[key]
+                return True
+    return False
+
+
+def call(func, *args, **kwargs):
+    """在当前剖析会话中执行 func（供抓取线程使用，无会话时直接调用）"""
+    session = _session.get()
+    if session is None:
+        return func(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # 其他线程的剖析器正在运行（Python 3.12+ 同一时刻只允许一个），本次不剖析
+        session.skip()
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        session.add(profile)
+
+
+def profiled(job: str):
+    """装饰定时任务：开启剖析时对本次运行做 CPU 与内存剖析"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _armed or not _take(job):
+                return func(*args, **kwargs)
+            return _run_profiled(job, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _run_profiled(job: str, func, *args, **kwargs):
+    global _tracing
+    with _lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(CONFIG['profiling']['traceback_frames'])
+        _tracing += 1
+
+    session = ProfileSession(job)
+    token = _session.set(session)
+    started = time.perf_counter()
+    try:
+        return call(func, *args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        _session.reset(token)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        with _lock:
+            _tracing -= 1
+            if _tracing == 0:
+                tracemalloc.stop()
+        try:
+            _write_report(session, elapsed, snapshot, peak)
+        except Exception as e:
+            print(f"[{datetime.now()}] 写入剖析结果失败: {e}")
+
+
+def _write_report(session: ProfileSession, elapsed: float, snapshot: tracemalloc.Snapshot, peak: int):
+    """写入 .prof 文件与文本摘要"""
+    if not session.profiles:
+        print(f"[{datetime.now()}] {session.job} 运行期间已有其他剖析器启用，未能剖析")
+        return
+    settings = CONFIG['profiling']
+    output_dir = Path(settings['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = output_dir / f"{session.job}_{datetime.now():%Y%m%d_%H%M%S}"
+
+    stats = pstats.Stats(session.profiles[0])
+    for profile in session.profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(f"{stem}.prof")
+
+    top_n = settings['top_n']
+    buffer = io.StringIO()
+    buffer.write(f"任务: {session.job}\n耗时: {elapsed:.3f}s\n"
+                 f"剖析线程数: {len(session.profiles)}（未剖析的调用: {session.skipped}）\n内存峰值: {peak / 1024 / 1024:.1f} MiB\n\n")
+    buffer.write(f"==== 累计耗时前 {top_n} 的函数 ====\n")
+    stats.stream = buffer
+    stats.sort_stats('cumulative').print_stats(top_n)
+    buffer.write(f"\n==== 内存分配前 {top_n} 的代码行 ====\n")
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    for stat in snapshot.statistics('lineno')[:top_n]:
+        buffer.write(f"{stat}\n")
+
+    Path(f"{stem}.txt").write_text(buffer.getvalue(), encoding='utf-8')
+    print(f"[{datetime.now()}] {session.job} 剖析完成（{elapsed:.1f}s），结果: {stem}.prof / {stem}.txt")
@@ -0,0 +1,103 @@
+"""
+查询结果缓存
+database.get_* 查询函数的结果按 (函数, 参数) 缓存在有界 LRU 中，每条缓存记下所依赖各表的代数。
+写入提交后对应表的代数加一（见 database.get_db），该表的缓存随之失效，其他表的缓存不受影响：
+写入 stock_daily 不会让 get_stock_realtime 的缓存失效。
+
+其他进程（分片采集进程、Next.js）的写入无法通知本进程，缓存最多保留 CONFIG['query_cache']['ttl'] 秒。
+每次返回缓存结果的副本（逐行复制字典），调用方修改返回值不影响缓存。命中/未命中次数见 metrics.py 与 stats()
+"""
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+
+from config import CONFIG
+import metrics
+
+
+# 表名 -> 代数
+_generations: Dict[str, int] = {}
+# (函数名, 参数) -> (依赖表的代数, 写入时间, 结果)
+_entries: 'OrderedDict[Hashable, Tuple[tuple, float, object]]' = OrderedDict()
+# 函数名 -> [命中, 未命中]
+_counts: Dict[str, list] = {}
+_lock = threading.Lock()
+
+
+def bump(*tables: str):
+    """表的数据已变更（写入事务提交后调用）"""
+    with _lock:
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+
+
+def clear():
+    """清空全部缓存"""
+    with _lock:
+        _entries.clear()
+    metrics.QUERY_CACHE_ENTRIES.set(0)
+
+
+def _record(name: str, hit: bool):
+    counts = _counts.setdefault(name, [0, 0])
+    counts[0 if hit else 1] += 1
+    metrics.QUERY_CACHE_REQUESTS.inc(function=name, result='hit' if hit else 'miss')
+    metrics.QUERY_CACHE_HIT_RATIO.set(counts[0] / (counts[0] + counts[1]), function=name)
+
+
+def _copy(result):
+    """缓存结果的副本：查询函数返回行字典列表，逐行复制即可隔离调用方的修改"""
+    if isinstance(result, list):
+        return [dict(row) if isinstance(row, dict) else copy.deepcopy(row) for row in result]
+    return copy.deepcopy(result)
+
+
+def cached(*tables: str):
+    """装饰查询函数：结果依赖 tables 中的表"""
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            settings = CONFIG['query_cache']
+            if not settings['enabled']:
+                return func(*args, **kwargs)
+
+            key = (name, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:  # 参数不可哈希（如列表）时不缓存
+                return func(*args, **kwargs)
+            now = time.monotonic()
+            with _lock:
+                versions = tuple(_generations.get(table, 0) for table in tables)
+                entry = _entries.get(key)
+                if entry is not None and entry[0] == versions and now - entry[1] < settings['ttl']:
+                    _entries.move_to_end(key)
+                    _record(name, True)
+                    return _copy(entry[2])
+                _record(name, False)
+
+            # 查询期间发生的写入会使代数变化，下次读取时重新查询
+            result = func(*args, **kwargs)
+            with _lock:
+                _entries[key] = (versions, now, result)
+                _entries.move_to_end(key)
+                while len(_entries) > settings['max_entries']:
+                    _entries.popitem(last=False)
+                metrics.QUERY_CACHE_ENTRIES.set(len(_entries))
+            return _copy(result)
+        return wrapper
+    return decorator
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """各查询函数的命中次数、未命中次数与命中率"""
+    with _lock:
+        return {
+            name: {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses)}
+            for name, (hits, misses) in _counts.items()
+        }
@@ -0,0 +1,163 @@
+"""
+分层刷新调度
+按需求（近期被读取次数、持有用户数、波动）给股票排序，在固定的每分钟上游请求预算内
+把股票分配到不同刷新间隔的层级：热门股票刷新频繁，冷门股票刷新稀疏，
+股票池扩大时总请求量仍受预算约束。分片模式下预算按各进程持有的分片比例分摊
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import CONFIG
+from database import get_symbol_reads, get_symbols_read_since, get_realtime_change_pct
+import sharding
+import watchlist
+
+
+class DemandTracker:
+    """
+    把累计读取次数转换为按时间指数衰减的近期热度（半衰期 CONFIG['demand_half_life_minutes']）
+
+    衰减只取决于两次更新相隔的时间，与调用频率无关；首次更新时没有上一次的计数可比，
+    半衰期内被读取过的股票记 1 次读取，其余为 0
+    """
+
+    def __init__(self, half_life_minutes: Optional[float] = None):
+        self.half_life = (half_life_minutes or CONFIG['demand_half_life_minutes']) * 60
+        self._last_reads: Optional[Dict[str, int]] = None
+        self._updated_at = 0.0
+        self._recent: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def update(self) -> Dict[str, float]:
+        reads = get_symbol_reads()
+        now = time.monotonic()
+        with self._lock:
+            if self._last_reads is None:
+                self._recent = {symbol: 1.0 for symbol in get_symbols_read_since(self.half_life / 60)}
+            else:
+                factor = 0.5 ** ((now - self._updated_at) / self.half_life)
+                for symbol in set(reads) | set(self._recent):
+                    delta = reads.get(symbol, 0) - self._last_reads.get(symbol, 0)
+                    heat = self._recent.get(symbol, 0.0) * factor + max(delta, 0)
+                    if heat < 0.01:
+                        self._recent.pop(symbol, None)
+                    else:
+                        self._recent[symbol] = heat
+            self._last_reads = reads
+            self._updated_at = now
+            return dict(self._recent)
+
+
+# 调度误差容忍：任务略早于间隔触发时仍视为到期
+_SLACK_SECONDS = 30
+
+
+def score_symbols(symbols: List[str], demand: DemandTracker) -> Dict[str, float]:
+    """按 CONFIG['demand_weights'] 计算各股票的需求分"""
+    weights = CONFIG['demand_weights']
+    reads = demand.update()
+    moves = get_realtime_change_pct(symbols)
+    return {
+        symbol: (
+            weights['reads'] * reads.get(symbol, 0.0)
+            + weights['holders'] * watchlist.watchlist.refcount(symbol)
+            + weights['volatility'] * abs(moves.get(symbol, 0.0))
+        )
+        for symbol in symbols
+    }
+
+
+def plan_tiers(scores: Dict[str, float], intervals: List[float], budget_per_minute: float) -> Dict[str, float]:
+    """
+    在预算内分配刷新间隔
+
+    参数:
+        scores: {symbol: 需求分}
+        intervals: 各层刷新间隔（分钟），由热到冷
+        budget_per_minute: 每分钟允许的上游请求数
+
+    返回: {symbol: 刷新间隔（分钟）}
+
+    所有股票先放在最冷层（若仍超预算则按比例拉长最冷层间隔），
+    剩余预算按需求分从高到低把股票升到尽可能热的层级
+    """
+    if not scores:
+        return {}
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    coldest = max(intervals[-1], len(ranked) / budget_per_minute)
+    plan = {symbol: coldest for symbol in ranked}
+    remaining = budget_per_minute - len(ranked) / coldest
+
+    for symbol in ranked:
+        if scores[symbol] <= 0:
+            break
+        for interval in intervals[:-1]:
+            extra = 1 / interval - 1 / coldest
+            if extra <= remaining + 1e-9:
+                plan[symbol] = interval
+                remaining -= extra
+                break
+    return plan
+
+
+class TieredRefresher:
+    """某个逐只抓取任务的分层刷新状态（各任务的重算间隔不同，近期热度分别统计）"""
+
+    def __init__(self, job: str):
+        self.job = job
+        self._demand = DemandTracker()
+        self._plan: Dict[str, float] = {}
+        self._planned_at = 0.0
+        self._last_refresh: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _replan(self, symbols: List[str]):
+        settings = CONFIG['refresh_tiers'][self.job]
+        budget = settings['budget_per_minute'] * sharding.budget_share()
+        self._plan = plan_tiers(score_symbols(symbols, self._demand), settings['intervals'], budget)
+        self._planned_at = time.monotonic()
+
+        counts: Dict[float, int] = {}
+        for interval in self._plan.values():
+            counts[interval] = counts.get(interval, 0) + 1
+        tiers = ', '.join(f"{interval:g}分钟×{count}" for interval, count in sorted(counts.items()))
+        print(f"[{datetime.now()}] {self.job} 刷新分层: {tiers}")
+
+    def due(self, symbols: List[str]) -> List[str]:
+        """返回本周期需要刷新的股票，并先记为已刷新（被放弃或抓取失败的由 release 撤销）"""
+        with self._lock:
+            replan_after = CONFIG['tier_replan_minutes'] * 60
+            if set(symbols) != set(self._plan) or time.monotonic() - self._planned_at >= replan_after:
+                self._replan(symbols)
+
+            now = time.monotonic()
+            due = [
+                symbol for symbol in symbols
+                if now - self._last_refresh.get(symbol, float('-inf')) >= self._plan[symbol] * 60 - _SLACK_SECONDS
+            ]
+            for symbol in due:
+                self._last_refresh[symbol] = now
+            return due
+
+    def release(self, symbols: List[str]):
+        """撤销未实际刷新（因超时被放弃或抓取失败）的股票的刷新记录，下个周期优先补上"""
+        with self._lock:
+            for symbol in symbols:
+                self._last_refresh.pop(symbol, None)
+
+
+_refreshers: Dict[str, TieredRefresher] = {}
+
+
+def due_symbols(job: str, symbols: Optional[List[str]] = None) -> List[str]:
+    """某任务本周期应刷新的股票（默认取动态股票池）"""
+    refresher = _refreshers.setdefault(job, TieredRefresher(job))
+    return refresher.due(symbols if symbols is not None else watchlist.get_symbols())
+
+
+def release_symbols(job: str, symbols: List[str]):
+    """某任务本周期被放弃或抓取失败的股票，下个周期重新视为到期"""
+    if symbols and job in _refreshers:
+        _refreshers[job].release(symbols)
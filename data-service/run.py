@@ -1,24 +1,49 @@
 #!/usr/bin/env python3
 """
 数据采集服务启动入口
+
+用法:
+    python run.py                        # 单进程采集全部股票
+    python run.py --worker               # 分片模式，可启动多个进程（或多台机器共享数据库）分担采集
+    python run.py --worker --worker-id a # 指定进程标识（默认 主机名:PID）
 """
+import argparse
 import sys
 import signal
 import time
 from datetime import datetime
 
-from database import init_database
+from database import init_database, close_connections
+import sharding
+import metrics
+import profiling
 from scheduler import create_scheduler, run_initial_collection
+from writer import start_writer, stop_writer
 
 
 def signal_handler(signum, frame):
-    """处理退出信号"""
+    """处理退出信号（抛出 SystemExit，由 main 的 finally 负责落盘后退出）"""
     print(f"\n[{datetime.now()}] 收到退出信号，正在关闭...")
     sys.exit(0)
 
 
+def profile_signal_handler(signum, frame):
+    """SIGUSR1：对接下来的任务运行开启剖析（任务与次数见 CONFIG['profiling']）"""
+    profiling.arm()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='伴投数据采集服务')
+    parser.add_argument('--worker', action='store_true',
+                        help='分片模式：按租约认领部分股票，多个进程共同完成全市场采集')
+    parser.add_argument('--worker-id', help='分片模式下的进程标识（默认 主机名:PID）')
+    return parser.parse_args(argv)
+
+
 def main():
     """主函数"""
+    args = parse_args()
+
     print("=" * 60)
     print("     伴投 Investbuddy - 数据采集服务")
     print("=" * 60)
@@ -27,46 +52,62 @@ def main():
     # 注册信号处理
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
+    if hasattr(signal, 'SIGUSR1'):  # Windows 没有 SIGUSR1，可改用 POST /profile
+        signal.signal(signal.SIGUSR1, profile_signal_handler)
 
     # 初始化数据库
     print("[1/3] 初始化数据库...")
     init_database()
+    start_writer()
+    metrics.start_server()
 
-    # 执行初始数据采集
-    print("[2/3] 执行初始数据采集...")
-    run_initial_collection()
+    scheduler = None
+    try:
+        if args.worker:
+            manager = sharding.start(args.worker_id)
+            print(f"分片模式已启用，进程标识: {manager.worker_id}")
 
-    # 创建并启动调度器
-    print("[3/3] 启动定时任务调度器...")
-    scheduler = create_scheduler()
-    scheduler.start()
+        # 执行初始数据采集
+        print("[2/3] 执行初始数据采集...")
+        run_initial_collection()
 
-    print()
-    print("=" * 60)
-    print("  数据采集服务已启动！")
-    print("  按 Ctrl+C 退出")
-    print("=" * 60)
-    print()
+        # 创建并启动调度器
+        print("[3/3] 启动定时任务调度器...")
+        scheduler = create_scheduler()
+        scheduler.start()
 
-    # 打印任务列表
-    print("已注册的定时任务:")
-    print("-" * 40)
-    for job in scheduler.get_jobs():
-        print(f"  - {job.name}: {job.trigger}")
-    print("-" * 40)
-    print()
+        print()
+        print("=" * 60)
+        print("  数据采集服务已启动！")
+        print("  按 Ctrl+C 退出")
+        print("=" * 60)
+        print()
 
-    # 保持运行
-    try:
+        # 打印任务列表
+        print("已注册的定时任务:")
+        print("-" * 40)
+        for job in scheduler.get_jobs():
+            print(f"  - {job.name}: {job.trigger}")
+        print("-" * 40)
+        print()
+
+        # 保持运行
         while True:
             time.sleep(60)
             # 每分钟打印心跳
             print(f"[{datetime.now()}] 服务运行中...")
     except (KeyboardInterrupt, SystemExit):
-        print(f"\n[{datetime.now()}] 正在关闭调度器...")
-        scheduler.shutdown()
+        pass
+    finally:
+        if scheduler is not None:
+            print(f"\n[{datetime.now()}] 正在关闭调度器...")
+            scheduler.shutdown()  # 等待进行中的任务结束，其写入进入队列
+        sharding.stop()  # 释放租约，其他进程下一次心跳即可接管
+        print(f"[{datetime.now()}] 正在落盘未完成的写入...")
+        stop_writer()
+        metrics.stop_server()
+        close_connections()
         print("服务已停止")
 
-
 if __name__ == "__main__":
     main()
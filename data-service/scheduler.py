@@ -2,64 +2,117 @@
 定时任务调度器
 使用 APScheduler 管理数据采集任务
 """
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from datetime import datetime, time
-import pytz
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 
 from config import CONFIG
 from collectors import stock_realtime, stock_daily, index_data
 from collectors import stock_news, policy_news, earnings
 from collectors import fund_flow, margin
+from collectors.concurrency import deadline
+from database import (
+    get_data_age, get_latest_value, date_to_int, compact_quote_ticks, get_tick_dates, prune_quote_ticks, rollover_hot,
+    prune_portfolio_symbol_changes,
+)
+import trading_calendar
+import watchlist
+import refresh_tiers
+import sharding
+import metrics
+import profiling
+import job_ledger
+import archive
+from trading_calendar import CHINA_TZ
+
+
+# 当前运行的调度器（实时任务据此把下次运行推迟到下一交易时段）
+_scheduler: Optional[BackgroundScheduler] = None
 
 
-# 中国时区
-CHINA_TZ = pytz.timezone('Asia/Shanghai')
+def is_trading_time() -> bool:
+    """判断当前是否在交易时间（按交易日历，节假日返回 False）"""
+    return trading_calendar.is_trading_time()
 
 
-def is_trading_time() -> bool:
-    """判断当前是否在交易时间"""
-    now = datetime.now(CHINA_TZ)
+def _sleep_until_next_session(job_id: str, job_name: str):
+    """
+    非交易时段：把实时任务的下次运行推迟到下一交易时段开始，
+    避免午休、收盘后和节假日期间每隔几分钟空转一次
+    """
+    job_ledger.mark_skipped()
+    next_start = trading_calendar.next_session_start()
+    if _scheduler is not None and _scheduler.get_job(job_id) is not None:
+        _scheduler.modify_job(job_id, next_run_time=next_start)
+        print(f"[{datetime.now()}] 非交易时间，{job_name}暂停至 {next_start:%Y-%m-%d %H:%M}")
+    else:
+        print(f"[{datetime.now()}] 非交易时间，跳过{job_name}")
+
+
+def _job_deadline(job_id: str):
+    """任务的时间预算：超时后放弃剩余股票，不拖到下一个调度周期"""
+    return deadline(CONFIG['job_deadlines'].get(job_id))
+
+
+def _scheduled_job(job_id: str):
+    """定时任务装饰器：指标统计、按需剖析、运行台账"""
+    def decorator(func):
+        return metrics.track_job(job_id)(profiling.profiled(job_id)(job_ledger.recorded(job_id)(func)))
+    return decorator
+
 
-    # 周末不交易
-    if now.weekday() >= 5:
-        return False
+def _job_failed(error: Exception):
+    """任务内捕获异常：计入指标，台账记为失败"""
+    metrics.record_job_error()
+    job_ledger.job_failed(error)
 
-    current_time = now.time()
-    trading_hours = CONFIG['trading_hours']
 
-    # 上午交易时间
-    morning_start = time(*map(int, trading_hours['morning_start'].split(':')))
-    morning_end = time(*map(int, trading_hours['morning_end'].split(':')))
+def _runs_here() -> bool:
+    """全市场任务是否由本进程执行（分片模式下只有持有 global 租约的进程执行）"""
+    if sharding.is_global_owner():
+        return True
+    job_ledger.mark_skipped()
+    return False
 
-    # 下午交易时间
-    afternoon_start = time(*map(int, trading_hours['afternoon_start'].split(':')))
-    afternoon_end = time(*map(int, trading_hours['afternoon_end'].split(':')))
 
-    return (morning_start <= current_time <= morning_end or
-            afternoon_start <= current_time <= afternoon_end)
+def _shard_symbols() -> List[str]:
+    """本进程负责的股票（分片模式下只取持有分片内的股票）"""
+    return sharding.filter_symbols(watchlist.get_symbols())
 
 
+@_scheduled_job('realtime_quotes')
 def job_realtime_quotes():
     """实时行情采集任务（交易时间执行）"""
     if not is_trading_time():
-        print(f"[{datetime.now()}] 非交易时间，跳过实时行情采集")
+        _sleep_until_next_session('realtime_quotes', '实时行情采集')
         return
 
+    if not _runs_here():
+        return  # 全市场快照由持有 global 租约的进程采集
+
     print(f"[{datetime.now()}] 执行实时行情采集...")
     try:
-        # 获取用户持仓股票（这里使用默认列表，实际应从数据库读取）
-        symbols = CONFIG['default_stocks']
+        # 用户持仓与自选的并集（含默认股票），增量维护
+        symbols = watchlist.get_symbols()
         stock_realtime.collect_and_save(symbols)
     except Exception as e:
         print(f"实时行情采集失败: {e}")
+        _job_failed(e)
 
 
+@_scheduled_job('index_quotes')
 def job_index_quotes():
     """指数行情采集任务（交易时间执行）"""
     if not is_trading_time():
-        print(f"[{datetime.now()}] 非交易时间，跳过指数行情采集")
+        _sleep_until_next_session('index_quotes', '指数行情采集')
+        return
+
+    if not _runs_here():
         return
 
     print(f"[{datetime.now()}] 执行指数行情采集...")
@@ -67,79 +120,224 @@ def job_index_quotes():
         index_data.collect_and_save()
     except Exception as e:
         print(f"指数行情采集失败: {e}")
+        _job_failed(e)
 
 
+@_scheduled_job('fund_flow')
 def job_fund_flow():
     """资金流向采集任务（交易时间执行）"""
     if not is_trading_time():
+        _sleep_until_next_session('fund_flow', '资金流向采集')
         return
 
     print(f"[{datetime.now()}] 执行资金流向采集...")
     try:
-        symbols = CONFIG['default_stocks']
-        fund_flow.collect_and_save(symbols)
+        symbols = refresh_tiers.due_symbols('fund_flow', _shard_symbols())
+        if symbols:
+            with _job_deadline('fund_flow') as budget:
+                failed = fund_flow.collect_and_save(symbols)
+            refresh_tiers.release_symbols('fund_flow', budget.skipped + failed)
     except Exception as e:
         print(f"资金流向采集失败: {e}")
+        _job_failed(e)
 
 
-def job_daily_kline():
-    """日K线采集任务（收盘后执行）"""
-    print(f"[{datetime.now()}] 执行日K线采集...")
+@_scheduled_job('daily_kline')
+def job_daily_kline(fire_date: Optional[date] = None):
+    """日K线采集任务（收盘后执行；补跑或启动采集时 fire_date 为要同步到的交易日）"""
+    if not trading_calendar.is_trading_day(fire_date):
+        print(f"[{datetime.now()}] {fire_date or '今日'} 休市，跳过日K线采集")
+        job_ledger.mark_skipped()
+        return
+
+    print(f"[{datetime.now()}] 执行日K线采集{f'（同步到 {fire_date}）' if fire_date else ''}...")
     try:
-        symbols = CONFIG['default_stocks']
-        stock_daily.collect_and_save(symbols, days=5)  # 获取最近5天
+        symbols = _shard_symbols()
+        until = datetime.combine(fire_date, datetime.min.time()) if fire_date else None
+        with _job_deadline('daily_kline'):
+            stock_daily.sync_incremental(symbols, until)  # 按已入库的最新交易日增量补齐
     except Exception as e:
         print(f"日K线采集失败: {e}")
+        _job_failed(e)
 
 
+@_scheduled_job('stock_news')
 def job_stock_news():
     """个股新闻采集任务"""
     print(f"[{datetime.now()}] 执行个股新闻采集...")
     try:
-        symbols = CONFIG['default_stocks']
-        stock_news.collect_and_save(symbols)
+        symbols = refresh_tiers.due_symbols('stock_news', _shard_symbols())
+        if symbols:
+            with _job_deadline('stock_news') as budget:
+                failed = stock_news.collect_and_save(symbols)
+            refresh_tiers.release_symbols('stock_news', budget.skipped + failed)
     except Exception as e:
         print(f"个股新闻采集失败: {e}")
+        _job_failed(e)
 
 
+@_scheduled_job('policy_news')
 def job_policy_news():
     """政策新闻采集任务"""
+    if not _runs_here():
+        return
+
     print(f"[{datetime.now()}] 执行政策新闻采集...")
     try:
         policy_news.collect_and_save(days=1)
     except Exception as e:
         print(f"政策新闻采集失败: {e}")
+        _job_failed(e)
 
 
+@_scheduled_job('earnings')
 def job_earnings():
     """财报日历采集任务"""
+    if not _runs_here():
+        return
+
     print(f"[{datetime.now()}] 执行财报日历采集...")
     try:
         earnings.collect_and_save()
     except Exception as e:
         print(f"财报日历采集失败: {e}")
+        _job_failed(e)
+
+
+@_scheduled_job('margin')
+def job_margin(fire_date: Optional[date] = None):
+    """融资融券采集任务（交易日收盘后执行；补跑时 fire_date 为错过的交易日）"""
+    if not trading_calendar.is_trading_day(fire_date):
+        print(f"[{datetime.now()}] {fire_date or '今日'} 休市，跳过融资融券采集")
+        job_ledger.mark_skipped()
+        return
 
+    if not _runs_here():
+        return
 
-def job_margin():
-    """融资融券采集任务"""
-    print(f"[{datetime.now()}] 执行融资融券采集...")
+    print(f"[{datetime.now()}] 执行融资融券采集{f'（补跑 {fire_date}）' if fire_date else ''}...")
     try:
-        symbols = CONFIG['default_stocks']
-        margin.collect_and_save(symbols)
+        symbols = watchlist.get_symbols()
+        day = datetime.combine(fire_date, datetime.min.time()) if fire_date else None
+        margin.collect_and_save(symbols, day)
     except Exception as e:
         print(f"融资融券采集失败: {e}")
+        _job_failed(e)
+
+
+@_scheduled_job('trade_calendar')
+def job_trade_calendar():
+    """交易日历刷新任务"""
+    if not _runs_here():
+        return
+
+    print(f"[{datetime.now()}] 刷新交易日历...")
+    try:
+        trading_calendar.refresh_calendar()
+    except Exception as e:
+        print(f"交易日历刷新失败: {e}")
+        _job_failed(e)
+
+
+@_scheduled_job('compact_ticks')
+def job_compact_ticks():
+    """快照历史压缩任务：近两个交易日的快照聚合为分钟K线，清理过期快照"""
+    if not _runs_here():
+        return
+
+    try:
+        settings = CONFIG['tick_history']
+        periods = settings['bar_periods']
+        cutoff = int((datetime.now(CHINA_TZ) - timedelta(days=settings['retention_days'])).strftime('%Y%m%d'))
+
+        # 最近两个交易日（当日 + 上一交易日收盘前最后几笔）重新压缩；
+        # 即将清理的交易日先压缩，保证删除快照前 K 线已生成
+        recent = get_tick_dates()[-2:]
+        expiring = get_tick_dates(before=cutoff)
+        bars = sum(compact_quote_ticks(day, periods) for day in sorted(set(recent) | set(expiring)))
+        pruned = prune_quote_ticks(cutoff)
+        if bars or pruned:
+            print(f"[{datetime.now()}] 快照历史压缩: 生成/更新 {bars} 根K线，清理 {pruned} 条过期快照")
+    except Exception as e:
+        print(f"快照历史压缩失败: {e}")
+        _job_failed(e)
+
+
+@_scheduled_job('hot_rollover')
+def job_hot_rollover():
+    """冷热分库滚动任务：热库中已收盘交易日的资金流向移入冷库"""
+    if not _runs_here():
+        return
+
+    try:
+        moved = rollover_hot()
+        print(f"[{datetime.now()}] 热库滚动完成: {moved}")
+    except Exception as e:
+        print(f"热库滚动失败: {e}")
+        _job_failed(e)
+
+
+@_scheduled_job('portfolio_changes')
+def job_prune_portfolio_changes():
+    """股票池变更日志清理任务：删除超出保留期的变更（全局任务，不随单个进程的读取进度删除）"""
+    if not _runs_here():
+        return
+
+    try:
+        pruned = prune_portfolio_symbol_changes(CONFIG['portfolio_change_retention_days'])
+        if pruned:
+            print(f"[{datetime.now()}] 清理 {pruned} 条过期的股票池变更")
+    except Exception as e:
+        print(f"股票池变更日志清理失败: {e}")
+        _job_failed(e)
+
+
+@_scheduled_job('archive_history')
+def job_archive_history():
+    """日线历史归档任务：已过修正期的交易日导出为 Parquet，清理 SQLite 中超出保留期的行"""
+    if not _runs_here():
+        return
+    if not archive.available():
+        print("未安装 pyarrow，跳过日线历史归档")
+        job_ledger.mark_skipped()
+        return
+
+    try:
+        results = archive.archive_all()
+        print(f"[{datetime.now()}] 日线历史归档完成: {results}")
+    except Exception as e:
+        print(f"日线历史归档失败: {e}")
+        _job_failed(e)
+
+
+def _on_job_skipped(event):
+    """记录被跳过的运行：错过触发时间，或上一次运行尚未结束"""
+    reason = '错过触发时间' if event.code == EVENT_JOB_MISSED else '上一次运行尚未结束'
+    print(f"[{datetime.now()}] 任务 {event.job_id} 本次运行跳过：{reason}")
+
+
+def _jitter(job_id: str) -> Optional[int]:
+    return CONFIG['job_jitter'].get(job_id)
 
 
 def create_scheduler() -> BackgroundScheduler:
-    """创建并配置调度器"""
-    scheduler = BackgroundScheduler(timezone=CHINA_TZ)
+    """
+    创建并配置调度器
+
+    所有任务默认同一时刻只运行一个实例、积压的触发合并为一次（见 CONFIG['job_defaults']），
+    高频任务的触发时间加随机抖动，避免同一秒集中请求上游
+    """
+    global _scheduler
+    scheduler = BackgroundScheduler(timezone=CHINA_TZ, job_defaults=CONFIG['job_defaults'])
+    scheduler.add_listener(_on_job_skipped, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    _scheduler = scheduler
 
     # ========== 实时数据（交易时间内） ==========
 
     # 实时行情 - 每5分钟
     scheduler.add_job(
         job_realtime_quotes,
-        IntervalTrigger(minutes=5),
+        IntervalTrigger(minutes=5, jitter=_jitter('realtime_quotes')),
         id='realtime_quotes',
         name='实时行情采集',
         replace_existing=True
@@ -148,16 +346,19 @@ def create_scheduler() -> BackgroundScheduler:
     # 指数行情 - 每5分钟
     scheduler.add_job(
         job_index_quotes,
-        IntervalTrigger(minutes=5),
+        IntervalTrigger(minutes=5, jitter=_jitter('index_quotes')),
         id='index_quotes',
         name='指数行情采集',
         replace_existing=True
     )
 
-    # 资金流向 - 每10分钟
+    # 资金流向 - 每10分钟（热门股票每次刷新，其余按分层间隔）
     scheduler.add_job(
         job_fund_flow,
-        IntervalTrigger(minutes=10),
+        IntervalTrigger(
+            minutes=CONFIG['refresh_tiers']['fund_flow']['intervals'][0],
+            jitter=_jitter('fund_flow')
+        ),
         id='fund_flow',
         name='资金流向采集',
         replace_existing=True
@@ -188,10 +389,13 @@ def create_scheduler() -> BackgroundScheduler:
 
     # ========== 新闻数据 ==========
 
-    # 个股新闻 - 每小时
+    # 个股新闻 - 每小时（热门股票每次刷新，其余按分层间隔）
     scheduler.add_job(
         job_stock_news,
-        IntervalTrigger(hours=1),
+        IntervalTrigger(
+            minutes=CONFIG['refresh_tiers']['stock_news']['intervals'][0],
+            jitter=_jitter('stock_news')
+        ),
         id='stock_news',
         name='个股新闻采集',
         replace_existing=True
@@ -200,7 +404,7 @@ def create_scheduler() -> BackgroundScheduler:
     # 政策新闻 - 每2小时
     scheduler.add_job(
         job_policy_news,
-        IntervalTrigger(hours=2),
+        IntervalTrigger(hours=2, jitter=_jitter('policy_news')),
         id='policy_news',
         name='政策新闻采集',
         replace_existing=True
@@ -208,6 +412,15 @@ def create_scheduler() -> BackgroundScheduler:
 
     # ========== 低频数据 ==========
 
+    # 交易日历 - 每天8:00
+    scheduler.add_job(
+        job_trade_calendar,
+        CronTrigger(hour=8, minute=0),
+        id='trade_calendar',
+        name='交易日历刷新',
+        replace_existing=True
+    )
+
     # 财报日历 - 每天9:00
     scheduler.add_job(
         job_earnings,
@@ -217,33 +430,160 @@ def create_scheduler() -> BackgroundScheduler:
         replace_existing=True
     )
 
+    # 快照历史压缩 - 交易时段每15分钟（收盘后 16 点再压缩一次当日）
+    scheduler.add_job(
+        job_compact_ticks,
+        CronTrigger(
+            day_of_week='mon-fri',
+            hour=f"9-{CONFIG['tick_history']['compact_until_hour']}",
+            minute=f"*/{CONFIG['tick_history']['compact_minutes']}"
+        ),
+        id='compact_ticks',
+        name='快照历史压缩',
+        replace_existing=True
+    )
+
+    # 冷热分库滚动 - 每天 0:05（把前一交易日的数据移出热库）
+    scheduler.add_job(
+        job_hot_rollover,
+        CronTrigger(hour=0, minute=5),
+        id='hot_rollover',
+        name='热库滚动',
+        replace_existing=True
+    )
+
+    # 股票池变更日志清理 - 每天 0:10
+    scheduler.add_job(
+        job_prune_portfolio_changes,
+        CronTrigger(hour=0, minute=10),
+        id='portfolio_changes',
+        name='股票池变更日志清理',
+        replace_existing=True
+    )
+
+    # 日线历史归档 - 工作日晚间（日K线、资金流向、融资融券采集之后）
+    scheduler.add_job(
+        job_archive_history,
+        CronTrigger(
+            day_of_week='mon-fri',
+            hour=CONFIG['archive']['hour'],
+            minute=CONFIG['archive']['minute']
+        ),
+        id='archive_history',
+        name='日线历史归档',
+        replace_existing=True
+    )
+
+    # 按运行台账补跑停机期间错过的定时任务、恢复间隔任务的节奏
+    job_ledger.restore_schedule(scheduler)
+
     return scheduler
 
 
-def run_initial_collection():
-    """启动时执行一次初始采集"""
-    print("=" * 50)
-    print("执行初始数据采集...")
-    print("=" * 50)
+# ==================== 启动采集 ====================
+
+def _startup_daily_kline():
+    """启动时同步日K线到最近一个已收盘的交易日（周末、节假日重启也补齐）"""
+    job_daily_kline(trading_calendar.last_closed_trading_day())
 
-    # 实时行情
-    job_realtime_quotes()
 
-    # 指数行情
-    job_index_quotes()
+# 启动采集的依赖图: 任务名 -> (任务函数, 依赖的任务, 新鲜度来源 (表, 时间列, 过滤条件))
+# 资金流向依赖实时行情：名称补全复用同一份全市场快照
+INITIAL_JOBS = {
+    'realtime_quotes': (job_realtime_quotes, [], ('table_heartbeat', 'last_seen_at', "WHERE table_name = 'stock_realtime'")),
+    'index_quotes': (job_index_quotes, [], ('table_heartbeat', 'last_seen_at', "WHERE table_name = 'index_realtime'")),
+    'daily_kline': (_startup_daily_kline, [], ('stock_daily', 'trade_date', '')),
+    'stock_news': (job_stock_news, [], ('stock_news', 'created_at', '')),
+    'policy_news': (job_policy_news, [], ('policy_news', 'created_at', '')),
+    'fund_flow': (job_fund_flow, ['realtime_quotes'], ('fund_flow_all', 'updated_at', '')),
+}
 
-    # 日K线
-    job_daily_kline()
 
-    # 新闻
-    job_stock_news()
-    job_policy_news()
+def _daily_kline_warm() -> Optional[float]:
+    """
+    日K线已覆盖最近一个已收盘的交易日时返回数据年龄（秒），否则返回 None
+
+    按交易日而不是按今天判断：周五的数据在周末仍算新，节假日后重启时缺的交易日照样补齐
+    """
+    target = trading_calendar.last_closed_trading_day()
+    latest = get_latest_value(*INITIAL_JOBS['daily_kline'][2])
+    if latest and date_to_int(latest) >= date_to_int(target):
+        return get_data_age(*INITIAL_JOBS['daily_kline'][2])
+    # 收盘更新时间之后成功运行过（如停牌日无新K线）也算已同步
+    closed_at = CHINA_TZ.localize(datetime.combine(target, datetime.min.time()).replace(
+        hour=CONFIG['daily_update_hour'], minute=CONFIG['daily_update_minute']))
+    since_close = (datetime.now(CHINA_TZ) - closed_at).total_seconds()
+    age = job_ledger.last_success_age('daily_kline')
+    return age if age is not None and age <= since_close else None
+
+
+def _is_warm(name: str) -> Optional[float]:
+    """数据足够新时返回其年龄（秒），否则返回 None"""
+    if name == 'daily_kline':
+        return _daily_kline_warm()
+    max_age = CONFIG['warm_start_max_age'].get(name)
+    if max_age is None:
+        return None
+    # 取数据年龄与台账中最近一次成功的较小者（新闻等数据集可能长时间没有新内容）
+    ages = [age for age in (get_data_age(*INITIAL_JOBS[name][2]), job_ledger.last_success_age(name))
+            if age is not None]
+    age = min(ages) if ages else None
+    return age if age is not None and age <= max_age else None
+
+
+def _timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def run_initial_collection():
+    """
+    启动时执行一次初始采集
+
+    按依赖图并发执行，数据仍在新鲜期内的数据集直接跳过（部署重启时只需几秒）
+    """
+    print("=" * 50)
+    print("执行初始数据采集...")
+    print("=" * 50)
 
-    # 资金流向
-    job_fund_flow()
+    started = time.perf_counter()
+    pending = dict(INITIAL_JOBS)
+    finished = set()
+    timings = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=CONFIG['startup_workers'], thread_name_prefix='startup') as pool:
+        while pending or running:
+            ready = [name for name, (_, deps, _) in pending.items() if all(d in finished for d in deps)]
+            for name in ready:
+                func = pending.pop(name)[0]
+                age = _is_warm(name)
+                if age is not None:
+                    print(f"[{datetime.now()}] 跳过 {name}：数据 {age:.0f} 秒前已更新")
+                    timings[name] = None
+                    finished.add(name)
+                else:
+                    running[pool.submit(_timed, func)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                finished.add(name)
+                try:
+                    timings[name] = future.result()
+                except Exception as e:
+                    print(f"{name} 启动采集失败: {e}")
+                    timings[name] = None
 
     print("=" * 50)
-    print("初始数据采集完成")
+    print("初始数据采集完成，各任务耗时:")
+    for name in INITIAL_JOBS:
+        elapsed = timings.get(name)
+        print(f"  - {name}: {'跳过' if elapsed is None else f'{elapsed:.1f}s'}")
+    print(f"  总耗时: {time.perf_counter() - started:.1f}s")
     print("=" * 50)
 
 
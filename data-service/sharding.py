@@ -0,0 +1,164 @@
+"""
+多进程分片采集
+全市场股票按哈希固定分到 CONFIG['sharding']['shards'] 个分片，各采集进程（同机或共享数据库的多台机器）
+通过 shard_leases 表的租约认领分片，并定期心跳续期；进程失联后租约过期，由存活进程自动接管。
+
+分片数固定，进程增减只移动分片归属，股票与分片的对应关系不变（一致性哈希），
+逐只抓取的任务（资金流向、个股新闻、日K线）只处理本进程持有分片内的股票；
+全市场任务（实时行情快照、指数、政策新闻等）由持有 'global' 租约的进程执行。
+未启用分片（单进程模式）时所有过滤都不生效。
+
+注意：租约过期时间使用各机器的系统时间，多机部署时需要开启时间同步
+"""
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from hashlib import blake2b
+from typing import List, Optional, Set
+
+from config import CONFIG
+from database import (
+    heartbeat_worker, remove_worker, ensure_shards,
+    renew_leases, claim_lease, release_lease,
+)
+
+
+# 全市场任务的租约名
+GLOBAL = 'global'
+
+
+def shard_of(symbol: str, shards: int) -> str:
+    """股票所属分片（与进程数无关，稳定不变）"""
+    digest = blake2b(symbol.encode('utf-8'), digest_size=8).digest()
+    return str(int.from_bytes(digest, 'big') % shards)
+
+
+class ShardManager:
+    """本进程的分片租约：认领、续期、再平衡"""
+
+    def __init__(self, worker_id: str, shards: int, lease_ttl: float, heartbeat_interval: float):
+        self.worker_id = worker_id
+        self.shards = shards
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._owned: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 每个进程从不同位置开始认领，减少并发认领同一分片的冲突
+        offset = int(shard_of(worker_id, shards))
+        self._claim_order = [str((offset + i) % shards) for i in range(shards)]
+
+    def rebalance(self):
+        """心跳续期，并按存活进程数调整持有的分片"""
+        now = time.time()
+        expires_at = now + self.lease_ttl
+        workers = heartbeat_worker(self.worker_id, now, self.lease_ttl)
+        held = set(renew_leases(self.worker_id, expires_at))
+
+        # 每个进程最多持有 ceil(分片数 / 存活进程数) 个分片，多出的释放给新加入的进程
+        fair_share = math.ceil(self.shards / max(1, len(workers)))
+        mine = sorted(held - {GLOBAL}, key=int)
+        for shard in mine[fair_share:]:
+            release_lease(shard, self.worker_id)
+        mine = set(mine[:fair_share])
+
+        # 认领无主或已过期（进程失联）的分片
+        for shard in self._claim_order:
+            if len(mine) >= fair_share:
+                break
+            if shard not in mine and claim_lease(shard, self.worker_id, now, expires_at):
+                mine.add(shard)
+
+        if GLOBAL in held or claim_lease(GLOBAL, self.worker_id, now, expires_at):
+            mine.add(GLOBAL)
+
+        with self._lock:
+            changed = mine != self._owned
+            self._owned = mine
+        if changed:
+            shards = sorted(mine - {GLOBAL}, key=int)
+            role = '，负责全市场任务' if GLOBAL in mine else ''
+            print(f"[{datetime.now()}] [{self.worker_id}] 存活进程 {len(workers)} 个，"
+                  f"持有分片 {shards}{role}")
+
+    def owned(self) -> Set[str]:
+        with self._lock:
+            return set(self._owned)
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                print(f"[{datetime.now()}] 分片租约续期失败: {e}")
+
+    def start(self):
+        ensure_shards([str(i) for i in range(self.shards)] + [GLOBAL])
+        self.rebalance()
+        self._thread = threading.Thread(target=self._run, name='shard-leases', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止续期并释放全部租约，其他进程下一次心跳即可接管"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        remove_worker(self.worker_id)
+        with self._lock:
+            self._owned = set()
+
+
+# 分片模式下本进程的租约管理器（单进程模式为 None）
+_manager: Optional[ShardManager] = None
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def start(worker_id: Optional[str] = None) -> ShardManager:
+    """启用分片模式：认领初始分片并启动心跳线程"""
+    global _manager
+    settings = CONFIG['sharding']
+    _manager = ShardManager(
+        worker_id or default_worker_id(),
+        settings['shards'],
+        settings['lease_ttl'],
+        settings['heartbeat_interval'],
+    )
+    _manager.start()
+    return _manager
+
+
+def stop():
+    """退出分片模式并释放租约"""
+    global _manager
+    if _manager is not None:
+        _manager.stop()
+        _manager = None
+
+
+def filter_symbols(symbols: List[str]) -> List[str]:
+    """只保留本进程负责的股票（单进程模式原样返回）"""
+    if _manager is None:
+        return symbols
+    owned = _manager.owned()
+    return [s for s in symbols if shard_of(s, _manager.shards) in owned]
+
+
+def budget_share() -> float:
+    """本进程应分摊的上游请求预算比例（持有分片数 / 分片总数；单进程模式为 1）"""
+    if _manager is None:
+        return 1.0
+    owned = len(_manager.owned() - {GLOBAL})
+    return max(owned, 1) / _manager.shards
+
+
+def is_global_owner() -> bool:
+    """本进程是否负责全市场任务（单进程模式总是负责）"""
+    return _manager is None or GLOBAL in _manager.owned()
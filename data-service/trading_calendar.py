@@ -0,0 +1,160 @@
+"""
+交易日历
+缓存沪深交易所开市日（AkShare tool_trade_date_hist_sina），提供 O(1) 的交易日判断
+和下一交易时段计算，供调度器在节假日、午休和收盘后暂停实时任务
+"""
+import bisect
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+import pytz
+
+from config import CONFIG
+from database import bulk_upsert, get_trade_calendar
+from collectors import upstream
+
+
+# 中国时区
+CHINA_TZ = pytz.timezone('Asia/Shanghai')
+
+# 内存中的交易日：集合用于 O(1) 判断，有序列表用于查找下一交易日
+_days: set = set()
+_sorted_days: List[date] = []
+_lock = threading.Lock()
+_loaded = False
+_last_refresh: Optional[date] = None
+
+
+def _set_days(days: List[date]):
+    global _days, _sorted_days
+    _sorted_days = sorted(set(days))
+    _days = set(_sorted_days)
+
+
+def refresh_calendar() -> int:
+    """从上游下载交易日历并写入数据库，返回交易日数量；失败时保留原有缓存"""
+    global _last_refresh
+    _last_refresh = datetime.now(CHINA_TZ).date()
+    try:
+        df = upstream.call('tool_trade_date_hist_sina')
+        days = [d if isinstance(d, date) else datetime.strptime(str(d)[:10], '%Y-%m-%d').date()
+                for d in df['trade_date']]
+    except Exception as e:
+        print(f"获取交易日历失败: {e}")
+        return len(_days)
+
+    bulk_upsert('trade_calendar', [{'trade_date': d.isoformat()} for d in days])
+    with _lock:
+        _set_days(days)
+    print(f"交易日历已更新: {len(days)} 个交易日，最晚至 {_sorted_days[-1] if _sorted_days else '-'}")
+    return len(days)
+
+
+def _ensure_loaded(day: date):
+    """首次使用时从数据库加载；查询日期超出已知范围时每天最多向上游刷新一次"""
+    global _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                _set_days([date.fromisoformat(d[:10]) for d in get_trade_calendar()])
+                _loaded = True
+    if (not _sorted_days or day > _sorted_days[-1]) and _last_refresh != datetime.now(CHINA_TZ).date():
+        refresh_calendar()
+
+
+def _covered(day: date) -> bool:
+    return bool(_sorted_days) and _sorted_days[0] <= day <= _sorted_days[-1]
+
+
+def is_trading_day(day: Optional[date] = None) -> bool:
+    """判断是否为交易日；日历未覆盖的日期退化为工作日判断"""
+    day = day or datetime.now(CHINA_TZ).date()
+    _ensure_loaded(day)
+    if _covered(day):
+        return day in _days
+    return day.weekday() < 5
+
+
+def next_trading_day(day: Optional[date] = None) -> date:
+    """严格晚于 day 的下一个交易日"""
+    day = day or datetime.now(CHINA_TZ).date()
+    _ensure_loaded(day)
+    index = bisect.bisect_right(_sorted_days, day)
+    if index < len(_sorted_days):
+        return _sorted_days[index]
+    # 超出日历范围：按工作日推算
+    day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def previous_trading_day(day: Optional[date] = None) -> date:
+    """严格早于 day 的上一个交易日"""
+    day = day or datetime.now(CHINA_TZ).date()
+    _ensure_loaded(day)
+    index = bisect.bisect_left(_sorted_days, day)
+    if _covered(day) and index > 0:
+        return _sorted_days[index - 1]
+    # 超出日历范围：按工作日推算
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def last_closed_trading_day(now: Optional[datetime] = None) -> date:
+    """日K线应已可取到的最新交易日：今天是交易日且已过日线更新时间则为今天，否则为上一个交易日"""
+    now = now or datetime.now(CHINA_TZ)
+    day = now.date()
+    if is_trading_day(day) and now.time() >= time(CONFIG['daily_update_hour'], CONFIG['daily_update_minute']):
+        return day
+    return previous_trading_day(day)
+
+
+def trading_days_between(start: date, end: date) -> List[date]:
+    """[start, end] 区间内的全部交易日"""
+    days = []
+    day = start if is_trading_day(start) else next_trading_day(start)
+    while day <= end:
+        days.append(day)
+        day = next_trading_day(day)
+    return days
+
+
+def _parse(hhmm: str) -> time:
+    return time(*map(int, hhmm.split(':')))
+
+
+def session_windows(day: date) -> List[Tuple[datetime, datetime]]:
+    """某日的连续竞价时段（上午、下午），带时区"""
+    hours = CONFIG['trading_hours']
+    windows = [
+        (hours['morning_start'], hours['morning_end']),
+        (hours['afternoon_start'], hours['afternoon_end']),
+    ]
+    return [
+        (CHINA_TZ.localize(datetime.combine(day, _parse(start))),
+         CHINA_TZ.localize(datetime.combine(day, _parse(end))))
+        for start, end in windows
+    ]
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    """判断当前是否在交易时段内（含节假日判断）"""
+    now = now or datetime.now(CHINA_TZ)
+    if not is_trading_day(now.date()):
+        return False
+    return any(start <= now <= end for start, end in session_windows(now.date()))
+
+
+def next_session_start(now: Optional[datetime] = None) -> datetime:
+    """下一个交易时段的开始时间（当前已在时段内则返回 now）"""
+    now = now or datetime.now(CHINA_TZ)
+    day = now.date()
+    if is_trading_day(day):
+        for start, end in session_windows(day):
+            if now <= end:
+                return max(start, now)
+    return session_windows(next_trading_day(day))[0][0]
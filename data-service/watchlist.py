@@ -0,0 +1,81 @@
+"""
+动态股票池
+采集的股票 = 全部用户持仓与自选的并集（按用户数引用计数）+ CONFIG['default_stocks']。
+启动时全量加载一次，之后只按 id 增量读取 portfolio_symbol_changes，
+用户增删股票无需重启 run.py 即可生效，每个周期取股票列表几乎没有开销。
+变更日志由持有 global 租约的进程按保留期清理（scheduler.job_prune_portfolio_changes），
+本进程尚未读取的变更已被清理时全量重新加载
+"""
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from config import CONFIG
+from database import get_portfolio_symbol_counts, get_portfolio_symbol_changes
+
+
+# 只采集 A 股（6 位数字代码）
+_A_SHARE = re.compile(r'^\d{6}$')
+
+
+class Watchlist:
+    """按引用计数维护的内存股票池"""
+
+    def __init__(self, base_symbols: Optional[List[str]] = None):
+        self.base_symbols = list(base_symbols or [])
+        self._refs: Counter = Counter()
+        self._last_change_id: Optional[int] = None
+        self._symbols: List[str] = []
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """应用新的变更，返回股票池是否有变化"""
+        with self._lock:
+            changes = None
+            if self._last_change_id is not None:
+                changes = get_portfolio_symbol_changes(self._last_change_id)
+            if changes is None:
+                refs, self._last_change_id = get_portfolio_symbol_counts()
+                self._refs = Counter(refs)
+                self._rebuild()
+                return True
+            if not changes:
+                return False
+
+            before = set(self._refs)
+            for change in changes:
+                self._refs[change['symbol']] += change['delta']
+                if self._refs[change['symbol']] <= 0:
+                    del self._refs[change['symbol']]
+            self._last_change_id = changes[-1]['id']
+
+            added, removed = set(self._refs) - before, before - set(self._refs)
+            if not added and not removed:
+                return False
+            self._rebuild()
+            print(f"[{datetime.now()}] 股票池更新: +{sorted(added)} -{sorted(removed)}，共 {len(self._symbols)} 只")
+            return True
+
+    def _rebuild(self):
+        merged = set(self.base_symbols) | {s for s in self._refs if _A_SHARE.match(s)}
+        self._symbols = sorted(merged)
+
+    def symbols(self) -> List[str]:
+        """当前股票池（先应用增量变更）"""
+        self.refresh()
+        return list(self._symbols)
+
+    def refcount(self, symbol: str) -> int:
+        """持有或自选该股票的用户数"""
+        return self._refs.get(symbol, 0)
+
+
+# 进程内共享的股票池
+watchlist = Watchlist(CONFIG['default_stocks'])
+
+
+def get_symbols() -> List[str]:
+    """各采集任务使用的股票列表"""
+    return watchlist.symbols()
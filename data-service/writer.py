@@ -0,0 +1,259 @@
+"""
+单写线程
+所有采集器的写入经队列汇集到一个线程，按行数或时间阈值合并为组提交，
+避免多个定时任务并发提交导致 database is locked
+"""
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import database
+from config import CONFIG
+import metrics
+
+
+# 队列控制消息
+_STOP = object()
+
+
+class _Batch:
+    """一次提交请求：一张或多张表的记录，整体写入；on_commit / on_drop 在落盘或丢弃后回调"""
+
+    def __init__(self, items: List[tuple], on_commit=None, on_drop=None):
+        self.items = items
+        self.on_commit = on_commit
+        self.on_drop = on_drop
+        self.job = metrics.current_job() or 'manual'  # 提交时所在的任务（写线程中无任务上下文）
+
+    def record_written(self):
+        """落盘后按任务、表计入写入行数"""
+        for table, data in self.items:
+            metrics.ROWS_WRITTEN.inc(len(data), job=self.job, table=table)
+
+    @property
+    def rows(self) -> int:
+        return sum(len(data) for _, data in self.items)
+
+
+class _Flush:
+    """刷新请求：写线程处理到该位置时置位事件"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class DBWriter:
+    """单写线程，队列满时阻塞生产者"""
+
+    def __init__(
+        self,
+        max_queue: Optional[int] = None,
+        batch_rows: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ):
+        settings = CONFIG['writer']
+        self.batch_rows = batch_rows or settings['batch_rows']
+        self.flush_interval = flush_interval or settings['flush_interval']
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue or settings['max_queue'])
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 生产者接口 ----------
+
+    def submit(self, table: str, data: List[Dict[str, Any]], timeout: Optional[float] = None):
+        """提交一批待写记录；队列满时阻塞，超时抛出 queue.Full"""
+        self.submit_group([(table, data)], timeout=timeout)
+
+    def submit_group(self, items: List[tuple], on_commit=None, on_drop=None, timeout: Optional[float] = None):
+        """提交需要在同一事务内写入的多表记录 [(表名, 记录), ...]"""
+        if timeout is None:
+            timeout = CONFIG['writer']['put_timeout']
+        self._queue.put(_Batch(items, on_commit, on_drop), timeout=timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待此前提交的记录全部落盘，返回是否完成
+
+        写线程已退出或在 timeout 内未完成时返回 False（写线程已退出时报告并丢弃积压的批次）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        request = _Flush()
+        try:
+            self._queue.put(request, timeout=CONFIG['writer']['put_timeout'] if timeout is None else timeout)
+        except queue.Full:
+            print(f"[{datetime.now()}] 写入队列已满，刷新请求未能入队（积压 {self.qsize()} 批）")
+            return False
+
+        while not request.done.wait(0.5):
+            if not self.is_alive():
+                self._drop_pending('刷新')
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def qsize(self) -> int:
+        """当前积压的批次数"""
+        return self._queue.qsize()
+
+    def is_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _drop_pending(self, action: str):
+        """写线程已退出：清空队列并报告未落盘的批次"""
+        batches = rows = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _Flush):
+                item.done.set()
+            elif isinstance(item, _Batch):
+                batches += 1
+                rows += item.rows
+                if item.on_drop is not None:
+                    item.on_drop()
+        if batches:
+            print(f"[{datetime.now()}] {action}时写线程已退出，丢弃 {batches} 批 {rows} 行未落盘数据")
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+        database.set_writer(self)
+
+    def stop(self, timeout: float = 30.0):
+        """停止接收新写入，落盘队列中剩余批次后退出"""
+        database.set_writer(None)
+        if self._thread is None:
+            return
+        if not self._thread.is_alive():
+            self._drop_pending('停止')
+            self._thread = None
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print(f"[{datetime.now()}] 写入队列已满，停止消息未能入队")
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[{datetime.now()}] 写线程未在 {timeout}s 内退出，剩余 {self.qsize()} 批未落盘")
+        self._thread = None
+
+    # ---------- 写线程 ----------
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            batch, waiters = [], []
+            stopping = self._take(first, batch, waiters)
+
+            # 凑批：行数或时间达到阈值即提交
+            rows = sum(pending.rows for pending in batch)
+            deadline = time.monotonic() + self.flush_interval
+            while not stopping and not waiters and rows < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                stopping = self._take(item, batch, waiters)
+                rows = sum(pending.rows for pending in batch)
+
+            if batch:
+                self._commit(batch)
+            for request in waiters:
+                request.done.set()
+
+        # 退出前处理停止消息之后仍在队列中的批次
+        leftover, waiters = [], []
+        while True:
+            try:
+                self._take(self._queue.get_nowait(), leftover, waiters)
+            except queue.Empty:
+                break
+        if leftover:
+            self._commit(leftover)
+        for request in waiters:
+            request.done.set()
+
+    def _take(self, item, batch: list, waiters: list) -> bool:
+        """把队列项归入当前批次，返回是否收到停止消息"""
+        if item is _STOP:
+            return True
+        if isinstance(item, _Flush):
+            waiters.append(item)
+        else:
+            batch.append(item)
+        return False
+
+    def _commit(self, batch: List[_Batch]):
+        """按表合并后在一个事务内提交；失败时逐批重试以隔离坏数据（同一批的各表始终在同一事务内）"""
+        merged: Dict[str, List[Dict[str, Any]]] = {}
+        for item in batch:
+            for table, data in item.items:
+                merged.setdefault(table, []).extend(data)
+        rows = sum(len(data) for data in merged.values())
+
+        started = time.perf_counter()
+        try:
+            with database.get_db() as conn:
+                for item in batch:
+                    database.after_transaction(item.on_commit)
+                for table, data in merged.items():
+                    database.execute_bulk(conn, table, data)
+        except Exception as e:
+            print(f"[writer] 组提交失败，逐批重试: {e}")
+            for item in batch:
+                try:
+                    with database.get_db() as conn:
+                        database.after_transaction(item.on_commit, item.on_drop)
+                        for table, data in item.items:
+                            database.execute_bulk(conn, table, data)
+                    item.record_written()
+                except Exception as item_error:
+                    tables = ', '.join(table for table, _ in item.items)
+                    print(f"[writer] {tables} 写入失败，丢弃 {item.rows} 行: {item_error}")
+            return
+
+        elapsed = time.perf_counter() - started
+        metrics.DB_WRITE_LATENCY.observe(elapsed, mode='group')
+        for item in batch:
+            item.record_written()
+        rate = rows / elapsed if elapsed > 0 else float('inf')
+        tables = ', '.join(f"{table}={len(data)}" for table, data in merged.items())
+        print(f"[writer] 组提交 {len(batch)} 批 {rows} 行 ({tables}), "
+              f"耗时 {elapsed:.3f}s ({rate:.0f} 行/秒)")
+
+
+_instance: Optional[DBWriter] = None
+
+
+def start_writer() -> DBWriter:
+    """启动全局单写线程"""
+    global _instance
+    if _instance is None:
+        _instance = DBWriter()
+        _instance.start()
+    return _instance
+
+
+def stop_writer(timeout: float = 30.0):
+    """落盘剩余写入并停止全局单写线程"""
+    global _instance
+    if _instance is not None:
+        _instance.stop(timeout)
+        _instance = None
+
+
+def get_writer() -> Optional[DBWriter]:
+    return _instance
@@ -5,8 +5,10 @@
 
 import path from 'path';
 
-// 数据库路径
+// 数据库路径（冷库：历史、新闻等）
 const DB_PATH = path.join(process.cwd(), 'data', 'investbuddy.db');
+// 热库路径（实时行情、当日资金流向），见 data-service/database.py
+const HOT_DB_PATH = path.join(process.cwd(), 'data', 'investbuddy_hot.db');
 
 // 动态加载 better-sqlite3（可能在某些环境不可用）
 let DatabaseConstructor: any = null;
@@ -18,6 +20,9 @@ try {
 }
 
 let db: any = null;
+let hotDb: any = null;
+let hotAttached = false;
+let writeDb: any = null;
 
 /**
  * 获取数据库连接
@@ -32,17 +37,162 @@ export function getDatabase(): any | null {
       console.error('Failed to connect to database:', error);
       return null;
     }
+    try {
+      // 挂载热库，资金流向等冷热分库的表合并查询
+      db.prepare('ATTACH DATABASE ? AS hot').run(HOT_DB_PATH);
+      hotAttached = true;
+    } catch {
+      hotAttached = false;
+    }
   }
   return db;
 }
 
+/**
+ * 获取热库连接（行情路由只打开小巧的热库文件，不触及历史数据的页缓存）
+ */
+export function getHotDatabase(): any | null {
+  if (!DatabaseConstructor) return null;
+  if (!hotDb) {
+    try {
+      // 只读连接不设置 journal_mode：WAL 模式持久保存在文件中，由数据采集服务设置
+      hotDb = new DatabaseConstructor(HOT_DB_PATH, { readonly: true, fileMustExist: true });
+    } catch (error) {
+      console.error('Failed to connect to hot database:', error);
+      return null;
+    }
+  }
+  return hotDb;
+}
+
+/**
+ * 获取可写连接（仅用于记录读取热度）
+ */
+function getWriteDatabase(): any | null {
+  if (!DatabaseConstructor) return null;
+  if (!writeDb) {
+    try {
+      writeDb = new DatabaseConstructor(DB_PATH, { fileMustExist: true, timeout: 100 });
+    } catch {
+      return null;
+    }
+  }
+  return writeDb;
+}
+
+// 读取热度先在内存中累加，每 READ_FLUSH_MS 合并写入一次，避免每次查询都写冷库
+const READ_FLUSH_MS = 10_000;
+// 写入失败时保留待写计数的股票数上限
+const MAX_PENDING_READS = 2000;
+let pendingReads = new Map<string, number>();
+let readFlushTimer: ReturnType<typeof setTimeout> | null = null;
+
+/**
+ * 把累积的读取次数合并写入 symbol_reads（一个事务）。
+ * 失败（如数据库繁忙）时计数留到下次再写
+ */
+function flushSymbolReads(): void {
+  readFlushTimer = null;
+  if (pendingReads.size === 0) return;
+  const batch = pendingReads;
+  pendingReads = new Map();
+  const wdb = getWriteDatabase();
+  if (!wdb) return;
+  try {
+    const upsert = wdb.prepare(
+      `INSERT INTO symbol_reads (symbol, reads, last_read_at) VALUES (?, ?, datetime('now'))
+       ON CONFLICT(symbol) DO UPDATE SET reads = reads + excluded.reads, last_read_at = excluded.last_read_at`
+    );
+    wdb.transaction(() => {
+      for (const [symbol, reads] of batch) upsert.run(symbol, reads);
+    })();
+  } catch {
+    for (const [symbol, reads] of batch) {
+      if (pendingReads.size >= MAX_PENDING_READS && !pendingReads.has(symbol)) break;
+      pendingReads.set(symbol, (pendingReads.get(symbol) || 0) + reads);
+    }
+    scheduleReadFlush();
+  }
+}
+
+function scheduleReadFlush(): void {
+  if (readFlushTimer) return;
+  readFlushTimer = setTimeout(flushSymbolReads, READ_FLUSH_MS);
+  readFlushTimer.unref?.();
+}
+
+/**
+ * 记录一次个股读取，数据采集服务据此提高热门股票的刷新频率。
+ * 尽力而为：只在内存中计数，定时批量写入，不影响查询
+ */
+export function recordSymbolRead(symbol: string): void {
+  if (!DatabaseConstructor) return;
+  if (pendingReads.size >= MAX_PENDING_READS && !pendingReads.has(symbol)) return;
+  pendingReads.set(symbol, (pendingReads.get(symbol) || 0) + 1);
+  scheduleReadFlush();
+}
+
+/**
+ * 用一个用户当前的持仓/自选整体替换其在 portfolio_symbols 中的登记。
+ * 增删的股票由触发器写入 portfolio_symbol_changes，数据采集服务据此增量更新股票池。
+ * 返回是否写入成功（数据库繁忙时等待至多 2 秒）
+ */
+export function syncPortfolioSymbols(
+  userId: string,
+  items: { symbol: string; status: string }[]
+): boolean {
+  const wdb = getWriteDatabase();
+  if (!wdb) return false;
+  wdb.pragma('busy_timeout = 2000');
+  try {
+    wdb.transaction(() => {
+      const existing: string[] = wdb
+        .prepare('SELECT symbol FROM portfolio_symbols WHERE user_id = ?')
+        .pluck()
+        .all(userId);
+      const wanted = new Set(items.map((item) => item.symbol));
+      const remove = wdb.prepare('DELETE FROM portfolio_symbols WHERE user_id = ? AND symbol = ?');
+      for (const symbol of existing) {
+        if (!wanted.has(symbol)) remove.run(userId, symbol);
+      }
+      const upsert = wdb.prepare(
+        `INSERT INTO portfolio_symbols (user_id, symbol, status, updated_at) VALUES (?, ?, ?, datetime('now'))
+         ON CONFLICT(user_id, symbol) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+         WHERE status != excluded.status`
+      );
+      for (const item of items) {
+        upsert.run(userId, item.symbol, item.status);
+      }
+    })();
+    return true;
+  } catch (error) {
+    console.error('Failed to sync portfolio symbols:', error);
+    return false;
+  } finally {
+    wdb.pragma('busy_timeout = 100');
+  }
+}
+
 /**
  * 关闭数据库连接
  */
 export function closeDatabase(): void {
+  if (readFlushTimer) {
+    clearTimeout(readFlushTimer);
+  }
+  flushSymbolReads();
   if (db) {
     db.close();
     db = null;
+    hotAttached = false;
+  }
+  if (hotDb) {
+    hotDb.close();
+    hotDb = null;
+  }
+  if (writeDb) {
+    writeDb.close();
+    writeDb = null;
   }
 }
 
@@ -121,13 +271,31 @@ export interface MarginTrading {
   margin_short_balance: number | null;
 }
 
+export interface TableHeartbeat {
+  table_name: string;
+  rows_seen: number | null;
+  rows_written: number | null;
+  last_seen_at: string;
+}
+
+export interface IntradayBar {
+  time: string;
+  open: number | null;
+  high: number | null;
+  low: number | null;
+  close: number | null;
+  volume: number | null;
+  amount: number | null;
+}
+
 // ==================== 查询函数 ====================
 
 export function getStockRealtime(symbol?: string): StockRealtime[] {
-  const db = getDatabase();
+  const db = getHotDatabase();
   if (!db) return [];
   try {
     if (symbol) {
+      recordSymbolRead(symbol);
       return db.prepare('SELECT * FROM stock_realtime WHERE symbol = ?').all(symbol) as StockRealtime[];
     } else {
       return db.prepare('SELECT * FROM stock_realtime ORDER BY symbol').all() as StockRealtime[];
@@ -139,7 +307,7 @@ export function getStockRealtime(symbol?: string): StockRealtime[] {
 }
 
 export function getIndexRealtime(symbol?: string): IndexRealtime[] {
-  const db = getDatabase();
+  const db = getHotDatabase();
   if (!db) return [];
   try {
     if (symbol) {
@@ -158,6 +326,7 @@ export function getStockNews(symbol?: string, limit: number = 20): StockNews[] {
   if (!db) return [];
   try {
     if (symbol) {
+      recordSymbolRead(symbol);
       return db.prepare('SELECT * FROM stock_news WHERE symbol = ? ORDER BY publish_time DESC LIMIT ?').all(symbol, limit) as StockNews[];
     } else {
       return db.prepare('SELECT * FROM stock_news ORDER BY publish_time DESC LIMIT ?').all(limit) as StockNews[];
@@ -179,11 +348,37 @@ export function getPolicyNews(limit: number = 20): StockNews[] {
   }
 }
 
+// 行情聚簇表以 YYYYMMDD 整数存储交易日、Unix 秒存储更新时间，查询时还原为文本
+const TRADE_DATE_SQL = "printf('%04d-%02d-%02d', trade_date / 10000, trade_date / 100 % 100, trade_date % 100) AS trade_date";
+const UPDATED_AT_SQL = "datetime(updated_at, 'unixepoch', 'localtime') AS updated_at";
+
+const STOCK_DAILY_COLUMNS = `symbol, ${TRADE_DATE_SQL}, open, high, low, close, volume, amount,
+  amplitude, change_pct, change_amount, turnover_rate`;
+
+const FUND_FLOW_COLUMNS = `symbol, name, ${TRADE_DATE_SQL}, close_price, change_pct,
+  main_net_inflow, main_net_inflow_pct, super_large_net_inflow, super_large_net_inflow_pct,
+  large_net_inflow, large_net_inflow_pct, medium_net_inflow, medium_net_inflow_pct,
+  small_net_inflow, small_net_inflow_pct, ${UPDATED_AT_SQL}`;
+
+const MARGIN_TRADING_COLUMNS = `symbol, name, ${TRADE_DATE_SQL}, margin_balance, margin_buy, margin_repay,
+  margin_net_buy, short_balance, short_sell_volume, short_repay_volume, short_net_volume,
+  margin_short_balance, ${UPDATED_AT_SQL}`;
+
+// 资金流向：已收盘的交易日在冷库，当日在热库；同一交易日两边都有时以冷库为准
+const FUND_FLOW_SPLIT_SOURCE = `(
+  SELECT * FROM main.fund_flow
+  UNION ALL
+  SELECT * FROM hot.fund_flow AS h
+  WHERE NOT EXISTS (SELECT 1 FROM main.fund_flow AS c WHERE c.symbol = h.symbol AND c.trade_date = h.trade_date)
+) AS fund_flow`;
+
 export function getFundFlow(symbol: string, limit: number = 10): FundFlow[] {
   const db = getDatabase();
   if (!db) return [];
   try {
-    return db.prepare('SELECT * FROM fund_flow WHERE symbol = ? ORDER BY trade_date DESC LIMIT ?').all(symbol, limit) as FundFlow[];
+    recordSymbolRead(symbol);
+    const source = hotAttached ? FUND_FLOW_SPLIT_SOURCE : 'fund_flow';
+    return db.prepare(`SELECT ${FUND_FLOW_COLUMNS} FROM ${source} WHERE symbol = ? ORDER BY fund_flow.trade_date DESC LIMIT ?`).all(symbol, limit) as FundFlow[];
   } catch (error) {
     console.error('Query fund_flow failed:', error);
     return [];
@@ -194,7 +389,7 @@ export function getMarginTrading(symbol: string, limit: number = 10): MarginTrad
   const db = getDatabase();
   if (!db) return [];
   try {
-    return db.prepare('SELECT * FROM margin_trading WHERE symbol = ? ORDER BY trade_date DESC LIMIT ?').all(symbol, limit) as MarginTrading[];
+    return db.prepare(`SELECT ${MARGIN_TRADING_COLUMNS} FROM margin_trading WHERE symbol = ? ORDER BY margin_trading.trade_date DESC LIMIT ?`).all(symbol, limit) as MarginTrading[];
   } catch (error) {
     console.error('Query margin_trading failed:', error);
     return [];
@@ -205,7 +400,8 @@ export function getStockDaily(symbol: string, limit: number = 30) {
   const db = getDatabase();
   if (!db) return [];
   try {
-    return db.prepare('SELECT * FROM stock_daily WHERE symbol = ? ORDER BY trade_date DESC LIMIT ?').all(symbol, limit);
+    recordSymbolRead(symbol);
+    return db.prepare(`SELECT ${STOCK_DAILY_COLUMNS} FROM stock_daily WHERE symbol = ? ORDER BY stock_daily.trade_date DESC LIMIT ?`).all(symbol, limit);
   } catch (error) {
     console.error('Query stock_daily failed:', error);
     return [];
@@ -227,6 +423,53 @@ export function getEarningsCalendar(symbol?: string) {
   }
 }
 
+/**
+ * 采集心跳：行情表只在内容变化时更新 updated_at，数据新鲜度以此为准
+ */
+export function getTableHeartbeat(table: string): TableHeartbeat | null {
+  const db = getDatabase();
+  if (!db) return null;
+  try {
+    return (db.prepare('SELECT * FROM table_heartbeat WHERE table_name = ?').get(table) as TableHeartbeat) ?? null;
+  } catch (error) {
+    console.error('Query table_heartbeat failed:', error);
+    return null;
+  }
+}
+
+/**
+ * 分时 K 线（由采集服务把行情快照压缩而来，无需再请求上游）
+ * period: 60 = 1 分钟，300 = 5 分钟；tradeDate 为 YYYY-MM-DD，默认取最近一个有数据的交易日
+ */
+export function getIntradayBars(
+  symbol: string,
+  period: 60 | 300 = 60,
+  tradeDate?: string,
+  kind: 'stock' | 'index' = 'stock'
+): IntradayBar[] {
+  const db = getDatabase();
+  if (!db) return [];
+  try {
+    const row = db.prepare('SELECT id FROM symbol_ids WHERE kind = ? AND symbol = ?').get(kind, symbol) as
+      | { id: number }
+      | undefined;
+    if (!row) return [];
+    const day = tradeDate
+      ? Number(tradeDate.replace(/-/g, ''))
+      : (db.prepare('SELECT MAX(trade_date) AS day FROM quote_bars WHERE period = ? AND symbol_id = ?')
+          .get(period, row.id) as { day: number | null }).day;
+    if (!day) return [];
+    return db.prepare(`
+      SELECT datetime(bar_ts, 'unixepoch', '+8 hours') AS time, open, high, low, close, volume, amount
+      FROM quote_bars WHERE period = ? AND symbol_id = ? AND trade_date = ?
+      ORDER BY bar_ts
+    `).all(period, row.id, day) as IntradayBar[];
+  } catch (error) {
+    console.error('Query quote_bars failed:', error);
+    return [];
+  }
+}
+
 export function isDatabaseAvailable(): boolean {
   try {
     const db = getDatabase();
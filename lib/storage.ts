@@ -6,6 +6,8 @@ const STORAGE_KEYS = {
   CHAT_MESSAGES: 'bantou_chat_messages',
   REVIEW_DRAFT: 'bantou_reviewDraft',
   GURU_CHATS: 'bantou_guru_chats',
+  CLIENT_ID: 'bantou_client_id',
+  PORTFOLIO_SYNC: 'bantou_portfolio_sync',
 };
 
 export const storage = {
@@ -18,6 +20,38 @@ export const storage = {
   saveUserConfig(config: UserConfig): void {
     if (typeof window === 'undefined') return;
     localStorage.setItem(STORAGE_KEYS.USER_CONFIG, JSON.stringify(config));
+    this.syncPortfolio(config.portfolio || []);
+  },
+
+  // 本机用户标识（股票池同步时区分不同用户）
+  getClientId(): string {
+    let id = localStorage.getItem(STORAGE_KEYS.CLIENT_ID);
+    if (!id) {
+      id = typeof crypto !== 'undefined' && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+      localStorage.setItem(STORAGE_KEYS.CLIENT_ID, id);
+    }
+    return id;
+  },
+
+  // 持仓/自选变化时同步到数据采集服务的股票池（尽力而为，失败时下次保存再试）
+  syncPortfolio(portfolio: PortfolioItem[]): void {
+    if (typeof window === 'undefined') return;
+    const items = portfolio
+      .map((item) => ({ symbol: item.symbol, status: item.config?.status || 'watching' }))
+      .sort((a, b) => a.symbol.localeCompare(b.symbol));
+    const signature = JSON.stringify(items);
+    if (localStorage.getItem(STORAGE_KEYS.PORTFOLIO_SYNC) === signature) return;
+    fetch('/api/portfolio/sync', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ userId: this.getClientId(), items }),
+    })
+      .then((res) => {
+        if (res.ok) localStorage.setItem(STORAGE_KEYS.PORTFOLIO_SYNC, signature);
+      })
+      .catch(() => {});
   },
 
   updatePortfolio(portfolio: PortfolioItem[], totalPrincipal: number): void {
@@ -109,6 +143,7 @@ export const storage = {
   // 清除所有数据
   clearAll(): void {
     if (typeof window === 'undefined') return;
+    this.syncPortfolio([]);
     Object.values(STORAGE_KEYS).forEach(key => {
       localStorage.removeItem(key);
     });